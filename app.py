@@ -1,6 +1,60 @@
+import io
+import math
+import queue
+import shlex
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+import weakref
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from block_system import *
+import project_io
+from build import Builder, BuildJob, render_units
+from optimizer import optimize_function
+from callgraph import CallGraph
+from checker import Checker, ERROR
+from evaluator import EvaluationError, compile_function
+from instrumentation import profiler, sparkline
+from preview import PreviewWorker, install, program_snapshots
+from history import History, CreateBlocks, DeleteBlocks, MoveBlocks, Connect, Disconnect, EditBlock, field_values
+from spatial_index import GridIndex, point_segment_distance, segment_intersects_rect
+
+
+# Drag rendering is coalesced to one update per frame (~60 fps)
+FRAME_MS = 16
+# Items are only kept for blocks and lines within the viewport plus this margin
+VIEWPORT_MARGIN = 200
+# Background grid is a tiled image repeating both the grid spacing and the 4/4 dash period
+GRID_BACKGROUND = "#f0f0f0"
+GRID_COLOR = "#d3d3d3"
+GRID_SIZE = 20
+# Block geometry in world coordinates (zoom 1.0)
+BLOCK_WIDTH = 140
+BLOCK_HEIGHT = 40
+PORT_SIZE = 10
+# Below LOD_ZOOM blocks are drawn as plain rectangles and lines without arrows
+MIN_ZOOM = 0.05
+MAX_ZOOM = 4.0
+LOD_ZOOM = 0.5
+# How often the profiler panel refreshes its table and samples the canvas
+STATS_REFRESH_MS = 500
+# The preview regenerates this long after the last edit, and checks for results this often
+PREVIEW_DELAY_MS = 150
+PREVIEW_POLL_MS = 50
+# Diameter of the problem badge in a block's top right corner
+BADGE_SIZE = 14
+
+
+def block_text(block):
+    if isinstance(block, Function):
+        return f"{block.type} {block.name}()"
+    if isinstance(block, VariableBlock):
+        if block.value is not None:
+            return f"{block.type} {block.name} = {block.value}"
+        return f"{block.type} {block.name}"
+    if isinstance(block, AssignmentBlock):
+        return f"{block.var_name} = {block.expression}"
+    if isinstance(block, ReturnBlock):
+        return f"return {block.expression}"
+    return "block"
 
 
 class EditDialog(tk.Toplevel):
@@ -63,22 +117,266 @@ class EditDialog(tk.Toplevel):
 
     def ok(self):
         if isinstance(self.block, Function):
-            self.block.type = self.type_var.get()
-            self.block.name = self.name_var.get()
+            self.block.type = intern_name(self.type_var.get())
+            self.block.name = intern_name(self.name_var.get())
         elif isinstance(self.block, VariableBlock):
-            self.block.type = self.type_var.get()
-            self.block.name = self.name_var.get()
+            self.block.type = intern_name(self.type_var.get())
+            self.block.name = intern_name(self.name_var.get())
             val = self.value_var.get().strip()
             self.block.value = val if val else None
         elif isinstance(self.block, AssignmentBlock):
-            self.block.var_name = self.var_var.get()
+            self.block.var_name = intern_name(self.var_var.get())
             self.block.expression = self.expr_var.get()
         elif isinstance(self.block, ReturnBlock):
             self.block.expression = self.expr_var.get()
+        self.block.mark_dirty()
         self.result = True
         self.destroy()
 
 
+class BuildDialog(tk.Toplevel):
+    """Окно сборки и запуска: прогресс, вывод и отмена"""
+
+    def __init__(self, parent, job):
+        super().__init__(parent)
+        self.job = job
+        self.title("Build & Run")
+        self.geometry("600x400")
+        self.transient(parent)
+
+        self.status_var = tk.StringVar(value="Building...")
+        ttk.Label(self, textvariable=self.status_var).pack(fill="x", padx=10, pady=5)
+        self.progress = ttk.Progressbar(self, mode="indeterminate")
+        self.progress.pack(fill="x", padx=10)
+        self.progress.start(10)
+        self.output = tk.Text(self, height=15, state="disabled")
+        self.output.pack(fill="both", expand=True, padx=10, pady=5)
+        self.button = ttk.Button(self, text="Cancel", command=self.cancel)
+        self.button.pack(pady=10)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.job.start()
+        self.poll()
+
+    def write(self, text):
+        self.output.configure(state="normal")
+        self.output.insert("end", text)
+        self.output.see("end")
+        self.output.configure(state="disabled")
+
+    def poll(self):
+        # The build runs on a worker thread; only this method touches widgets
+        while not self.job.events.empty():
+            stage, message = self.job.events.get_nowait()
+            if stage == "compile":
+                self.status_var.set("Compiling...")
+                self.write(f"$ {message}\n")
+            elif stage == "cached":
+                self.write(f"Using cached build {message}\n")
+            elif stage == "progress":
+                done, total = message
+                self.status_var.set(f"Compiling... {done}/{total}")
+            elif stage == "link":
+                self.status_var.set("Linking...")
+                self.write(f"$ {message}\n")
+            elif stage == "output":
+                self.write(message)
+            elif stage == "run":
+                self.status_var.set("Running...")
+                self.write(f"$ {message}\n")
+            elif stage == "finished":
+                returncode, output = message
+                self.write(output)
+                self.finish(f"Exit code {returncode}")
+            elif stage == "failed":
+                self.write(message)
+                self.finish("Build failed")
+            elif stage == "cancelled":
+                self.finish("Cancelled")
+        if not self.job.done() or not self.job.events.empty():
+            self.after(100, self.poll)
+
+    def finish(self, status):
+        self.progress.stop()
+        self.status_var.set(status)
+        self.button.configure(text="Close", command=self.destroy)
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+    def cancel(self):
+        self.job.cancel()
+        self.status_var.set("Cancelling...")
+
+
+class StatsDialog(tk.Toplevel):
+    """Панель профилирования: вызовы, задержки обработчиков и число элементов холста"""
+
+    COLUMNS = ("calls", "total ms", "mean µs", "p50 µs", "p95 µs", "max µs", "latency histogram")
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.app = parent
+        self.title("Profiler")
+        self.geometry("900x320")
+        self.transient(parent)
+
+        self.items_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.items_var).pack(fill="x", padx=10, pady=5)
+        self.table = ttk.Treeview(self, columns=self.COLUMNS, show="tree headings")
+        self.table.heading("#0", text="handler")
+        self.table.column("#0", width=220)
+        for column in self.COLUMNS:
+            self.table.heading(column, text=column)
+            self.table.column(column, width=70, anchor="e")
+        self.table.column("latency histogram", width=240, anchor="w")
+        self.table.pack(fill="both", expand=True, padx=10)
+        buttons = ttk.Frame(self)
+        buttons.pack(fill="x", padx=10, pady=10)
+        ttk.Button(buttons, text="Экспорт trace…", command=self.export_trace).pack(side="left")
+        ttk.Button(buttons, text="Сбросить", command=profiler.reset).pack(side="left", padx=4)
+        ttk.Button(buttons, text="Закрыть", command=self.close).pack(side="right")
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Recording lasts as long as the panel is open
+        profiler.enable()
+        self.job = None
+        self.refresh()
+
+    def refresh(self):
+        app = self.app
+        canvas_items = len(app.canvas.find_all())
+        profiler.sample("canvas items", canvas_items)
+        profiler.sample("realized blocks", len(app.realized_widgets))
+        profiler.sample("realized lines", len(app.edges.lines))
+        self.items_var.set(f"Canvas items: {canvas_items}   realized blocks: {len(app.realized_widgets)}"
+                           f" of {len(app.widgets_by_block)}   realized lines: {len(app.edges.lines)} of {len(app.edges)}")
+        self.table.delete(*self.table.get_children())
+        for stats in profiler.snapshot():
+            self.table.insert("", "end", text=stats.name, values=(
+                stats.calls, f"{stats.total_us / 1000:.1f}", f"{stats.mean_us:.0f}",
+                f"{stats.percentile_us(50):.0f}", f"{stats.percentile_us(95):.0f}", f"{stats.max_us:.0f}",
+                sparkline(stats.histogram)))
+        self.job = self.after(STATS_REFRESH_MS, self.refresh)
+
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".json",
+                                            filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")])
+        if path:
+            profiler.export_chrome_trace(path)
+
+    def close(self):
+        if self.job is not None:
+            self.after_cancel(self.job)
+        profiler.disable()
+        self.destroy()
+
+
+class PreviewPane(ttk.Frame):
+    """Панель живого предпросмотра кода; генерация идёт в фоновом потоке"""
+
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self.text = tk.Text(self, width=48, wrap="none", font="TkFixedFont", state="disabled")
+        vbar = ttk.Scrollbar(self, orient="vertical", command=self.text.yview)
+        hbar = ttk.Scrollbar(self, orient="horizontal", command=self.text.xview)
+        self.text.configure(yscrollcommand=vbar.set, xscrollcommand=hbar.set)
+        self.text.grid(row=0, column=0, sticky="nsew")
+        vbar.grid(row=0, column=1, sticky="ns")
+        hbar.grid(row=1, column=0, sticky="ew")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.text.tag_configure("selected_block", background="#ffff99")
+
+        self.worker = PreviewWorker()
+        # Function -> its code as currently shown, and (function, line count) in display order
+        self.rendered = {}
+        self.layout = []
+        self.refresh_job = None
+        self.highlighted = None
+        self.highlight_stale = True
+        self.bind("<Destroy>", lambda e: self.worker.close() if e.widget is self else None)
+        self.poll()
+
+    def schedule(self):
+        # Debounced: a burst of edits is generated once, after the last of them
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+        self.worker.cancel()
+        self.refresh_job = self.after(PREVIEW_DELAY_MS, self.refresh)
+
+    def refresh(self):
+        self.refresh_job = None
+        if not self.app.preview_visible.get():
+            return
+        # Exactly what is saved and built; snapshots are cheap: unchanged functions are passed
+        # by reference, edited statements copied
+        self.worker.submit(program_snapshots(*self.app.output_program(), self.rendered))
+
+    def poll(self):
+        # Results are applied in the order they were produced, each patch is relative to the previous one
+        while True:
+            try:
+                result = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            self.apply(*result)
+        self.update_highlight()
+        self.after(PREVIEW_POLL_MS, self.poll)
+
+    def apply(self, generation, patches, layout, changed):
+        self.text.configure(state="normal")
+        # Bottom up, so the line numbers of the remaining patches stay valid
+        for start, end, lines in reversed(patches):
+            self.text.delete(f"{start + 1}.0", f"{end + 1}.0")
+            if lines:
+                self.text.insert(f"{start + 1}.0", "".join(line + "\n" for line in lines))
+        self.text.configure(state="disabled")
+        self.layout = layout
+        for rendered in changed:
+            self.rendered[rendered.func] = rendered
+            # Warm the block caches, so the next snapshot of this function is passed by reference
+            install(rendered)
+        shown = {func for func, _ in layout}
+        for func in [func for func in self.rendered if func not in shown]:
+            del self.rendered[func]
+        self.highlight_stale = True
+
+    def block_lines(self, block):
+        func = block if isinstance(block, Function) else block.owner
+        rendered = self.rendered.get(func)
+        if rendered is None:
+            return None
+        start = 0
+        for shown, count in self.layout:
+            if shown is func:
+                break
+            start += count
+        else:
+            return None
+        if block is func:
+            return start, start + len(rendered.lines)
+        try:
+            i = rendered.blocks.index(block)
+        except ValueError:
+            return None
+        end = rendered.starts[i + 1] if i + 1 < len(rendered.starts) else len(rendered.lines) - 1
+        return start + rendered.starts[i], start + end
+
+    def update_highlight(self):
+        selected = self.app.selected_blocks
+        block = next(iter(selected)).block if len(selected) == 1 else None
+        if block is self.highlighted and not self.highlight_stale:
+            return
+        self.highlighted = block
+        self.highlight_stale = False
+        self.text.tag_remove("selected_block", "1.0", "end")
+        lines = self.block_lines(block) if block is not None else None
+        if lines is not None:
+            first, last = lines
+            self.text.tag_add("selected_block", f"{first + 1}.0", f"{last + 1}.0")
+            self.text.see(f"{first + 1}.0")
+
+
 class BlockWidget:
     """UI-обёртка для блока"""
 
@@ -105,173 +403,164 @@ class BlockWidget:
         self.selected_fill = "#ffff99"
         self.selected_outline = "#ff0000"
 
-        width = 140
-        height = 40
-        self.rect = canvas.create_rectangle(x, y, x + width, y + height, fill=self.normal_fill, outline=self.normal_outline, width=2)
-        self.label = canvas.create_text(x + 70, y + 20, text=text)
+        # Every item of the widget carries its own tag, so one move() call moves all of them
+        self.tag = f"block{id(self)}"
         self.drag_data = {"x": 0, "y": 0}
 
         self.has_input = not isinstance(block, Function)
         self.has_output = not isinstance(block, ReturnBlock)
+        # Canvas items only exist while the widget is inside the viewport (see realize)
+        self.realized = False
+        self.rect = None
+        self.label = None
         self.input_port = None
         self.output_port = None
-
-        if self.has_input:
-            self.input_port = canvas.create_oval(x - 10, y + 15, x, y + 25, fill="blue", tags="input_port")
-        if self.has_output:
-            self.output_port = canvas.create_oval(x + 140, y + 15, x + 150, y + 25, fill="green")
-            canvas.tag_bind(self.output_port, "<ButtonPress-1>", self.start_connect)
-
-        # Bind drag to rect and label
-        canvas.tag_bind(self.rect, "<ButtonPress-1>", self.start_drag)
-        canvas.tag_bind(self.label, "<ButtonPress-1>", self.start_drag)
-        canvas.tag_bind(self.rect, "<B1-Motion>", self.on_drag)
-        canvas.tag_bind(self.label, "<B1-Motion>", self.on_drag)
-        canvas.tag_bind(self.rect, "<ButtonRelease-1>", self.stop_drag)
-        canvas.tag_bind(self.label, "<ButtonRelease-1>", self.stop_drag)
-
-        # Context menu on rect and label
-        canvas.tag_bind(self.rect, "<Button-3>", self.show_context_menu)
-        canvas.tag_bind(self.label, "<Button-3>", self.show_context_menu)
-        if self.has_input:
-            canvas.tag_bind(self.input_port, "<Button-3>", self.show_context_menu)
+        self.badge = None
+        self.badge_label = None
+        # Problems found by the semantic checker, shown as a badge
+        self.issues = app.checker.issues_of(block)
 
         self.temp_line = None
         self.start_x = 0
         self.start_y = 0
 
+    def realize(self):
+        if self.realized:
+            return
+        zoom = self.app.zoom
+        x, y = self.x * zoom, self.y * zoom
+        width, height = BLOCK_WIDTH * zoom, BLOCK_HEIGHT * zoom
+        tags = (self.tag, "selected") if self.selected else (self.tag,)
+        fill, outline = (self.selected_fill, self.selected_outline) if self.selected else (self.normal_fill, self.normal_outline)
+        # Event bindings live on the shared "block"/port tags, see ScratchApp.bind_block_events
+        if zoom < LOD_ZOOM:
+            # Overview level of detail: a single rectangle per block
+            self.rect = self.canvas.create_rectangle(x, y, x + width, y + height, fill=fill, outline="", tags=("block",) + tags)
+            self.realized = True
+            return
+        self.rect = self.canvas.create_rectangle(x, y, x + width, y + height, fill=fill, outline=outline, width=2, tags=("block",) + tags)
+        if zoom == 1.0:
+            self.label = self.canvas.create_text(x + width / 2, y + height / 2, text=self.text, tags=("block",) + tags)
+        else:
+            font = ("TkDefaultFont", max(1, round(9 * zoom)))
+            self.label = self.canvas.create_text(x + width / 2, y + height / 2, text=self.text, font=font, tags=("block",) + tags)
+        if self.has_input:
+            self.input_port = self.canvas.create_oval(*(c * zoom for c in self.input_port_bounds()), fill="blue", tags=("input_port",) + tags)
+        if self.has_output:
+            self.output_port = self.canvas.create_oval(*(c * zoom for c in self.output_port_bounds()), fill="green", tags=("output_port",) + tags)
+        if self.issues:
+            # Red if anything is an error, orange for warnings only; the count of problems inside
+            size = BADGE_SIZE * zoom
+            left, top = x + width - size - 2 * zoom, y + 2 * zoom
+            color = "#e00000" if any(severity == ERROR for severity, _ in self.issues) else "#ff9900"
+            self.badge = self.canvas.create_oval(left, top, left + size, top + size, fill=color, outline="white", tags=("block", "badge") + tags)
+            self.badge_label = self.canvas.create_text(left + size / 2, top + size / 2, text=str(len(self.issues)), fill="white",
+                                                       font=("TkDefaultFont", max(1, round(8 * zoom)), "bold"), tags=("block", "badge") + tags)
+        self.realized = True
+
+    def unrealize(self):
+        if not self.realized:
+            return
+        self.canvas.delete(self.tag)
+        self.rect = self.label = self.input_port = self.output_port = None
+        self.badge = self.badge_label = None
+        self.realized = False
+
     def select(self):
         if not self.selected:
             self.selected = True
-            self.canvas.itemconfig(self.rect, fill=self.selected_fill, outline=self.selected_outline)
+            if self.realized:
+                self.canvas.itemconfig(self.rect, fill=self.selected_fill, outline=self.selected_outline)
+                self.canvas.addtag_withtag("selected", self.tag)
             self.app.selected_blocks.add(self)
 
     def deselect(self):
         if self.selected:
             self.selected = False
-            self.canvas.itemconfig(self.rect, fill=self.normal_fill, outline=self.normal_outline)
+            if self.realized:
+                self.canvas.itemconfig(self.rect, fill=self.normal_fill, outline=self.normal_outline)
+                self.canvas.dtag(self.tag, "selected")
             self.app.selected_blocks.discard(self)
 
-    def get_port_center(self, port):
-        bbox = self.canvas.coords(port)
-        return (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+    def items(self):
+        if not self.realized:
+            return []
+        return [item for item in (self.rect, self.label, self.input_port, self.output_port, self.badge, self.badge_label)
+                if item is not None]
+
+    def bounds(self):
+        # Rectangle plus both ports, in world coordinates
+        return self.x - PORT_SIZE, self.y, self.x + BLOCK_WIDTH + PORT_SIZE, self.y + BLOCK_HEIGHT
+
+    def input_port_bounds(self):
+        # World coordinates of the port ovals, shared by drawing and hit-testing
+        return self.x - PORT_SIZE, self.y + (BLOCK_HEIGHT - PORT_SIZE) / 2, self.x, self.y + (BLOCK_HEIGHT + PORT_SIZE) / 2
+
+    def output_port_bounds(self):
+        right = self.x + BLOCK_WIDTH
+        return right, self.y + (BLOCK_HEIGHT - PORT_SIZE) / 2, right + PORT_SIZE, self.y + (BLOCK_HEIGHT + PORT_SIZE) / 2
+
+    def input_center(self):
+        return self.x - PORT_SIZE / 2, self.y + BLOCK_HEIGHT / 2
+
+    def output_center(self):
+        return self.x + BLOCK_WIDTH + PORT_SIZE / 2, self.y + BLOCK_HEIGHT / 2
+
+    def connection_lines(self):
+        return self.app.edges.edges_of(self.block)
 
     def update_connections(self):
-        # Update outgoing connections
-        if hasattr(self.block, 'outgoing_connections'):
-            for conn in self.block.outgoing_connections:
-                line = conn['line']
-                target = conn['target']
-                target_widget = next((w for w in self.app.blocks_ui if w.block == target), None)
-                if target_widget and target_widget.has_input:
-                    tx, ty = target_widget.get_port_center(target_widget.input_port)
-                    sx, sy = self.get_port_center(self.output_port)
-                    self.canvas.coords(line, sx, sy, tx, ty)
-
-        # Update incoming connections
-        if hasattr(self.block, 'incoming_connections'):
-            for conn in self.block.incoming_connections:
-                line = conn['line']
-                source = conn['source']
-                source_widget = next((w for w in self.app.blocks_ui if w.block == source), None)
-                if source_widget and source_widget.has_output:
-                    sx, sy = source_widget.get_port_center(source_widget.output_port)
-                    tx, ty = self.get_port_center(self.input_port)
-                    self.canvas.coords(line, sx, sy, tx, ty)
+        self.app.update_lines(self.connection_lines())
 
     def start_drag(self, event):
         # Handle selection
         ctrl = bool(event.state & 0x0004)
         if ctrl:
             self.app.toggle_select(self)
-        else:
+        elif not self.selected:
             self.app.clear_selection()
             self.select()
         self.drag_data["x"] = event.x
         self.drag_data["y"] = event.y
+        # Drag the whole selection when grabbing a selected block
+        self.app.start_group_drag(self)
 
     def on_drag(self, event):
-        dx = event.x - self.drag_data["x"]
-        dy = event.y - self.drag_data["y"]
-        self.canvas.move(self.rect, dx, dy)
-        self.canvas.move(self.label, dx, dy)
-        if self.has_input:
-            self.canvas.move(self.input_port, dx, dy)
-        if self.has_output:
-            self.canvas.move(self.output_port, dx, dy)
+        # Event deltas are in screen pixels, the model moves in world units
+        dx = (event.x - self.drag_data["x"]) / self.app.zoom
+        dy = (event.y - self.drag_data["y"]) / self.app.zoom
         self.drag_data["x"] = event.x
         self.drag_data["y"] = event.y
-        self.x += dx
-        self.y += dy
-        # Update connections during drag
-        self.update_connections()
+        # Motion is accumulated and rendered at most once per frame
+        self.app.drag_by(dx, dy)
 
     def stop_drag(self, event):
-        grid_size = 20
-        self.x = round(self.x / grid_size) * grid_size
-        self.y = round(self.y / grid_size) * grid_size
-        width = 140
-        height = 40
-        self.canvas.coords(self.rect, self.x, self.y, self.x + width, self.y + height)
-        self.canvas.coords(self.label, self.x + 70, self.y + 20)
-        if self.has_input:
-            self.canvas.coords(self.input_port, self.x - 10, self.y + 15, self.x, self.y + 25)
-        if self.has_output:
-            self.canvas.coords(self.output_port, self.x + 140, self.y + 15, self.x + 150, self.y + 25)
-        # Final update of connections
-        self.update_connections()
+        self.app.stop_group_drag()
 
     def clear_function_body(self):
         func = self.block
-        connections = func.connections[:]
-        if connections:
-            # Remove line from function to first block
-            first = connections[0]
-            for conn in func.outgoing_connections[:]:
-                if conn['target'] == first:
-                    self.canvas.delete(conn['line'])
-                    func.outgoing_connections.remove(conn)
-                    break
-            for conn in first.incoming_connections[:]:
-                if conn['source'] == func:
-                    first.incoming_connections.remove(conn)
-                    break
-        # Remove internal lines
-        for i in range(1, len(connections)):
-            prev = connections[i-1]
-            curr = connections[i]
-            for conn in prev.outgoing_connections[:]:
-                if conn['target'] == curr:
-                    self.canvas.delete(conn['line'])
-                    prev.outgoing_connections.remove(conn)
-                    break
-            for conn in curr.incoming_connections[:]:
-                if conn['source'] == prev:
-                    curr.incoming_connections.remove(conn)
-                    break
+        # Remove the line from the function and every line along its body
+        removed = []
+        for block in [func] + list(func.connections):
+            for line in self.app.edges.outgoing(block):
+                removed.append(self.app.remove_line(line))
+        if removed:
+            self.app.history.record(Disconnect(removed))
         # Unassign all
-        for block in connections:
-            block.owner = None
-        func.connections = []
+        self.app.sync_body(func)
 
     def start_connect(self, event):
         if not self.has_output:
             return
-        if hasattr(self.block, 'outgoing_connections') and self.block.outgoing_connections:
+        outgoing = self.app.edges.outgoing(self.block)
+        if outgoing:
             if isinstance(self.block, Function):
                 self.clear_function_body()
             else:
-                # Remove existing connection for non-function
-                old_conn = self.block.outgoing_connections.pop(0)
-                self.canvas.delete(old_conn['line'])
-                old_target = old_conn['target']
-                if hasattr(old_target, 'incoming_connections'):
-                    old_target.incoming_connections = [c for c in old_target.incoming_connections if c['line'] != old_conn['line']]
-                if hasattr(self.block, 'owner') and self.block.owner:
-                    try:
-                        self.block.owner.connections.remove(old_target)
-                    except ValueError:
-                        pass
+                # Remove existing connection for non-function, the body is cut after this block
+                self.app.history.record(Disconnect([self.app.remove_line(outgoing[0])]))
+                if self.block.owner is not None:
+                    self.app.sync_body(self.block.owner)
             self.update_connections()
         # Always start new connection
         if self.app.connecting is not None and self.app.connecting != self:
@@ -281,9 +570,9 @@ class BlockWidget:
             self.app.canvas.unbind("<B1-Motion>")
             self.app.canvas.unbind("<ButtonRelease-1>")
         self.app.connecting = self
-        ox, oy = self.get_port_center(self.output_port)
-        self.start_x = ox
-        self.start_y = oy
+        ox, oy = self.output_center()
+        self.start_x = ox * self.app.zoom
+        self.start_y = oy * self.app.zoom
         self.temp_line = self.canvas.create_line(self.start_x, self.start_y, self.start_x, self.start_y, fill="red", width=2)
         self.canvas.bind("<B1-Motion>", self.on_connect_drag)
         self.canvas.bind("<ButtonRelease-1>", self.end_connect)
@@ -298,51 +587,43 @@ class BlockWidget:
     def end_connect(self, event):
         if self.temp_line is None:
             return
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        x, y = self.app.to_world(event.x, event.y)
         self.canvas.delete(self.temp_line)
         self.temp_line = None
 
         # Find target input port
-        overlapping = self.canvas.find_overlapping(x - 10, y - 10, x + 10, y + 10)
-        target_widget = None
-        for item in overlapping:
-            tags = self.canvas.gettags(item)
-            if "input_port" in tags:
-                for w in self.app.blocks_ui:
-                    if w.input_port == item:
-                        target_widget = w
-                        break
-                if target_widget:
-                    break
+        target_widget = self.app.find_input_port(x, y, PORT_SIZE / self.app.zoom)
 
         if target_widget and target_widget.has_input:
             # Check if target already has incoming
-            if hasattr(target_widget.block, 'incoming_connections') and target_widget.block.incoming_connections:
+            if self.app.edges.incoming(target_widget.block):
                 messagebox.showerror("Error", "Target already has an incoming connection.")
                 return
 
-            ix, iy = target_widget.get_port_center(target_widget.input_port)
-            sx, sy = self.get_port_center(self.output_port)
-            line = self.canvas.create_line(sx, sy, ix, iy, fill="black", width=1, arrow=tk.LAST, tags=("connection",))
+            # Adds the line to the edge table and splices the statements into the body
             self.app.connect_blocks(self.block, target_widget.block)
-            # Update connections lists
-            if not hasattr(self.block, 'outgoing_connections'):
-                self.block.outgoing_connections = []
-            self.block.outgoing_connections.append({'line': line, 'target': target_widget.block})
-            if not hasattr(target_widget.block, 'incoming_connections'):
-                target_widget.block.incoming_connections = []
-            target_widget.block.incoming_connections.append({'line': line, 'source': self.block})
-            # Update visuals
-            self.update_connections()
 
         self.canvas.unbind("<B1-Motion>")
         self.canvas.unbind("<ButtonRelease-1>")
         self.app.connecting = None
 
+    def show_issues(self, event):
+        if not self.issues or self.badge is None:
+            return
+        zoom = self.app.zoom
+        text = "\n".join(f"{severity}: {message}" for severity, message in self.issues)
+        tip = self.canvas.create_text((self.x + BLOCK_WIDTH) * zoom + 4, self.y * zoom, text=text, anchor="nw", tags=("issue_tip",))
+        box = self.canvas.create_rectangle(*self.canvas.bbox(tip), fill="#ffffe0", outline="#808080", tags=("issue_tip",))
+        self.canvas.tag_lower(box, tip)
+
+    def hide_issues(self, event):
+        self.canvas.delete("issue_tip")
+
     def show_context_menu(self, event):
         menu = tk.Menu(self.canvas.winfo_toplevel(), tearoff=0)
         menu.add_command(label="Edit", command=self.edit_block)
+        if isinstance(self.block, Function):
+            menu.add_command(label="Evaluate...", command=self.evaluate_function)
 
         menu.add_separator()
         menu.add_command(label="Delete", command=lambda: self.app.delete_block(self.block))
@@ -352,22 +633,34 @@ class BlockWidget:
         finally:
             menu.grab_release()
 
+    def evaluate_function(self):
+        func = self.block
+        try:
+            compiled = compile_function(func)
+        except EvaluationError as e:
+            messagebox.showerror("Error", f"Cannot evaluate {func.name}: {e}")
+            return
+        args = simpledialog.askstring("Evaluate", f"{func.get_signature()}\nArguments, comma separated:",
+                                      parent=self.canvas.winfo_toplevel())
+        if args is None:
+            return
+        try:
+            values = [float(v) if "." in v else int(v) for v in (v.strip() for v in args.split(",")) if v]
+            result = compiled(*values)
+        except (ValueError, TypeError, EvaluationError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        messagebox.showinfo("Evaluate", f"{func.name}({args}) = {result}")
+
     def edit_block(self):
+        before = field_values(self.block)
         dialog = EditDialog(self.canvas.winfo_toplevel(), self.block)
         self.canvas.winfo_toplevel().wait_window(dialog)
         if dialog.result:
-            if isinstance(self.block, Function):
-                self.text = f"{self.block.type} {self.block.name}()"
-            elif isinstance(self.block, VariableBlock):
-                if self.block.value is not None:
-                    self.text = f"{self.block.type} {self.block.name} = {self.block.value}"
-                else:
-                    self.text = f"{self.block.type} {self.block.name}"
-            elif isinstance(self.block, AssignmentBlock):
-                self.text = f"{self.block.var_name} = {self.block.expression}"
-            elif isinstance(self.block, ReturnBlock):
-                self.text = f"return {self.block.expression}"
-            self.canvas.itemconfig(self.label, text=self.text)
+            after = field_values(self.block)
+            if after != before:
+                self.app.history.record(EditBlock(self.block, before, after))
+            self.app.refresh_block_text(self.block)
 
 
 class ScratchApp(tk.Tk):
@@ -381,44 +674,159 @@ class ScratchApp(tk.Tk):
         self.toolbar = ttk.Frame(self)
         self.toolbar.pack(side="top", fill="x")
 
-        self.canvas = tk.Canvas(self, bg="#f0f0f0")
-        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas_frame = ttk.Frame(self)
+        self.canvas_frame.pack(side="left", fill="both", expand=True)
+        self.canvas = tk.Canvas(self.canvas_frame, bg=GRID_BACKGROUND)
+        self.hbar = ttk.Scrollbar(self.canvas_frame, orient="horizontal", command=self.canvas.xview)
+        self.vbar = ttk.Scrollbar(self.canvas_frame, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(xscrollcommand=self.on_xscroll, yscrollcommand=self.on_yscroll)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.vbar.grid(row=0, column=1, sticky="ns")
+        self.hbar.grid(row=1, column=0, sticky="ew")
+        self.canvas_frame.rowconfigure(0, weight=1)
+        self.canvas_frame.columnconfigure(0, weight=1)
 
         self.palette = tk.Frame(self, relief="raised", bd=2, bg="lightgray", width=150)
         self.palette.pack(side="right", fill="y")
         self.palette.propagate(False)
 
-        self.blocks_ui = []
-        self.selected_blocks = set()
-        self.selected_lines = set()
-        self.connecting = None
-        self.rubber_id = None
-        self.select_start_x = 0
-        self.select_start_y = 0
-
-        self.bind("<Delete>", self.delete_selected)
-        self.canvas.bind("<Delete>", self.delete_selected)
-        self.canvas.bind("<Button-1>", self.on_canvas_click)
-        self.canvas.bind("<Configure>", self.redraw_grid)
+        self.init_state()
+        self.preview = PreviewPane(self, self)
+        self.preview_visible = tk.BooleanVar(value=True)
+        self.preview.pack(side="right", fill="y", after=self.palette)
+        self.builder = Builder()
+        # Emit the optimized form of the functions instead of the blocks as wired
+        self.optimize_output = tk.BooleanVar(value=False)
+        # Generated programs contain only the functions reachable from this one; empty for all
+        self.entry_point = tk.StringVar(value="main")
+        self.entry_point.trace_add("write", lambda *args: self.schedule_preview())
+
+        # Handlers are looked up per event, so the profiler can wrap them after the bindings are made
+        self.bind("<Delete>", lambda e: self.delete_selected(e))
+        self.bind("<Control-z>", lambda e: self.undo())
+        self.bind("<Control-y>", lambda e: self.redo())
+        self.bind("<Control-Shift-Z>", lambda e: self.redo())
+        self.canvas.bind("<Delete>", lambda e: self.delete_selected(e))
+        self.canvas.bind("<Button-1>", lambda e: self.on_canvas_click(e))
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Shift-MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Control-MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        # Pan with the middle mouse button
+        self.canvas.bind("<ButtonPress-2>", lambda e: self.canvas.scan_mark(e.x, e.y))
+        self.canvas.bind("<B2-Motion>", lambda e: self.canvas.scan_dragto(e.x, e.y, gain=1))
+        self.canvas.configure(scrollregion=self.scroll_bounds)
+        self.bind_block_events()
         self.focus_set()
 
         self.create_palette_items()
         self.redraw_grid()
 
         ttk.Button(self.toolbar, text="Сгенерировать код", command=self.show_generated_code).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Сохранить .cpp", command=self.save_generated_code).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Собрать и запустить", command=self.build_and_run).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Собрать по функциям", command=self.build_units).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Компилятор…", command=self.configure_compiler).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Сохранить проект", command=self.save_project).pack(side="right", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Открыть проект", command=self.open_project).pack(side="right", padx=4, pady=4)
+        self.undo_button = ttk.Button(self.toolbar, text="↶", width=3, command=self.undo)
+        self.undo_button.pack(side="left", padx=4, pady=4)
+        self.redo_button = ttk.Button(self.toolbar, text="↷", width=3, command=self.redo)
+        self.redo_button.pack(side="left", pady=4)
+        self.update_history_buttons()
+        ttk.Button(self.toolbar, text="−", width=3, command=lambda: self.set_zoom(self.zoom / 1.25)).pack(side="left", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="100%", width=5, command=lambda: self.set_zoom(1.0)).pack(side="left", pady=4)
+        ttk.Button(self.toolbar, text="+", width=3, command=lambda: self.set_zoom(self.zoom * 1.25)).pack(side="left", padx=4, pady=4)
+        ttk.Checkbutton(self.toolbar, text="Оптимизация", variable=self.optimize_output, command=self.schedule_preview).pack(side="left", padx=4, pady=4)
+        ttk.Label(self.toolbar, text="Точка входа:").pack(side="left", padx=(8, 2), pady=4)
+        ttk.Entry(self.toolbar, textvariable=self.entry_point, width=10).pack(side="left", pady=4)
+        ttk.Checkbutton(self.toolbar, text="Предпросмотр", variable=self.preview_visible, command=self.toggle_preview).pack(side="left", padx=4, pady=4)
+        ttk.Button(self.toolbar, text="Профилирование…", command=lambda: StatsDialog(self)).pack(side="left", padx=4, pady=4)
+
+    def init_state(self):
+        # Editor state, kept apart from widget construction so it can run against any canvas
+        # Lookup indexes: block -> widget, canvas item -> widget
+        self.widgets_by_block = {}
+        self.widgets_by_item = {}
+        # Edge table: edge id -> (source, target) plus the canvas line drawn for it
+        self.edges = EdgeTable()
+        # Spatial indexes for hit-testing: widgets by bounds, lines by segment
+        self.block_index = GridIndex()
+        self.line_index = GridIndex()
+        self.line_segments = {}
+        # Line ids are edge ids; canvas items exist only for lines in the viewport
+        self.realized_widgets = set()
+        self.viewport_job = None
+        self.scroll_bounds = [0, 0, 2000, 2000]
+        self.zoom = 1.0
+        self.grid_image = None
+        self.grid_tile = 0
+        self.selected_blocks = set()
+        self.selected_lines = set()
+        self.connecting = None
+        self.rubber_id = None
+        self.select_start_x = 0
+        self.select_start_y = 0
+        self.drag_group = []
+        self.drag_tag = None
+        self.drag_dx = 0
+        self.drag_dy = 0
+        self.drag_job = None
+        # (widget, x, y) of the dragged widgets when the drag started
+        self.drag_origin = []
+        self.history = History()
+        self.history.on_change = self.history_changed
+        # Toolbar buttons enabled only while there is a step to undo or redo
+        self.undo_button = None
+        self.redo_button = None
+        self.call_graph = CallGraph()
+        # func -> (its code when optimized, the optimized copy); the preview then sees the same copy until an edit
+        self.optimized = weakref.WeakKeyDictionary()
+        self.checker = Checker()
+        self.check_job = None
+        self.preview = None
+        # Binary projects load function bodies lazily, as their bounds scroll into view
+        self.project_reader = None
+        self.pending_functions = GridIndex()
+
+    @property
+    def blocks_ui(self):
+        # Widgets in creation order, backed by the block index
+        return self.widgets_by_block.values()
+
+    def bind_block_events(self):
+        # One binding per tag instead of per item, dispatched to the widget under the cursor
+        for tag, sequence, handler in (
+            ("block", "<ButtonPress-1>", "start_drag"),
+            ("block", "<B1-Motion>", "on_drag"),
+            ("block", "<ButtonRelease-1>", "stop_drag"),
+            ("block", "<Button-3>", "show_context_menu"),
+            ("input_port", "<Button-3>", "show_context_menu"),
+            ("output_port", "<ButtonPress-1>", "start_connect"),
+            ("badge", "<Enter>", "show_issues"),
+            ("badge", "<Leave>", "hide_issues"),
+        ):
+            self.canvas.tag_bind(tag, sequence, lambda e, h=handler: self.dispatch_block_event(e, h))
+
+    def dispatch_block_event(self, event, handler):
+        current = self.canvas.find_withtag("current")
+        widget = self.widgets_by_item.get(current[0]) if current else None
+        if widget is None and handler in ("on_drag", "stop_drag") and self.drag_group:
+            widget = self.drag_group[0]
+        if widget is not None:
+            getattr(widget, handler)(event)
+
+    def to_world(self, x, y):
+        # Window coordinates of an event -> model coordinates
+        return self.canvas.canvasx(x) / self.zoom, self.canvas.canvasy(y) / self.zoom
 
     def on_canvas_click(self, event):
-        over = self.canvas.find_overlapping(event.x - 1, event.y - 1, event.x + 1, event.y + 1)
-        connection_items = [item for item in over if "connection" in self.canvas.gettags(item)]
-        block_items = set()
-        for w in self.blocks_ui:
-            block_items.add(w.rect)
-            block_items.add(w.label)
-            if w.has_input:
-                block_items.add(w.input_port)
-            if w.has_output:
-                block_items.add(w.output_port)
-        block_over = any(item in block_items for item in over)
+        wx, wy = self.to_world(event.x, event.y)
+        connection_items = self.find_lines_at(wx, wy, 2 / self.zoom)
+        block_over = bool(self.block_index.query_point(wx, wy, 1 / self.zoom))
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
 
         if connection_items:
             self.clear_selection()  # Clear block selection when selecting lines
@@ -439,21 +847,23 @@ class ScratchApp(tk.Tk):
         # Start rubber band selection
         self.clear_selection()
         self.clear_line_selection()
-        self.select_start_x = event.x
-        self.select_start_y = event.y
-        self.rubber_id = self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline="gray", dash=(5, 5), width=1)
+        self.select_start_x = x
+        self.select_start_y = y
+        self.rubber_id = self.canvas.create_rectangle(x, y, x, y, outline="gray", dash=(5, 5), width=1)
         self.canvas.bind("<B1-Motion>", self.on_rubber_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_rubber_release)
 
     def select_line(self, line_id):
         if line_id not in self.selected_lines:
             self.selected_lines.add(line_id)
-            self.canvas.itemconfig(line_id, fill="red", width=3)
+            if line_id in self.edges.lines:
+                self.canvas.itemconfig(self.edges.lines[line_id], fill="red", width=3)
 
     def deselect_line(self, line_id):
         if line_id in self.selected_lines:
             self.selected_lines.discard(line_id)
-            self.canvas.itemconfig(line_id, fill="black", width=1)
+            if line_id in self.edges.lines:
+                self.canvas.itemconfig(self.edges.lines[line_id], fill="black", width=1)
 
     def clear_line_selection(self):
         for line_id in list(self.selected_lines):
@@ -463,29 +873,31 @@ class ScratchApp(tk.Tk):
         if self.rubber_id is None:
             return
         x1, y1 = self.select_start_x, self.select_start_y
-        x2, y2 = event.x, event.y
+        x2, y2 = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         self.canvas.coords(self.rubber_id, x1, y1, x2, y2)
 
     def on_rubber_release(self, event):
         if self.rubber_id is None:
             return
-        x1 = min(self.select_start_x, event.x)
-        y1 = min(self.select_start_y, event.y)
-        x2 = max(self.select_start_x, event.x)
-        y2 = max(self.select_start_y, event.y)
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        x1 = min(self.select_start_x, x)
+        y1 = min(self.select_start_y, y)
+        x2 = max(self.select_start_x, x)
+        y2 = max(self.select_start_y, y)
         if abs(x2 - x1) < 5 and abs(y2 - y1) < 5:
             # Small area, just click - deselect all
             self.clear_selection()
             self.clear_line_selection()
         else:
-            # Select blocks and lines in box
-            for widget in self.blocks_ui:
-                wx1, wy1, wx2, wy2 = widget.x, widget.y, widget.x + 140, widget.y + 40
+            # Select blocks and lines in box (the band is drawn in canvas coordinates)
+            x1, y1, x2, y2 = x1 / self.zoom, y1 / self.zoom, x2 / self.zoom, y2 / self.zoom
+            for widget in self.block_index.query(x1, y1, x2, y2):
+                wx1, wy1, wx2, wy2 = widget.x, widget.y, widget.x + BLOCK_WIDTH, widget.y + BLOCK_HEIGHT
                 if not (x2 < wx1 or x1 > wx2 or y2 < wy1 or y1 > wy2):
                     widget.select()
-            for item in self.canvas.find_overlapping(x1, y1, x2, y2):
-                if "connection" in self.canvas.gettags(item):
-                    self.select_line(item)
+            for line in self.line_index.query(x1, y1, x2, y2):
+                if segment_intersects_rect(*self.line_segments[line], x1, y1, x2, y2):
+                    self.select_line(line)
         self.canvas.delete(self.rubber_id)
         self.rubber_id = None
         self.canvas.unbind("<B1-Motion>")
@@ -505,40 +917,163 @@ class ScratchApp(tk.Tk):
         widget.select()
 
     def delete_selected(self, event=None):
-        # Delete blocks
-        to_delete_blocks = list(self.selected_blocks)
-        for widget in to_delete_blocks:
-            self.delete_block(widget.block)
-        self.selected_blocks.clear()
-        # Delete lines
-        to_delete_lines = list(self.selected_lines)
-        for line_id in to_delete_lines:
-            self.canvas.delete(line_id)
-            # Clean up logical connections
-            for widget in self.blocks_ui:
-                if hasattr(widget.block, 'outgoing_connections'):
-                    widget.block.outgoing_connections = [c for c in widget.block.outgoing_connections if c['line'] != line_id]
-                if hasattr(widget.block, 'incoming_connections'):
-                    widget.block.incoming_connections = [c for c in widget.block.incoming_connections if c['line'] != line_id]
-                # If function, remove the target from connections
-                if isinstance(widget.block, Function):
-                    for c in widget.block.outgoing_connections:
-                        target = c['target']
-                        if target in widget.block.connections:
-                            widget.block.connections.remove(target)
+        # Blocks and lines go away in one undo step
+        with self.history.group():
+            self.delete_blocks([widget.block for widget in self.selected_blocks])
+            self.selected_blocks.clear()
+            self.delete_selected_lines()
+
+    def delete_selected_lines(self):
+        affected = set()
+        removed = []
+        for line_id in list(self.selected_lines):
+            edge = self.remove_line(line_id)
+            if edge is None:
+                continue
+            removed.append(edge)
+            source = edge[0]
+            func = source if isinstance(source, Function) else source.owner
+            if func is not None:
+                affected.add(func)
+        if removed:
+            self.history.record(Disconnect(removed))
+        # Each touched body is re-derived once, however many lines were removed from it
+        for func in affected:
+            self.sync_body(func)
         self.selected_lines.clear()
 
+    def on_canvas_configure(self, event=None):
+        self.redraw_grid()
+        self.schedule_viewport_refresh()
+
+    def on_xscroll(self, first, last):
+        self.hbar.set(first, last)
+        self.place_grid()
+        self.schedule_viewport_refresh()
+
+    def on_yscroll(self, first, last):
+        self.vbar.set(first, last)
+        self.place_grid()
+        self.schedule_viewport_refresh()
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            step = -1
+        else:
+            step = 1
+        if event.state & 0x0004:
+            # Ctrl + wheel zooms around the cursor
+            self.set_zoom(self.zoom * (1.25 if step < 0 else 0.8), event.x, event.y)
+        elif event.state & 0x0001:
+            self.canvas.xview_scroll(step, "units")
+        else:
+            self.canvas.yview_scroll(step, "units")
+
+    def grid_tile_data(self, spacing, tile):
+        rows = []
+        for y in range(tile):
+            row = []
+            for x in range(tile):
+                # Dashed 4 on / 4 off lines every spacing pixels
+                on_line = (x % spacing == 0 and y % 8 < 4) or (y % spacing == 0 and x % 8 < 4)
+                row.append(GRID_COLOR if on_line else GRID_BACKGROUND)
+            rows.append("{" + " ".join(row) + "}")
+        return " ".join(rows)
+
     def redraw_grid(self, event=None):
-        self.canvas.delete("grid")
         width = self.canvas.winfo_width()
         height = self.canvas.winfo_height()
         if width <= 1 or height <= 1:
             return
-        grid_size = 20
-        for i in range(0, width, grid_size):
-            self.canvas.create_line(i, 0, i, height, fill="lightgray", dash=(4, 4), tags="grid")
-        for i in range(0, height, grid_size):
-            self.canvas.create_line(0, i, width, i, fill="lightgray", dash=(4, 4), tags="grid")
+        spacing = round(GRID_SIZE * self.zoom)
+        if spacing < 6:
+            # Too dense to be useful when zoomed out
+            self.canvas.delete("grid")
+            self.grid_image = None
+            return
+        tile = spacing * 8 // math.gcd(spacing, 8)
+        width = (width // tile + 2) * tile
+        height = (height // tile + 2) * tile
+        # The image is only rebuilt when the canvas grows or the zoom changes; scrolling just moves it
+        if (self.grid_image is None or self.grid_tile != tile
+                or self.grid_image.width() < width or self.grid_image.height() < height):
+            self.grid_tile = tile
+            self.grid_image = tk.PhotoImage(width=width, height=height)
+            self.grid_image.put(self.grid_tile_data(spacing, tile), to=(0, 0, width, height))
+            self.canvas.delete("grid")
+            self.canvas.create_image(0, 0, image=self.grid_image, anchor="nw", tags="grid")
+            self.canvas.tag_lower("grid")
+        self.place_grid()
+
+    def place_grid(self):
+        if self.grid_image is None:
+            return
+        x = math.floor(self.canvas.canvasx(0) / self.grid_tile) * self.grid_tile
+        y = math.floor(self.canvas.canvasy(0) / self.grid_tile) * self.grid_tile
+        self.canvas.coords("grid", x, y)
+
+    def set_zoom(self, zoom, x=None, y=None):
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        if zoom == self.zoom:
+            return
+        if x is None:
+            x, y = self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2
+        # Keep the world point under (x, y) in place
+        wx, wy = self.to_world(x, y)
+        for widget in list(self.realized_widgets):
+            self.unrealize_widget(widget)
+        for line in list(self.edges.lines):
+            self.canvas.delete(self.edges.lines.pop(line))
+        self.zoom = zoom
+        region = [v * zoom for v in self.scroll_bounds]
+        self.canvas.configure(scrollregion=region)
+        self.canvas.xview_moveto((wx * zoom - x - region[0]) / (region[2] - region[0]))
+        self.canvas.yview_moveto((wy * zoom - y - region[1]) / (region[3] - region[1]))
+        self.redraw_grid()
+        self.refresh_viewport()
+
+    def viewport(self):
+        # Visible area plus margin, in world coordinates
+        zoom = self.zoom
+        return ((self.canvas.canvasx(0) - VIEWPORT_MARGIN) / zoom, (self.canvas.canvasy(0) - VIEWPORT_MARGIN) / zoom,
+                (self.canvas.canvasx(self.canvas.winfo_width()) + VIEWPORT_MARGIN) / zoom,
+                (self.canvas.canvasy(self.canvas.winfo_height()) + VIEWPORT_MARGIN) / zoom)
+
+    def in_viewport(self, x1, y1, x2, y2):
+        vx1, vy1, vx2, vy2 = self.viewport()
+        return not (x2 < vx1 or x1 > vx2 or y2 < vy1 or y1 > vy2)
+
+    def schedule_viewport_refresh(self):
+        if self.viewport_job is None:
+            self.viewport_job = self.canvas.after_idle(self.refresh_viewport)
+
+    def refresh_viewport(self):
+        self.viewport_job = None
+        x1, y1, x2, y2 = self.viewport()
+        for i in self.pending_functions.query(x1, y1, x2, y2):
+            self.load_pending_function(i)
+        visible = self.block_index.query(x1, y1, x2, y2)
+        for widget in self.realized_widgets - visible:
+            if widget not in self.drag_group:
+                self.unrealize_widget(widget)
+        for widget in visible - self.realized_widgets:
+            self.realize_widget(widget)
+        visible_lines = {line for line in self.line_index.query(x1, y1, x2, y2)
+                         if segment_intersects_rect(*self.line_segments[line], x1, y1, x2, y2)}
+        for line in set(self.edges.lines) - visible_lines:
+            self.canvas.delete(self.edges.lines.pop(line))
+        for line in visible_lines - self.edges.lines.keys():
+            self.realize_line(line)
+
+    def extend_scrollregion(self, x1, y1, x2, y2):
+        bounds = self.scroll_bounds
+        margin = 1000
+        if x1 < bounds[0] or y1 < bounds[1] or x2 > bounds[2] or y2 > bounds[3]:
+            bounds[0] = min(bounds[0], x1 - margin)
+            bounds[1] = min(bounds[1], y1 - margin)
+            bounds[2] = max(bounds[2], x2 + margin)
+            bounds[3] = max(bounds[3], y2 + margin)
+            self.canvas.configure(scrollregion=[v * self.zoom for v in bounds])
 
     def create_palette_items(self):
         palette_items = [
@@ -555,8 +1090,8 @@ class ScratchApp(tk.Tk):
     def start_drag_new(self, event, creator, ghost_text):
         self.creator = creator
         self.ghost_text = ghost_text
-        self.ghost_rect = self.canvas.create_rectangle(0, 0, 140, 40, fill="#d0e0ff", outline="#5070ff", stipple="gray25", tags="ghost")
-        self.ghost_label = self.canvas.create_text(70, 20, text=ghost_text, tags="ghost")
+        self.ghost_rect = self.canvas.create_rectangle(0, 0, BLOCK_WIDTH * self.zoom, BLOCK_HEIGHT * self.zoom, fill="#d0e0ff", outline="#5070ff", stipple="gray25", tags="ghost")
+        self.ghost_label = self.canvas.create_text(BLOCK_WIDTH * self.zoom / 2, BLOCK_HEIGHT * self.zoom / 2, text=ghost_text, tags="ghost")
         self.canvas.tag_raise("ghost")
         self.bind("<B1-Motion>", self.on_drag_new)
         self.bind("<ButtonRelease-1>", self.drop_new)
@@ -568,7 +1103,8 @@ class ScratchApp(tk.Tk):
         wy = event.y_root - self.canvas.winfo_rooty()
         cx = self.canvas.canvasx(wx)
         cy = self.canvas.canvasy(wy)
-        self.canvas.coords(self.ghost_rect, cx - 70, cy - 20, cx + 70, cy + 20)
+        half_width, half_height = BLOCK_WIDTH * self.zoom / 2, BLOCK_HEIGHT * self.zoom / 2
+        self.canvas.coords(self.ghost_rect, cx - half_width, cy - half_height, cx + half_width, cy + half_height)
         self.canvas.coords(self.ghost_label, cx, cy)
 
     def drop_new(self, event):
@@ -576,30 +1112,17 @@ class ScratchApp(tk.Tk):
             return
         wx = event.x_root - self.canvas.winfo_rootx()
         wy = event.y_root - self.canvas.winfo_rooty()
-        cx = self.canvas.canvasx(wx)
-        cy = self.canvas.canvasy(wy)
-        grid_size = 20
-        x = round(cx / grid_size) * grid_size
-        y = round(cy / grid_size) * grid_size
+        cx, cy = self.to_world(wx, wy)
+        x = round(cx / GRID_SIZE) * GRID_SIZE
+        y = round(cy / GRID_SIZE) * GRID_SIZE
 
         block = self.creator()
-        if isinstance(block, Function):
-            text = f"{block.type} {block.name}()"
-        elif isinstance(block, VariableBlock):
-            if block.value is not None:
-                text = f"{block.type} {block.name} = {block.value}"
-            else:
-                text = f"{block.type} {block.name}"
-        elif isinstance(block, AssignmentBlock):
-            text = f"{block.var_name} = {block.expression}"
-        elif isinstance(block, ReturnBlock):
-            text = f"return {block.expression}"
-        else:
-            text = "block"
+        text = block_text(block)
 
         widget = BlockWidget(self.canvas, block, x, y, text, self)
-        self.blocks_ui.append(widget)
+        self.register_widget(widget)
         block.owner = None
+        self.history.record(CreateBlocks([(block, x, y)]))
         self.canvas.delete(self.ghost_rect)
         self.canvas.delete(self.ghost_label)
         if hasattr(self, 'ghost_rect'):
@@ -612,80 +1135,490 @@ class ScratchApp(tk.Tk):
 
     def connect_blocks(self, source, target):
         if source == target:
-            return
+            return None
         if isinstance(source, Function):
             func = source
         else:
             if source.owner is None:
                 messagebox.showerror("Error", "Cannot connect unassigned block.")
-                return
+                return None
             func = source.owner
         if target.owner is not None and target.owner != func:
-            try:
-                target.owner.connections.remove(target)
-            except ValueError:
-                pass
-            target.owner = None
+            old_owner = target.owner
+            removed = [self.remove_line(line) for line in self.edges.incoming(target)]
+            if removed:
+                self.history.record(Disconnect(removed))
+            self.sync_body(old_owner)
+
+        # The target brings along everything already wired after it
+        statements = [target] + self.edges.chain(target)
 
         # Check for multiple returns
-        if isinstance(target, ReturnBlock):
-            if any(isinstance(c, ReturnBlock) for c in func.connections):
+        if any(isinstance(c, ReturnBlock) for c in statements):
+            if func.connections.count_of(ReturnBlock):
                 messagebox.showerror("Error", "Function already has a return statement.")
-                return
-
-        if isinstance(source, Function):
-            if target not in func.connections:
-                func.connections.append(target)
-            target.owner = func
-        else:
-            if target in func.connections:
-                func.connections.remove(target)
-            idx = func.connections.index(source)
-            func.connections.insert(idx + 1, target)
-            target.owner = func
+                return None
+
+        line = self.add_line(source, target)
+        self.history.record(Connect([(source, target)]))
+        func.connections.insert_after(None if isinstance(source, Function) else source, statements)
+        for block in statements:
+            block.owner = func
+        func.mark_dirty()
+        return line
+
+    def sync_body(self, func):
+        # Function bodies are derived from the edge table: the chain of lines starting at the function
+        body = self.edges.chain(func)
+        members = set(body)
+        for block in func.connections:
+            if block not in members and block.owner is func:
+                block.owner = None
+        for block in body:
+            block.owner = func
+        func.connections.reset(body)
+        func.mark_dirty()
 
     def delete_block(self, block):
-        # Delete lines
-        if hasattr(block, 'outgoing_connections'):
-            for conn in block.outgoing_connections:
-                line = conn['line']
-                self.canvas.delete(line)
+        self.delete_blocks([block])
+
+    def delete_blocks(self, blocks):
+        affected = set()
+        entries = []
+        removed = {}
+        # Undo puts the widgets back at their place in widgets_by_block, which orders the functions in output
+        order = {block: index for index, block in enumerate(self.widgets_by_block)}
+        indices = []
+        for block in blocks:
+            # Delete lines
+            for line in self.edges.edges_of(block):
+                source = self.edges.edges[line][0]
+                affected.add(source if isinstance(source, Function) else source.owner)
+                removed[line] = self.remove_line(line)
                 self.selected_lines.discard(line)
-                target = conn['target']
-                if target and hasattr(target, 'incoming_connections'):
-                    target.incoming_connections = [c for c in target.incoming_connections if c['line'] != line]
-        if hasattr(block, 'incoming_connections'):
-            for conn in block.incoming_connections:
-                line = conn['line']
-                self.canvas.delete(line)
-                self.selected_lines.discard(line)
-                source = conn['source']
-                if source and hasattr(source, 'outgoing_connections'):
-                    source.outgoing_connections = [c for c in source.outgoing_connections if c['line'] != line]
-
-        if hasattr(block, 'owner') and block.owner:
-            try:
-                block.owner.connections.remove(block)
-            except ValueError:
-                pass
-        for widget in self.blocks_ui[:]:
-            if widget.block == block:
-                self.canvas.delete(widget.rect)
-                self.canvas.delete(widget.label)
-                if hasattr(widget, 'input_port'):
-                    self.canvas.delete(widget.input_port)
-                if hasattr(widget, 'output_port'):
-                    self.canvas.delete(widget.output_port)
+            if isinstance(block, Function):
+                affected.add(block)
+            elif block.owner is not None:
+                affected.add(block.owner)
+            widget = self.widgets_by_block.get(block)
+            if widget is not None:
+                entries.append((block, widget.x, widget.y))
+                indices.append(order[block])
                 if widget in self.selected_blocks:
                     self.selected_blocks.remove(widget)
-                self.blocks_ui.remove(widget)
-                break
+                self.unregister_widget(widget)
+        affected.discard(None)
+        for func in affected:
+            self.sync_body(func)
+        # Lines are restored in their original order, which keeps the order of the bodies
+        if entries or removed:
+            self.history.record(DeleteBlocks(entries, [removed[line] for line in sorted(removed)], indices))
+
+    def restore_blocks(self, entries, indices=None):
+        for block, x, y in entries:
+            self.register_widget(BlockWidget(self.canvas, block, x, y, block_text(block), self))
+        if indices is None:
+            return
+        restored = {block for block, _, _ in entries}
+        order = [block for block in self.widgets_by_block if block not in restored]
+        for index, block in sorted(zip(indices, (block for block, _, _ in entries)), key=lambda item: item[0]):
+            order.insert(index, block)
+        widgets = dict(self.widgets_by_block)
+        self.widgets_by_block.clear()
+        for block in order:
+            self.widgets_by_block[block] = widgets[block]
+
+    def find_edge(self, source, target):
+        for line in self.edges.outgoing(source):
+            if self.edges.edges[line][1] is target:
+                return line
+        return None
+
+    def restore_edges(self, edges):
+        affected = set()
+        for source, target in edges:
+            self.add_line(source, target)
+            affected.add(source if isinstance(source, Function) else source.owner)
+        affected.discard(None)
+        # Bodies are derived from the lines, so each touched function is re-synced once at the end
+        for func in affected:
+            self.sync_body(func)
+
+    def remove_edges(self, edges):
+        affected = set()
+        for source, target in edges:
+            line = self.find_edge(source, target)
+            if line is None:
+                continue
+            affected.add(source if isinstance(source, Function) else source.owner)
+            self.remove_line(line)
+            self.selected_lines.discard(line)
+        affected.discard(None)
+        for func in affected:
+            self.sync_body(func)
+
+    def place_blocks(self, positions):
+        lines = set()
+        for block, x, y in positions:
+            widget = self.widgets_by_block.get(block)
+            if widget is None:
+                continue
+            self.canvas.move(widget.tag, (x - widget.x) * self.zoom, (y - widget.y) * self.zoom)
+            widget.x, widget.y = x, y
+            self.block_index.update(widget, *widget.bounds())
+            self.extend_scrollregion(*widget.bounds())
+            lines.update(widget.connection_lines())
+        self.update_lines(lines)
+        self.schedule_viewport_refresh()
+
+    def refresh_block_text(self, block):
+        widget = self.widgets_by_block.get(block)
+        if widget is None:
+            return
+        widget.text = block_text(block)
+        if widget.label is not None:
+            self.canvas.itemconfig(widget.label, text=widget.text)
+
+    def undo(self):
+        self.history.undo(self)
+
+    def redo(self):
+        self.history.redo(self)
+
+    def register_widget(self, widget):
+        self.widgets_by_block[widget.block] = widget
+        self.block_index.insert(widget, *widget.bounds())
+        self.extend_scrollregion(*widget.bounds())
+        if self.in_viewport(*widget.bounds()):
+            self.realize_widget(widget)
+
+    def unregister_widget(self, widget):
+        self.unrealize_widget(widget)
+        self.widgets_by_block.pop(widget.block, None)
+        self.block_index.remove(widget)
+
+    def realize_widget(self, widget):
+        widget.realize()
+        for item in widget.items():
+            self.widgets_by_item[item] = widget
+        self.realized_widgets.add(widget)
+
+    def unrealize_widget(self, widget):
+        for item in widget.items():
+            self.widgets_by_item.pop(item, None)
+        widget.unrealize()
+        self.realized_widgets.discard(widget)
+
+    def add_line(self, source, target):
+        line = self.edges.add(source, target)
+        self.update_lines([line])
+        return line
+
+    def remove_line(self, line):
+        item = self.edges.lines.get(line)
+        if item is not None:
+            self.canvas.delete(item)
+        self.line_index.remove(line)
+        self.line_segments.pop(line, None)
+        return self.edges.remove(line)
+
+    def realize_line(self, line):
+        if line in self.selected_lines:
+            fill, width = "red", 3
+        else:
+            fill, width = "black", 1
+        zoom = self.zoom
+        coords = [v * zoom for v in self.line_segments[line]]
+        if zoom < LOD_ZOOM:
+            # Overview: no arrowheads, and lines shorter than a few pixels merge into their blocks
+            if abs(coords[2] - coords[0]) + abs(coords[3] - coords[1]) < 4:
+                return
+            self.edges.lines[line] = self.canvas.create_line(*coords, fill=fill, width=width, tags=("connection",))
+            return
+        self.edges.lines[line] = self.canvas.create_line(*coords, fill=fill, width=width, arrow=tk.LAST, tags=("connection",))
+
+    def update_lines(self, lines):
+        for line in lines:
+            edge = self.edges.edges.get(line)
+            if edge is None:
+                continue
+            source_widget = self.widgets_by_block.get(edge[0])
+            target_widget = self.widgets_by_block.get(edge[1])
+            if source_widget and target_widget and source_widget.has_output and target_widget.has_input:
+                self.move_line(line, *source_widget.output_center(), *target_widget.input_center())
+
+    def start_group_drag(self, widget):
+        if widget.selected:
+            self.drag_group = list(self.selected_blocks)
+            self.drag_tag = "selected"
+        else:
+            self.drag_group = [widget]
+            self.drag_tag = widget.tag
+        self.drag_origin = [(w, w.x, w.y) for w in self.drag_group]
+        self.drag_dx = self.drag_dy = 0
+
+    def drag_by(self, dx, dy):
+        self.drag_dx += dx
+        self.drag_dy += dy
+        if self.drag_job is None:
+            self.drag_job = self.canvas.after(FRAME_MS, self.flush_drag)
+
+    def flush_drag(self):
+        self.drag_job = None
+        dx, dy = self.drag_dx, self.drag_dy
+        self.drag_dx = self.drag_dy = 0
+        if not dx and not dy:
+            return
+        self.canvas.move(self.drag_tag, dx * self.zoom, dy * self.zoom)
+        lines = set()
+        for widget in self.drag_group:
+            widget.x += dx
+            widget.y += dy
+            self.block_index.update(widget, *widget.bounds())
+            lines.update(widget.connection_lines())
+        self.update_lines(lines)
+
+    def stop_group_drag(self):
+        if self.drag_job is not None:
+            self.canvas.after_cancel(self.drag_job)
+            self.flush_drag()
+        lines = set()
+        for widget in self.drag_group:
+            x = round(widget.x / GRID_SIZE) * GRID_SIZE
+            y = round(widget.y / GRID_SIZE) * GRID_SIZE
+            if x != widget.x or y != widget.y:
+                self.canvas.move(widget.tag, (x - widget.x) * self.zoom, (y - widget.y) * self.zoom)
+                widget.x, widget.y = x, y
+                self.block_index.update(widget, *widget.bounds())
+            lines.update(widget.connection_lines())
+            self.extend_scrollregion(*widget.bounds())
+        self.update_lines(lines)
+        moves = [(w.block, x, y, w.x, w.y) for w, x, y in self.drag_origin if (x, y) != (w.x, w.y)]
+        if moves:
+            self.history.record(MoveBlocks(moves))
+        self.drag_origin = []
+        self.drag_group = []
+        self.drag_tag = None
+        self.schedule_viewport_refresh()
+
+    def move_line(self, line, sx, sy, tx, ty):
+        self.line_segments[line] = (sx, sy, tx, ty)
+        self.line_index.update(line, sx, sy, tx, ty)
+        item = self.edges.lines.get(line)
+        if item is not None:
+            zoom = self.zoom
+            self.canvas.coords(item, sx * zoom, sy * zoom, tx * zoom, ty * zoom)
+        elif self.in_viewport(min(sx, tx), min(sy, ty), max(sx, tx), max(sy, ty)):
+            self.realize_line(line)
+
+    def find_lines_at(self, x, y, tolerance=2):
+        return [line for line in self.line_index.query_point(x, y, tolerance)
+                if point_segment_distance(x, y, *self.line_segments[line]) <= tolerance]
+
+    def find_input_port(self, x, y, radius=10):
+        for widget in self.block_index.query_point(x, y, radius):
+            if not widget.has_input:
+                continue
+            px1, py1, px2, py2 = widget.input_port_bounds()
+            if not (x + radius < px1 or x - radius > px2 or y + radius < py1 or y - radius > py2):
+                return widget
+        return None
+
+    def get_functions(self):
+        self.load_pending_functions()
+        return [b.block for b in self.blocks_ui if isinstance(b.block, Function)]
+
+    def program(self):
+        # Only what the entry point reaches, callees first; prototypes for mutually recursive functions
+        return self.call_graph.program(self.get_functions(), self.entry_point.get().strip())
+
+    def output_program(self):
+        declarations, functions = self.program()
+        if self.optimize_output.get():
+            declarations = [self.optimized_function(func) for func in declarations]
+            functions = [self.optimized_function(func) for func in functions]
+        return declarations, functions
+
+    def optimized_function(self, func):
+        code = func.generate_code()
+        entry = self.optimized.get(func)
+        if entry is None or entry[0] is not code:
+            entry = self.optimized[func] = (code, optimize_function(func))
+        return entry[1]
+
+    def output_functions(self):
+        return self.output_program()[1]
+
+    def history_changed(self):
+        self.update_history_buttons()
+        self.model_changed()
+
+    def update_history_buttons(self):
+        if self.undo_button is None:
+            return
+        self.undo_button.state(["!disabled"] if self.history.can_undo() else ["disabled"])
+        self.redo_button.state(["!disabled"] if self.history.can_redo() else ["disabled"])
+
+    def model_changed(self):
+        self.schedule_preview()
+        self.schedule_check()
+
+    def schedule_preview(self):
+        if self.preview is not None:
+            self.preview.schedule()
+
+    def schedule_check(self):
+        # Checked once the pending events are handled, so a burst of changes costs one check
+        if self.check_job is None:
+            self.check_job = self.canvas.after_idle(self.run_checks)
+
+    def run_checks(self):
+        self.check_job = None
+        # Only functions whose code changed are looked at, and in them only the statements the change affects
+        functions = [w.block for w in self.blocks_ui if isinstance(w.block, Function)]
+        for block, issues in self.checker.update(functions).items():
+            widget = self.widgets_by_block.get(block)
+            if widget is None:
+                continue
+            widget.issues = issues
+            if widget.realized:
+                # Redrawn with its new badge, or without one
+                self.unrealize_widget(widget)
+                self.realize_widget(widget)
+
+    def toggle_preview(self):
+        if self.preview_visible.get():
+            self.preview.pack(side="right", fill="y", after=self.palette)
+            self.schedule_preview()
+        else:
+            self.preview.pack_forget()
 
     def show_generated_code(self):
-        code = "\n\n".join(f.generate_code() for f in [b.block for b in self.blocks_ui if isinstance(b.block, Function)])
-        messagebox.showinfo("Сгенерированный код", code)
+        # The code is shown in the preview pane, generated off the main loop
+        self.load_pending_functions()
+        self.preview_visible.set(True)
+        self.toggle_preview()
+
+    def save_generated_code(self):
+        path = filedialog.asksaveasfilename(defaultextension=".cpp", filetypes=[("C++ source", "*.cpp"), ("All files", "*.*")])
+        if not path:
+            return
+        # Stream straight into the file instead of building one big string
+        declarations, functions = self.output_program()
+        with open(path, "w", encoding="utf-8", buffering=1 << 16) as out:
+            emit_program(functions, out, declarations=declarations)
+
+    def build_and_run(self):
+        source = io.StringIO()
+        declarations, functions = self.output_program()
+        emit_program(functions, source, declarations=declarations)
+        source = source.getvalue()
+        BuildDialog(self, BuildJob(self.builder, lambda report, cancelled: self.builder.build(source, report, cancelled)))
+
+    def build_units(self):
+        directory = filedialog.askdirectory(title="Папка для исходников", mustexist=False)
+        if not directory:
+            return
+        # Rendering stays on the Tk thread, the worker only writes files and runs the compiler
+        header, units = render_units(self.output_functions())
+        BuildDialog(self, BuildJob(self.builder, lambda report, cancelled: self.builder.build_units(
+            header, units, directory, report, cancelled)))
+
+    def configure_compiler(self):
+        command = " ".join([self.builder.compiler, *self.builder.flags])
+        command = simpledialog.askstring("Компилятор", "Команда компилятора и флаги:", initialvalue=command, parent=self)
+        if not command or not command.strip():
+            return
+        compiler, *flags = shlex.split(command)
+        self.builder = Builder(compiler, flags, self.builder.cache)
+
+    def to_project(self):
+        self.load_pending_functions()
+        project = project_io.Project(functions=self.get_functions())
+        for widget in self.blocks_ui:
+            project.positions[widget.block] = (widget.x, widget.y)
+            if not isinstance(widget.block, Function) and widget.block.owner is None:
+                project.loose.append(widget.block)
+        # Lines inside function bodies are implied by the body order
+        project.edges = [(source, target) for source, target in self.edges.edges.values()
+                         if not isinstance(source, Function) and source.owner is None]
+        return project
+
+    def save_project(self):
+        path = filedialog.asksaveasfilename(defaultextension=".cppb", filetypes=[
+            ("Binary project", "*.cppb"), ("JSON project", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        project_io.save_project(self.to_project(), path)
+
+    def open_project(self):
+        path = filedialog.askopenfilename(filetypes=[
+            ("Projects", "*.cppb *.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            project = project_io.open_project(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot open project: {e}")
+            return
+        self.clear_canvas()
+        if isinstance(project, project_io.ProjectReader):
+            self.project_reader = project
+            # Only the function index is read now; bodies follow when they scroll into view
+            for i in range(project.function_count):
+                x1, y1, x2, y2 = project.function_bounds(i)
+                self.pending_functions.insert(i, x1, y1, x2 + BLOCK_WIDTH, y2 + BLOCK_HEIGHT)
+                self.extend_scrollregion(x1, y1, x2 + BLOCK_WIDTH, y2 + BLOCK_HEIGHT)
+            blocks, positions, edges = project.load_loose()
+            self.add_project_blocks(blocks, positions, edges)
+            self.refresh_viewport()
+        else:
+            blocks = list(project.blocks())
+            edges = [edge for func in project.functions for edge in project_io.body_edges(func)] + project.edges
+            self.add_project_blocks(blocks, project.positions, edges)
+
+    def add_project_blocks(self, blocks, positions, edges):
+        for block in blocks:
+            x, y = positions.get(block, (0, 0))
+            self.register_widget(BlockWidget(self.canvas, block, x, y, block_text(block), self))
+        for source, target in edges:
+            self.add_line(source, target)
+        self.model_changed()
+
+    def load_pending_function(self, i):
+        self.pending_functions.remove(i)
+        func, positions = self.project_reader.load_function(i)
+        self.add_project_blocks([func, *func.connections], positions, project_io.body_edges(func))
+        if not self.pending_functions:
+            self.project_reader.close()
+            self.project_reader = None
+
+    def load_pending_functions(self):
+        for i in sorted(self.pending_functions.bounds):
+            self.load_pending_function(i)
+
+    def clear_canvas(self):
+        self.selected_blocks.clear()
+        self.selected_lines.clear()
+        for line in list(self.edges.edges):
+            self.remove_line(line)
+        for widget in list(self.blocks_ui):
+            self.unregister_widget(widget)
+        if self.project_reader is not None:
+            self.project_reader.close()
+            self.project_reader = None
+        self.pending_functions = GridIndex()
+        self.history.clear()
+
+
+# Hot handlers timed while the profiler panel is open
+profiler.watch(BlockWidget, "end_connect")
+# Drag handlers only accumulate deltas; the per-frame work happens in flush_drag and what it redraws
+profiler.watch(ScratchApp, "flush_drag", "update_lines", "refresh_viewport", "on_canvas_click", "on_rubber_release",
+               "redraw_grid", "delete_selected", "run_checks")
+profiler.watch(Function, "generate_code")
 
 
 if __name__ == "__main__":
     app = ScratchApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
@@ -0,0 +1,169 @@
+"""Пакетная генерация C++ из сохранённых проектов без GUI.
+
+    python batch.py PROJECT_OR_DIR... [-o OUTPUT_DIR] [-j JOBS] [--entry NAME] [--optimize] [--keep-going]
+
+Каждый проект (.cppb или .json) записывается в свой .cpp: рядом с проектом
+или в OUTPUT_DIR с сохранением относительных путей каталогов.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Only the model and the file formats are imported here, never the editor (and with it tkinter)
+import project_io
+from block_system import emit_program
+
+
+PROJECT_SUFFIXES = (".cppb", ".json")
+OUTPUT_SUFFIX = ".cpp"
+
+
+class BatchError(Exception):
+    pass
+
+
+def find_projects(paths):
+    # Files are taken as given; directories are searched recursively for project files
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(PROJECT_SUFFIXES))
+            for project in found:
+                yield project, os.path.relpath(project, path)
+        elif os.path.isfile(path):
+            yield path, os.path.basename(path)
+        else:
+            raise BatchError(f"{path}: no such file or directory")
+
+
+def plan(paths, output_dir=None):
+    """Пары (проект, выходной файл); повторяющиеся выходные пути считаются ошибкой"""
+    jobs = []
+    outputs = {}
+    for project, relative in find_projects(paths):
+        base = os.path.join(output_dir, relative) if output_dir else project
+        output = os.path.splitext(base)[0] + OUTPUT_SUFFIX
+        key = os.path.normcase(os.path.abspath(output))
+        if key in outputs:
+            raise BatchError(f"{project}: output {output} is also written for {outputs[key]}")
+        outputs[key] = project
+        jobs.append((project, output))
+    return jobs
+
+
+def generate(project, output, optimize=False, entry=None):
+    start = time.perf_counter()
+    temporary = output + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(temporary, "w", encoding="utf-8", buffering=1 << 16) as out:
+            if project_io.is_binary(project) and not optimize and not entry:
+                # Stream straight from the mapped file without building the block model
+                from project_mmap import MappedProject
+                with MappedProject(project) as mapped:
+                    mapped.emit(out)
+                    functions = mapped.function_count
+            else:
+                loaded = project_io.load_project(project).functions
+                declarations = []
+                if entry:
+                    from callgraph import CallGraph
+                    declarations, loaded = CallGraph().program(loaded, entry)
+                if optimize:
+                    from optimizer import optimize as optimize_functions
+                    optimized = dict(zip(loaded, optimize_functions(loaded)))
+                    declarations = [optimized[func] for func in declarations]
+                    loaded = list(optimized.values())
+                emit_program(loaded, out, declarations=declarations)
+                functions = len(loaded)
+        # A failed or cancelled run never leaves a truncated .cpp behind
+        os.replace(temporary, output)
+    except (OSError, ValueError) as e:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise BatchError(f"{project}: {e}") from None
+    return project, output, functions, time.perf_counter() - start
+
+
+def run(jobs, workers=None, optimize=False, keep_going=False, report=None, entry=None):
+    """Генерирует код всех проектов; возвращает результаты и ошибки.
+
+    Без keep_going первая ошибка отменяет ещё не начатые проекты.
+    """
+    results, errors = [], []
+
+    def collect(future_or_call):
+        try:
+            result = future_or_call()
+        except BatchError as e:
+            errors.append(str(e))
+            if report:
+                report("error", str(e))
+            return not keep_going
+        results.append(result)
+        if report:
+            report("done", result)
+        return False
+
+    if workers == 1 or len(jobs) <= 1:
+        # Not worth starting a pool; also keeps tracebacks in-process for debugging
+        for project, output in jobs:
+            if collect(lambda: generate(project, output, optimize, entry)):
+                break
+        return results, errors
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate, project, output, optimize, entry) for project, output in jobs]
+        for future in as_completed(futures):
+            if collect(future.result):
+                pool.shutdown(cancel_futures=True)
+                break
+    return results, errors
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python batch.py", description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", metavar="PROJECT_OR_DIR")
+    parser.add_argument("-o", "--output-dir", help="write the .cpp files here instead of next to the projects")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--entry", metavar="NAME", help="emit only the functions reachable from this one, callees first")
+    parser.add_argument("--optimize", action="store_true", help="emit the optimized form of the functions")
+    parser.add_argument("--keep-going", action="store_true", help="continue after a project fails")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the summary")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        jobs = plan(args.paths, args.output_dir)
+    except BatchError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("error: no project files found", file=sys.stderr)
+        return 2
+
+    def report(kind, value):
+        if kind == "error":
+            print(f"error: {value}", file=sys.stderr)
+        elif not args.quiet:
+            project, output, functions, elapsed = value
+            print(f"{elapsed * 1000:9.1f} ms  {project} -> {output} ({functions} functions)")
+
+    results, errors = run(jobs, args.jobs, args.optimize, args.keep_going, report, args.entry)
+    wall = time.perf_counter() - start
+    busy = sum(result[3] for result in results)
+    skipped = len(jobs) - len(results) - len(errors)
+    summary = f"{len(results)} of {len(jobs)} projects in {wall:.2f} s (worker time {busy:.2f} s)"
+    if errors:
+        summary += f", {len(errors)} failed"
+    if skipped:
+        summary += f", {skipped} skipped"
+    print(summary, file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,57 @@
+"""Пиковый RSS генерации кода: полная загрузка против mmap.
+
+    python -m benchmarks.bench_mmap [1000000]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import project_io
+from block_system import emit_program
+from benchmarks.synthetic import make_project_of_size
+from project_mmap import MappedProject
+
+
+def child(mode, path):
+    start = time.perf_counter()
+    with open(os.devnull, "w") as out:
+        if mode == "load":
+            emit_program(project_io.load_binary(path).functions, out)
+        else:
+            with MappedProject(path) as project:
+                project.emit(out)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.3f} {peak_rss_kb()}")
+
+
+def peak_rss_kb():
+    # VmHWM starts over at exec, unlike ru_maxrss which keeps the forked parent's peak
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def main(argv):
+    if argv and argv[0] == "--child":
+        child(argv[1], argv[2])
+        return
+    sizes = [int(s) for s in argv[0].split(",")] if argv else [1_000_000]
+    print(f"{'blocks':>9} {'MB':>8} {'mode':6} {'time s':>8} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as workspace:
+        for size in sizes:
+            path = os.path.join(workspace, "project.cppb")
+            project_io.save_binary(make_project_of_size(size), path)
+            megabytes = os.path.getsize(path) / 1e6
+            for mode in ("load", "mmap"):
+                result = subprocess.run([sys.executable, "-m", "benchmarks.bench_mmap", "--child", mode, path],
+                                        capture_output=True, text=True, check=True)
+                elapsed, rss = result.stdout.split()
+                print(f"{size:9d} {megabytes:8.2f} {mode:6} {float(elapsed):8.3f} {int(rss) / 1024:12.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
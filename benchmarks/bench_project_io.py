@@ -0,0 +1,63 @@
+"""Пропускная способность сохранения и загрузки проектов.
+
+    python -m benchmarks.bench_project_io [10000,100000,1000000]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import project_io
+from benchmarks.synthetic import make_project_of_size
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes):
+    results = []
+    with tempfile.TemporaryDirectory() as workspace:
+        for size in sizes:
+            project = make_project_of_size(size)
+            blocks = sum(1 for _ in project.blocks())
+            for name, save, load, ext in (
+                ("json", project_io.save_json, project_io.load_json, ".json"),
+                ("binary", project_io.save_binary, project_io.load_binary, ".cppb"),
+            ):
+                path = os.path.join(workspace, f"project{ext}")
+                save_time, _ = measure(save, project, path)
+                load_time, _ = measure(load, path)
+                # Lazy open: header, index and strings only, then a single function body
+                open_time, reader = measure(project_io.open_project, path)
+                if isinstance(reader, project_io.ProjectReader):
+                    first_time, _ = measure(reader.load_function, 0)
+                    reader.close()
+                else:
+                    first_time = 0.0
+                results.append({
+                    "format": name,
+                    "blocks": blocks,
+                    "bytes": os.path.getsize(path),
+                    "save_s": save_time,
+                    "load_s": load_time,
+                    "open_s": open_time,
+                    "first_function_s": first_time,
+                    "save_blocks_per_s": blocks / save_time,
+                    "load_blocks_per_s": blocks / load_time,
+                })
+    return results
+
+
+def main(argv):
+    sizes = [int(s) for s in argv[0].split(",")] if argv else [10_000, 100_000, 1_000_000]
+    print(f"{'format':8} {'blocks':>9} {'MB':>8} {'save s':>8} {'load s':>8} {'open s':>8} {'1st fn s':>9}")
+    for r in run(sizes):
+        print(f"{r['format']:8} {r['blocks']:9d} {r['bytes'] / 1e6:8.2f} {r['save_s']:8.3f} {r['load_s']:8.3f} "
+              f"{r['open_s']:8.4f} {r['first_function_s']:9.5f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,141 @@
+"""Скорость сгенерированного C++ при разных наборах флагов компилятора.
+
+    python -m benchmarks.bench_runtime [PROJECT] [--flag-set=-O2 --flag-set="-O3 -march=native" ...]
+        [--runs N] [--iterations N] [--json OUT]
+"""
+import argparse
+import io
+import json
+import math
+import statistics
+import subprocess
+import sys
+
+import project_io
+from block_system import emit_program
+from build import Builder, BuildCache, default_compiler
+from benchmarks.synthetic import make_project
+
+
+FLAG_SETS = ("-O0", "-O2", "-O3", "-O3 -march=native")
+NUMERIC_TYPES = ("int", "long", "long long", "short", "float", "double")
+
+DRIVER_HEAD = """#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+// A user function called main would clash with the driver
+#define main blocks_main
+"""
+DRIVER_MAIN = """#undef main
+
+static volatile double sink;
+
+int main(int argc, char** argv) {
+    long long iterations = argc > 1 ? std::atoll(argv[1]) : 1000000;
+    // Read through a volatile so the inputs are unknown at compile time
+    volatile int seed = 1;
+    auto start = std::chrono::steady_clock::now();
+    for (long long i = 0; i < iterations; ++i) {
+        int x = seed + (int)(i & 1023);
+%s    }
+    auto end = std::chrono::steady_clock::now();
+    double ns = std::chrono::duration<double, std::nano>(end - start).count();
+    std::printf("%%.6f\\n", ns / iterations);
+    return 0;
+}
+"""
+
+
+def benchmarkable(func):
+    return func.name != "main" and all(type in NUMERIC_TYPES for type in func.params.values())
+
+
+def driver_source(functions):
+    out = io.StringIO()
+    out.write(DRIVER_HEAD)
+    emit_program(functions, out)
+    calls = []
+    for func in functions:
+        if not benchmarkable(func):
+            continue
+        args = ", ".join(f"x + {k}" for k in range(len(func.params)))
+        call = f"{func.name}({args})"
+        calls.append(f"        {call};\n" if func.type == "void" else f"        sink = sink + {call};\n")
+    if not calls:
+        raise ValueError("no function with numeric parameters to benchmark")
+    out.write("\n")
+    out.write(DRIVER_MAIN % "".join(calls))
+    return out.getvalue()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "median_ns": statistics.median(samples),
+        "p5_ns": percentile(samples, 5),
+        "p95_ns": percentile(samples, 95),
+        "min_ns": min(samples),
+        "max_ns": max(samples),
+        "variance": statistics.pvariance(samples),
+        "stdev_ns": statistics.pstdev(samples),
+    }
+
+
+def run(functions, flag_sets=FLAG_SETS, runs=10, iterations=1_000_000, compiler=None, cache=None):
+    source = driver_source(functions)
+    results = []
+    for flags in flag_sets:
+        builder = Builder(compiler or default_compiler(), flags.split(), cache or BuildCache())
+        result = {"flags": flags, "compiler": builder.compiler}
+        try:
+            executable = builder.build(source)
+            samples = []
+            for _ in range(runs):
+                output = subprocess.run([executable, str(iterations)], capture_output=True, text=True, check=True)
+                samples.append(float(output.stdout))
+            result.update(summarize(samples))
+        except (OSError, subprocess.CalledProcessError) as e:
+            # An unsupported flag set is reported, the others still run
+            result["error"] = (getattr(e, "output", None) or str(e)).strip()
+        results.append(result)
+    return results
+
+
+def print_table(results):
+    print(f"{'flags':20} {'median ns':>10} {'p5':>10} {'p95':>10} {'stdev':>10} {'variance':>10}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['flags']:20} failed: {r['error'].splitlines()[0] if r['error'] else ''}")
+            continue
+        print(f"{r['flags']:20} {r['median_ns']:10.2f} {r['p5_ns']:10.2f} {r['p95_ns']:10.2f} "
+              f"{r['stdev_ns']:10.3f} {r['variance']:10.4f}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_runtime", description=__doc__.splitlines()[0])
+    parser.add_argument("project", nargs="?", help="project file (.json or binary); a synthetic program by default")
+    parser.add_argument("--flag-set", action="append", dest="flag_sets",
+                        help="one set of compiler flags, repeatable; write it as --flag-set=-O2")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--compiler", default=None)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    functions = project_io.load_project(args.project).functions if args.project else make_project(10, 20, 2).functions
+    results = run(functions, args.flag_sets or FLAG_SETS, args.runs, args.iterations, args.compiler)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump({"project": args.project, "iterations": args.iterations, "results": results}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
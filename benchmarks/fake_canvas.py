@@ -0,0 +1,158 @@
+import itertools
+from collections import Counter
+
+
+class FakeCanvas:
+    """Заменитель tk.Canvas без дисплея: хранит элементы и считает вызовы"""
+
+    def __init__(self, width=1000, height=700):
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.tags = {}
+        self.calls = Counter()
+        # Job id -> (callback, args); ids are never reused, so a stale id cannot cancel a newer job
+        self.pending = {}
+        self._jobs = itertools.count(1)
+        self._next_id = 1
+
+    def _create(self, kind, coords, options):
+        self.calls[f"create_{kind}"] += 1
+        item = self._next_id
+        self._next_id += 1
+        tags = options.pop("tags", ())
+        tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        self.items[item] = [kind, list(coords), set(tags), options]
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(item)
+        return item
+
+    def create_rectangle(self, *coords, **options):
+        return self._create("rectangle", coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self._create("oval", coords, options)
+
+    def create_line(self, *coords, **options):
+        return self._create("line", coords, options)
+
+    def create_text(self, *coords, **options):
+        return self._create("text", coords, options)
+
+    def create_image(self, *coords, **options):
+        return self._create("image", coords, options)
+
+    def _resolve(self, tag_or_id):
+        if isinstance(tag_or_id, int):
+            return (tag_or_id,) if tag_or_id in self.items else ()
+        if tag_or_id == "all":
+            return tuple(self.items)
+        return tuple(self.tags.get(tag_or_id, ()))
+
+    def coords(self, tag_or_id, *coords):
+        self.calls["coords"] += 1
+        items = self._resolve(tag_or_id)
+        if not coords:
+            return list(self.items[items[0]][1]) if items else []
+        if len(coords) == 1:
+            coords = coords[0]
+        for item in items:
+            self.items[item][1] = list(coords)
+
+    def move(self, tag_or_id, dx, dy):
+        self.calls["move"] += 1
+        for item in self._resolve(tag_or_id):
+            coords = self.items[item][1]
+            self.items[item][1] = [v + (dx if i % 2 == 0 else dy) for i, v in enumerate(coords)]
+
+    def delete(self, *tags_or_ids):
+        self.calls["delete"] += 1
+        for tag_or_id in tags_or_ids:
+            for item in self._resolve(tag_or_id):
+                for tag in self.items.pop(item)[2]:
+                    self.tags[tag].discard(item)
+
+    def itemconfig(self, tag_or_id, **options):
+        self.calls["itemconfig"] += 1
+        for item in self._resolve(tag_or_id):
+            self.items[item][3].update(options)
+
+    itemconfigure = itemconfig
+
+    def addtag_withtag(self, new_tag, tag_or_id):
+        self.calls["addtag_withtag"] += 1
+        for item in self._resolve(tag_or_id):
+            self.items[item][2].add(new_tag)
+            self.tags.setdefault(new_tag, set()).add(item)
+
+    def dtag(self, tag_or_id, tag=None):
+        self.calls["dtag"] += 1
+        tag = tag or tag_or_id
+        for item in self._resolve(tag_or_id):
+            self.items[item][2].discard(tag)
+            self.tags.get(tag, set()).discard(item)
+
+    def gettags(self, item):
+        return tuple(self.items[item][2]) if item in self.items else ()
+
+    def find_withtag(self, tag_or_id):
+        return self._resolve(tag_or_id)
+
+    def after(self, ms, func=None, *args):
+        # Callbacks wait for run_pending(), which stands in for the next frame of the Tk loop
+        job = next(self._jobs)
+        self.pending[job] = (func, args)
+        return job
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job):
+        self.pending.pop(job, None)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, {}
+        for func, args in pending.values():
+            if func is not None:
+                func(*args)
+
+    def canvasx(self, x):
+        return x
+
+    def canvasy(self, y):
+        return y
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def configure(self, **options):
+        self.calls["configure"] += 1
+
+    config = configure
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def unbind(self, *args, **kwargs):
+        pass
+
+    def tag_bind(self, *args, **kwargs):
+        pass
+
+    def tag_raise(self, *args):
+        pass
+
+    def tag_lower(self, *args):
+        pass
+
+
+class FakeEvent:
+    def __init__(self, x=0, y=0, state=0):
+        self.x = self.x_root = x
+        self.y = self.y_root = y
+        self.state = state
@@ -0,0 +1,170 @@
+"""Набор бенчмарков модели, генератора кода и операций редактора без дисплея.
+
+    python -m benchmarks.suite [--functions N] [--body-length N] [--depth N] [--json OUT]
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from block_system import *
+from block_store import BlockStore
+from benchmarks.fake_canvas import FakeCanvas, FakeEvent
+from benchmarks.synthetic import make_project
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def count_blocks(project):
+    return sum(1 for _ in project.blocks())
+
+
+def bench_model(functions, body_length, depth, seed):
+    results = {}
+    tracemalloc.start()
+    elapsed, project = timed(make_project, functions, body_length, depth, seed)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = count_blocks(project)
+    results["blocks"] = blocks
+    results["build_s"] = elapsed
+    results["bytes_per_block"] = allocated / blocks
+
+    store = BlockStore()
+    for func in project.functions:
+        store.add(func)
+    results["store_bytes_per_block"] = store.nbytes() / blocks
+
+    cold, _ = timed(lambda: [func.generate_code() for func in project.functions])
+    warm, _ = timed(lambda: [func.generate_code() for func in project.functions])
+    # One edit per function: only the touched statement and its function are rendered again
+    for func in project.functions:
+        func.connections[len(func.connections) // 2].mark_dirty()
+    edited, _ = timed(lambda: [func.generate_code() for func in project.functions])
+    for func in project.functions:
+        for block in func.connections:
+            block._code = None
+        func._code = None
+    streamed, _ = timed(emit_program, project.functions, io.StringIO())
+    results["generate_cold_blocks_per_s"] = blocks / cold
+    results["generate_warm_s"] = warm
+    results["generate_after_edit_s"] = edited
+    results["emit_program_blocks_per_s"] = blocks / streamed
+    return results
+
+
+def headless_app(canvas):
+    import app as app_module
+    # The editor state runs against the fake canvas; the Tk window itself is never created
+    editor = app_module.ScratchApp.__new__(app_module.ScratchApp)
+    editor.canvas = canvas
+    editor.init_state()
+    return app_module, editor
+
+
+def per_call(elapsed, calls):
+    return elapsed / calls if calls else 0.0
+
+
+def bench_editor(functions, body_length, depth, seed):
+    results = {}
+    rng = random.Random(seed)
+    project = make_project(functions, body_length, depth, seed)
+    # Bodies are wired up again through the editor, so start from unconnected blocks
+    bodies = {func: list(func.connections) for func in project.functions}
+    for func in project.functions:
+        for block in func.connections:
+            block.owner = None
+        func.connections.clear()
+    canvas = FakeCanvas()
+    app_module, editor = headless_app(canvas)
+
+    blocks = [block for func in project.functions for block in [func, *bodies[func]]]
+    elapsed, _ = timed(lambda: [editor.register_widget(app_module.BlockWidget(
+        canvas, block, *project.positions[block], app_module.block_text(block), editor)) for block in blocks])
+    results["register_widget_s"] = per_call(elapsed, len(blocks))
+
+    connections = [(source, target) for func, body in bodies.items() for source, target in zip([func] + body, body)]
+    canvas.calls.clear()
+    elapsed, _ = timed(lambda: [editor.connect_blocks(source, target) for source, target in connections])
+    results["connect_blocks_s"] = per_call(elapsed, len(connections))
+    results["connect_blocks_canvas_calls"] = sum(canvas.calls.values()) / max(1, len(connections))
+
+    # Rubber band over roughly a quarter of the program
+    x2 = max(x for x, _ in project.positions.values()) / 2
+    y2 = max(y for _, y in project.positions.values()) / 2
+    canvas.calls.clear()
+    start = time.perf_counter()
+    editor.on_canvas_click(FakeEvent(-20, -60))
+    for step in range(1, 31):
+        editor.on_rubber_drag(FakeEvent(x2 * step / 30, y2 * step / 30))
+    editor.on_rubber_release(FakeEvent(x2, y2))
+    results["rubber_band_s"] = time.perf_counter() - start
+    results["rubber_band_selected"] = len(editor.selected_blocks)
+    results["rubber_band_canvas_calls"] = sum(canvas.calls.values())
+
+    # Drag the selection: 60 motion events, 4 per rendered frame
+    grabbed = next(iter(editor.selected_blocks))
+    canvas.calls.clear()
+    start = time.perf_counter()
+    grabbed.start_drag(FakeEvent(0, 0))
+    for step in range(1, 61):
+        grabbed.on_drag(FakeEvent(step * 3, step * 2))
+        if step % 4 == 0:
+            canvas.run_pending()
+    grabbed.stop_drag(FakeEvent(180, 120))
+    canvas.run_pending()
+    results["drag_s"] = time.perf_counter() - start
+    results["drag_frame_s"] = results["drag_s"] / 15
+    results["drag_canvas_calls"] = sum(canvas.calls.values())
+
+    canvas.calls.clear()
+    deleted = len(editor.selected_blocks)
+    elapsed, _ = timed(editor.delete_selected)
+    results["delete_selected_s"] = elapsed
+    results["delete_selected_blocks"] = deleted
+
+    remaining = [block for block in blocks if block in editor.widgets_by_block]
+    victims = rng.sample(remaining, min(200, len(remaining)))
+    elapsed, _ = timed(lambda: [editor.delete_block(block) for block in victims])
+    results["delete_block_s"] = per_call(elapsed, len(victims))
+    return results
+
+
+def run(functions=50, body_length=100, depth=2, seed=0):
+    return {
+        "python": platform.python_version(),
+        "parameters": {"functions": functions, "body_length": body_length, "depth": depth, "seed": seed},
+        "model": bench_model(functions, body_length, depth, seed),
+        "editor": bench_editor(functions, body_length, depth, seed),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=50)
+    parser.add_argument("--body-length", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+    results = run(args.functions, args.body_length, args.depth, args.seed)
+    for section in ("model", "editor"):
+        print(f"[{section}]")
+        for name, value in results[section].items():
+            print(f"  {name:32} {value:.6g}" if isinstance(value, float) else f"  {name:32} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
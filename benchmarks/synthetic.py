@@ -0,0 +1,55 @@
+import random
+
+from block_system import *
+from project_io import Project
+
+
+OPERATIONS = [Operation.ADD, Operation.SUB, Operation.MUL]
+
+
+def random_expression(rng, names, depth):
+    if depth <= 0:
+        return rng.choice(names) if rng.random() < 0.7 else str(rng.randint(0, 99))
+    left = random_expression(rng, names, depth - 1)
+    right = random_expression(rng, names, depth - 1)
+    return ExpressionBlock(left, rng.choice(OPERATIONS), right).generate_code()
+
+
+def make_function(rng, index, body_length, expression_depth):
+    func = Function("int", f"func{index}")
+    func.add_param("int", "a")
+    func.add_param("int", "b")
+    names = ["a", "b"]
+    for i in range(body_length - 1):
+        if i % 4 == 0 or len(names) < 3:
+            name = f"v{i}"
+            statement = VariableBlock("int", name, random_expression(rng, names, expression_depth))
+            names.append(name)
+        else:
+            statement = AssignmentBlock(rng.choice(names[2:]), random_expression(rng, names, expression_depth))
+        statement.owner = func
+        func.connections.append(statement)
+    ret = ReturnBlock(names[-1])
+    ret.owner = func
+    func.connections.append(ret)
+    return func
+
+
+def make_project(functions=10, body_length=100, expression_depth=2, seed=0):
+    """Синтетический проект: functions функций по body_length операторов"""
+    rng = random.Random(seed)
+    project = Project()
+    for index in range(functions):
+        func = make_function(rng, index, body_length, expression_depth)
+        project.functions.append(func)
+        # One column per function, statements stacked below it on the 20px grid
+        x = index * 200
+        project.positions[func] = (x, 0)
+        for row, statement in enumerate(func.connections, start=1):
+            project.positions[statement] = (x, row * 60)
+    return project
+
+
+def make_project_of_size(blocks, body_length=100, expression_depth=2, seed=0):
+    functions = max(1, blocks // (body_length + 1))
+    return make_project(functions, body_length, expression_depth, seed)
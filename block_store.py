@@ -0,0 +1,171 @@
+import weakref
+from array import array
+from types import MappingProxyType
+
+from block_system import *
+
+
+NONE = -1
+
+# Block kinds and the string columns each of them uses
+KINDS = (Function, VariableBlock, AssignmentBlock, ReturnBlock, ExpressionBlock)
+FIELDS = {
+    Function: ("type", "name"),
+    VariableBlock: ("type", "name", "value"),
+    AssignmentBlock: ("var_name", "expression"),
+    ReturnBlock: ("expression",),
+    ExpressionBlock: ("left", "op", "right"),
+}
+COLUMNS = 3
+
+
+def _string_property(column):
+    def get(self):
+        return self._store.get_string(self._store.columns[column][self._index])
+
+    def set(self, value):
+        self._store.columns[column][self._index] = self._store.add_string(value)
+
+    return property(get, set)
+
+
+def _op_property(column):
+    def get(self):
+        return Operation(self._store.get_string(self._store.columns[column][self._index]))
+
+    def set(self, value):
+        self._store.columns[column][self._index] = self._store.add_string(value.value)
+
+    return property(get, set)
+
+
+def _get_owner(self):
+    owner = self._store.owner[self._index]
+    return None if owner == NONE else self._store.get(owner)
+
+
+def _set_owner(self, block):
+    self._store.owner[self._index] = NONE if block is None else block._index
+
+
+def _make_view(cls):
+    namespace = {"__slots__": ("_store", "_index"), "owner": property(_get_owner, _set_owner)}
+    for column, field in enumerate(FIELDS[cls]):
+        namespace[field] = _op_property(column) if field == "op" else _string_property(column)
+    return type(f"Stored{cls.__name__}", (cls,), namespace)
+
+
+VIEWS = tuple(_make_view(cls) for cls in KINDS)
+
+
+class StoredStatementList(StatementList):
+    """Тело функции из хранилища: только для чтения, правки в массивы не попадают"""
+
+    def __init__(self, items):
+        self._frozen = False
+        super().__init__(items)
+        self._frozen = True
+
+    def _link(self, item, prev, next):
+        if self._frozen:
+            raise TypeError("the body of a stored function is read-only")
+        super()._link(item, prev, next)
+
+    def remove(self, item):
+        raise TypeError("the body of a stored function is read-only")
+
+    def clear(self):
+        raise TypeError("the body of a stored function is read-only")
+
+
+class BlockStore:
+    """Компактное хранилище блоков: столбцы в массивах array вместо объектов"""
+
+    def __init__(self):
+        self.strings = []
+        self._string_ids = {}
+        self.kind = array("B")
+        self.owner = array("i")
+        self.columns = tuple(array("i") for _ in range(COLUMNS))
+        # Function bodies and parameters live in shared arrays, addressed by (start, length)
+        self.body_start = array("i")
+        self.body_len = array("i")
+        self.body = array("i")
+        self.param_start = array("i")
+        self.param_len = array("i")
+        self.param_types = array("i")
+        self.param_names = array("i")
+        self._views = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add_string(self, value):
+        if value is None:
+            return NONE
+        value = intern_name(str(value))
+        index = self._string_ids.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._string_ids[value] = index
+        return index
+
+    def get_string(self, index):
+        return None if index == NONE else self.strings[index]
+
+    def add(self, block, owner=NONE):
+        cls = next(c for c in KINDS if isinstance(block, c))
+        index = len(self.kind)
+        self.kind.append(KINDS.index(cls))
+        self.owner.append(owner)
+        fields = FIELDS[cls]
+        for column in range(COLUMNS):
+            if column >= len(fields):
+                value = NONE
+            elif fields[column] == "op":
+                value = self.add_string(block.op.value)
+            else:
+                value = self.add_string(getattr(block, fields[column]))
+            self.columns[column].append(value)
+        self.body_start.append(NONE)
+        self.body_len.append(0)
+        self.param_start.append(NONE)
+        self.param_len.append(0)
+        if isinstance(block, Function):
+            self.param_start[index] = len(self.param_names)
+            self.param_len[index] = len(block.params)
+            for name, type in block.params.items():
+                self.param_names.append(self.add_string(name))
+                self.param_types.append(self.add_string(type))
+            body = [self.add(statement, index) for statement in block.connections]
+            self.body_start[index] = len(self.body)
+            self.body_len[index] = len(body)
+            self.body.extend(body)
+        return index
+
+    def get(self, index):
+        view = self._views.get(index)
+        if view is not None:
+            return view
+        view = VIEWS[self.kind[index]].__new__(VIEWS[self.kind[index]])
+        view._store = self
+        view._index = index
+        view._code = None
+        self._views[index] = view
+        if isinstance(view, Function):
+            # Containers are materialized once per view, scalar fields stay in the columns.
+            # They are read-only: the shared arrays cannot grow in place, so edits would be lost with the view
+            start = self.param_start[index]
+            view.params = MappingProxyType({
+                self.strings[self.param_names[i]]: self.strings[self.param_types[i]]
+                for i in range(start, start + self.param_len[index])
+            })
+            start = self.body_start[index]
+            view.connections = StoredStatementList(self.get(i) for i in self.body[start:start + self.body_len[index]])
+        return view
+
+    def nbytes(self):
+        arrays = (self.kind, self.owner, self.body_start, self.body_len, self.body, self.param_start,
+                  self.param_len, self.param_types, self.param_names) + self.columns
+        return sum(a.itemsize * len(a) for a in arrays)
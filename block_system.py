@@ -1,29 +1,56 @@
+import sys
+import itertools
+import weakref
 from enum import Enum
 
 
+def intern_name(value):
+    # Types and identifiers repeat across thousands of blocks, keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class Block:
+    __slots__ = ("owner", "_code", "__weakref__")
+
     def __init__(self):
-        self.connections = []
         self.owner = None
-        self.outgoing_connections = []
-        self.incoming_connections = []
+        self._code = None
+
+    def mark_dirty(self):
+        # Drop the cached fragment and invalidate the owning function
+        self._code = None
+        if self.owner is not None:
+            self.owner.mark_dirty()
 
     def generate_code(self) -> str:
+        if self._code is None:
+            self._code = self.render()
+        return self._code
+
+    def render(self) -> str:
         return ""
 
+    def emit(self, out):
+        # Stream the fragment into any text sink with a write() method
+        out.write(self._code if self._code is not None else self.render())
+
 
 class BlockWithType(Block):
+    __slots__ = ("type",)
+
     def __init__(self, type=None):
         super().__init__()
-        self.type = type
+        self.type = intern_name(type)
 
 
 class ReturnBlock(Block):
+    __slots__ = ("expression",)
+
     def __init__(self, expression=""):
         super().__init__()
         self.expression = expression
 
-    def generate_code(self) -> str:
+    def render(self) -> str:
         return f"return {self.expression};\n"
 
 
@@ -42,59 +69,344 @@ class Operation(Enum):
 
 
 class AssignmentBlock(Block):
+    __slots__ = ("var_name", "expression")
+
     def __init__(self, var_name, expression):
         super().__init__()
-        self.var_name = var_name
+        self.var_name = intern_name(var_name)
         self.expression = expression
 
-    def generate_code(self) -> str:
+    def render(self) -> str:
         return f"{self.var_name} = {self.expression};\n"
 
 
 class ExpressionBlock(Block):
+    # Operands are nested ExpressionBlocks or strings: a variable name or a literal
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op: Operation, right):
         super().__init__()
-        self.left = left
+        self.left = intern_name(left)
         self.op = op
-        self.right = right
+        self.right = intern_name(right)
 
-    def generate_code(self) -> str:
+    def render(self) -> str:
+        # Nested operands format through __str__, i.e. their own cached fragment
         return f"({self.left} {self.op.value} {self.right})"
 
+    def __str__(self):
+        return self.generate_code()
+
+
+# Structurally identical expressions share one node; children are shared too, so identity compares them
+_expressions = weakref.WeakValueDictionary()
+
+
+def make_expression(left, op, right):
+    """Общий (hash-consed) узел выражения; такие узлы не изменяются после создания"""
+    key = (intern_name(left), op, intern_name(right))
+    node = _expressions.get(key)
+    if node is None:
+        node = ExpressionBlock(left, op, right)
+        _expressions[key] = node
+    return node
+
 
 class VariableBlock(BlockWithType):
+    __slots__ = ("name", "value")
+
     def __init__(self, type, name, value=None):
         super().__init__(type)
-        self.name = name
+        self.name = intern_name(name)
         self.value = value
 
-    def generate_code(self) -> str:
+    def render(self) -> str:
         if self.value is not None:
             return f"{self.type} {self.name} = {self.value};\n"
         return f"{self.type} {self.name};\n"
 
 
+class StatementList:
+    """Тело функции: связный список операторов с O(1) вставкой и удалением"""
+
+    def __init__(self, items=(), function=None):
+        # Statements linked in get it as their owner, and every change invalidates its cached code
+        self._function = function
+        self._next = {}
+        self._prev = {}
+        self._head = None
+        self._tail = None
+        # Cached number of statements per block class, e.g. for the single-return check
+        self._counts = {}
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._next)
+
+    def __iter__(self):
+        item = self._head
+        while item is not None:
+            # Read the link first so the current item may be removed while iterating
+            following = self._next[item]
+            yield item
+            item = following
+
+    def __reversed__(self):
+        item = self._tail
+        while item is not None:
+            preceding = self._prev[item]
+            yield item
+            item = preceding
+
+    def __contains__(self, item):
+        return item in self._next
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("statement index out of range")
+        # Walk from the nearer end
+        if index < len(self) // 2:
+            items, steps = iter(self), index
+        else:
+            items, steps = reversed(self), len(self) - 1 - index
+        for _ in range(steps):
+            next(items)
+        return next(items)
+
+    def __eq__(self, other):
+        if isinstance(other, (StatementList, list)):
+            return len(self) == len(other) and all(a is b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"StatementList({list(self)!r})"
+
+    def _link(self, item, prev, next):
+        if item in self._next:
+            raise ValueError("statement is already in the list")
+        self._prev[item] = prev
+        self._next[item] = next
+        if prev is None:
+            self._head = item
+        else:
+            self._next[prev] = item
+        if next is None:
+            self._tail = item
+        else:
+            self._prev[next] = item
+        self._counts[type(item)] = self._counts.get(type(item), 0) + 1
+        if self._function is not None:
+            item.owner = self._function
+            self._function.mark_dirty()
+
+    def append(self, item):
+        self._link(item, self._tail, None)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def insert_after(self, ref, items):
+        # ref=None inserts at the front; items keep their order
+        prev = ref
+        for item in items:
+            self._link(item, prev, self._head if prev is None else self._next[prev])
+            prev = item
+
+    def insert(self, index, item):
+        if index >= len(self):
+            self.append(item)
+        elif index <= 0:
+            self.insert_after(None, [item])
+        else:
+            self.insert_after(self[index - 1], [item])
+
+    def remove(self, item):
+        if item not in self._next:
+            raise ValueError("statement is not in the list")
+        prev = self._prev.pop(item)
+        next = self._next.pop(item)
+        if prev is None:
+            self._head = next
+        else:
+            self._next[prev] = next
+        if next is None:
+            self._tail = prev
+        else:
+            self._prev[next] = prev
+        self._counts[type(item)] -= 1
+        self._release(item)
+
+    def _release(self, item):
+        if self._function is not None:
+            # A statement already moved to another function keeps its new owner
+            if item.owner is self._function:
+                item.owner = None
+            self._function.mark_dirty()
+
+    def index(self, item):
+        if item not in self._next:
+            raise ValueError("statement is not in the list")
+        for position, current in enumerate(self):
+            if current is item:
+                return position
+
+    def clear(self):
+        for item in self._next:
+            self._release(item)
+        self._next.clear()
+        self._prev.clear()
+        self._head = self._tail = None
+        self._counts.clear()
+
+    def reset(self, items):
+        self.clear()
+        self.extend(items)
+
+    def copy(self):
+        return list(self)
+
+    def count_of(self, cls):
+        return sum(count for type, count in self._counts.items() if issubclass(type, cls))
+
+
 class Function(BlockWithType):
-    def __init__(self, type, name, params=dict()):
+    __slots__ = ("name", "params", "connections")
+
+    def __init__(self, type, name, params=None):
         super().__init__(type)
-        self.name = name
-        self.params = params
+        self.name = intern_name(name)
+        self.params = {}
+        self.connections = StatementList(function=self)
+        if params:
+            for param_name, param_type in params.items():
+                self.params[intern_name(param_name)] = intern_name(param_type)
 
     def set_type(self, type):
-        self.type = type
+        self.type = intern_name(type)
+        self.mark_dirty()
 
     def set_name(self, name):
-        self.name = name
+        self.name = intern_name(name)
+        self.mark_dirty()
 
     def add_param(self, type, name):
-        self.params[name] = type
+        self.params[intern_name(name)] = intern_name(type)
+        self.mark_dirty()
 
     def get_body(self) -> str:
+        # Fragments are cached per block, so only edited statements are re-rendered
         return "".join(conn.generate_code() for conn in self.connections)
 
-    def generate_code(self) -> str:
+    def get_signature(self) -> str:
         params_code = ", ".join(f"{t} {n}" for n, t in self.params.items())
-        code = f"{self.type} {self.name}({params_code}) {{\n"
-        code += self.get_body()
-        code += "}\n"
-        return code
\ No newline at end of file
+        return f"{self.type} {self.name}({params_code})"
+
+    def render(self) -> str:
+        return function_text(self.get_signature(), self.get_body())
+
+    def emit(self, out):
+        if self._code is not None:
+            out.write(self._code)
+            return
+        # Write statement by statement instead of building the whole body in memory
+        out.write(f"{self.get_signature()} {{\n")
+        for conn in self.connections:
+            conn.emit(out)
+        out.write("}\n")
+
+
+def function_text(signature, body):
+    return f"{signature} {{\n{body}}}\n"
+
+
+def emit_program(functions, out, separator="\n\n", declarations=()):
+    """Потоково записывает код нескольких функций в out"""
+    # Prototypes first, for functions used before their definition
+    for func in declarations:
+        out.write(f"{func.get_signature()};\n")
+    if declarations:
+        out.write("\n")
+    first = True
+    for func in functions:
+        if not first:
+            out.write(separator)
+        func.emit(out)
+        first = False
+
+
+class EdgeTable:
+    """Центральная таблица связей между блоками"""
+
+    def __init__(self):
+        self.edges = {}
+        # block -> {edge id: None}, dicts keep insertion order and give O(1) removal
+        self.by_source = {}
+        self.by_target = {}
+        # edge id -> canvas line item, only while the line is drawn
+        self.lines = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def __contains__(self, edge):
+        return edge in self.edges
+
+    def add(self, source, target):
+        edge = next(self._ids)
+        self.edges[edge] = (source, target)
+        self.by_source.setdefault(source, {})[edge] = None
+        self.by_target.setdefault(target, {})[edge] = None
+        return edge
+
+    def remove(self, edge):
+        ends = self.edges.pop(edge, None)
+        if ends is None:
+            return None
+        source, target = ends
+        self._discard(self.by_source, source, edge)
+        self._discard(self.by_target, target, edge)
+        self.lines.pop(edge, None)
+        return ends
+
+    def _discard(self, index, block, edge):
+        edges = index.get(block)
+        if edges is not None:
+            edges.pop(edge, None)
+            if not edges:
+                del index[block]
+
+    def outgoing(self, block):
+        return list(self.by_source.get(block, ()))
+
+    def incoming(self, block):
+        return list(self.by_target.get(block, ()))
+
+    def edges_of(self, block):
+        return self.outgoing(block) + self.incoming(block)
+
+    def targets(self, block):
+        return [self.edges[edge][1] for edge in self.by_source.get(block, ())]
+
+    def sources(self, block):
+        return [self.edges[edge][0] for edge in self.by_target.get(block, ())]
+
+    def chain(self, start):
+        # Statements wired one after another starting from start (a Function for its body)
+        blocks = []
+        seen = {start}
+        block = start
+        while True:
+            edges = self.by_source.get(block)
+            if not edges:
+                return blocks
+            block = self.edges[next(iter(edges))][1]
+            if block in seen:
+                return blocks
+            seen.add(block)
+            blocks.append(block)
@@ -0,0 +1,284 @@
+import hashlib
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+EXE_SUFFIX = ".exe" if sys.platform == "win32" else ""
+DEFAULT_FLAGS = ("-O2", "-std=c++17")
+# How often a running process is polled for cancellation, in seconds
+POLL_INTERVAL = 0.1
+RUN_TIMEOUT = 10
+HEADER_NAME = "program.h"
+# Lists the units written by the last export, so units of deleted functions can be cleaned up
+MANIFEST_NAME = "units.txt"
+OBJECT_SUFFIX = ".obj" if sys.platform == "win32" else ".o"
+# Compiler and flags the objects and the executable in the directory were built with
+STAMP_NAME = "build.txt"
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+def default_compiler():
+    compiler = os.environ.get("CXX")
+    if compiler:
+        return compiler
+    for name in ("g++", "clang++", "c++"):
+        if shutil.which(name):
+            return name
+    return "g++"
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cpp_blocks", "builds")
+
+
+def build_key(source, compiler, flags):
+    # Content address: the same source built by the same compiler with the same flags is the same binary
+    digest = hashlib.sha256()
+    for part in (compiler, *flags):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """Кэш собранных программ по хэшу исходника, компилятора и флагов"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or default_cache_dir()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + EXE_SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        return path if os.path.isfile(path) else None
+
+    def put(self, key, executable):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Replace is atomic, so a concurrent build never sees a half-written binary
+        staged = f"{path}.{os.getpid()}.tmp"
+        shutil.copy2(executable, staged)
+        os.replace(staged, path)
+        return path
+
+
+class Builder:
+    """Сборка и запуск сгенерированного кода локальным компилятором"""
+
+    def __init__(self, compiler=None, flags=DEFAULT_FLAGS, cache=None):
+        self.compiler = compiler or default_compiler()
+        self.flags = tuple(flags)
+        self.cache = cache or BuildCache()
+
+    def build(self, source, report=None, cancelled=None):
+        report = report or (lambda stage, message: None)
+        key = build_key(source, self.compiler, self.flags)
+        cached = self.cache.get(key)
+        if cached is not None:
+            report("cached", cached)
+            return cached
+        with tempfile.TemporaryDirectory(prefix="cpp_blocks_") as workspace:
+            source_path = os.path.join(workspace, "program.cpp")
+            output_path = os.path.join(workspace, "program" + EXE_SUFFIX)
+            with open(source_path, "w", encoding="utf-8") as out:
+                out.write(source)
+            command = [self.compiler, *self.flags, source_path, "-o", output_path]
+            report("compile", " ".join(command))
+            returncode, output = run_process(command, cancelled)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command, output)
+            if output:
+                report("output", output)
+            return self.cache.put(key, output_path)
+
+    def build_units(self, header, units, directory, report=None, cancelled=None, workers=None):
+        report = report or (lambda stage, message: None)
+        export_units(header, units, directory)
+        header_path = os.path.join(directory, HEADER_NAME)
+        # Objects built by another compiler or with other flags are rebuilt, whatever their mtimes
+        settings = "\n".join((self.compiler, *self.flags)) + "\n"
+        stamp = os.path.join(directory, STAMP_NAME)
+        rebuild = read_text(stamp) != settings
+        objects = []
+        commands = []
+        for name in units:
+            source = os.path.join(directory, name)
+            target = os.path.splitext(source)[0] + OBJECT_SUFFIX
+            objects.append(target)
+            if rebuild or is_stale(target, source, header_path):
+                commands.append([self.compiler, *self.flags, "-c", source, "-o", target])
+        report("compile", f"{len(commands)} of {len(units)} units changed")
+        if commands:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(compile_unit, command): command for command in commands}
+                failures = []
+                for done, future in enumerate(as_completed(futures), start=1):
+                    if cancelled is not None and cancelled.is_set():
+                        pool.shutdown(cancel_futures=True)
+                        raise BuildCancelled()
+                    returncode, output = future.result()
+                    command = futures[future]
+                    report("progress", (done, len(commands)))
+                    if output:
+                        report("output", output)
+                    if returncode != 0:
+                        failures.append(subprocess.CalledProcessError(returncode, command, output))
+                        # Drop a partial object so the next build compiles the unit again
+                        if os.path.exists(command[-1]):
+                            os.remove(command[-1])
+                if failures:
+                    raise subprocess.CalledProcessError(failures[0].returncode, failures[0].cmd,
+                                                        "".join(e.output or "" for e in failures))
+        executable = os.path.join(directory, "program" + EXE_SUFFIX)
+        if rebuild or is_stale(executable, *objects):
+            command = [self.compiler, *self.flags, *objects, "-o", executable]
+            report("link", " ".join(command))
+            returncode, output = run_process(command, cancelled)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command, output)
+        # Only written once everything matches it; an interrupted build starts over next time
+        write_if_changed(stamp, settings)
+        return executable
+
+    def run(self, executable, report=None, cancelled=None, timeout=RUN_TIMEOUT):
+        report = report or (lambda stage, message: None)
+        report("run", executable)
+        return run_process([executable], cancelled, timeout)
+
+
+def render_units(functions):
+    """Исходники по одному на функцию и общий заголовок с прототипами"""
+    header = ["#pragma once\n\n"]
+    units = {}
+    for func in functions:
+        header.append(f"{func.get_signature()};\n")
+        name = unit_name(func.name, units)
+        units[name] = f'#include "{HEADER_NAME}"\n\n{func.generate_code()}'
+    return "".join(header), units
+
+
+def unit_name(name, taken):
+    stem = re.sub(r"[^A-Za-z0-9_]", "_", name or "") or "function"
+    candidate = f"{stem}.cpp"
+    index = 1
+    while candidate in taken:
+        index += 1
+        candidate = f"{stem}_{index}.cpp"
+    return candidate
+
+
+def read_text(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(path, text):
+    # Unchanged files keep their mtime, which is what the rebuild check below relies on
+    if read_text(path) == text:
+        return False
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(text)
+    return True
+
+
+def export_units(header, units, directory):
+    os.makedirs(directory, exist_ok=True)
+    changed = [name for name, text in units.items() if write_if_changed(os.path.join(directory, name), text)]
+    header_changed = write_if_changed(os.path.join(directory, HEADER_NAME), header)
+    manifest = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            for name in f.read().split():
+                if name not in units:
+                    for path in (name, os.path.splitext(name)[0] + OBJECT_SUFFIX):
+                        if os.path.exists(os.path.join(directory, path)):
+                            os.remove(os.path.join(directory, path))
+    write_if_changed(manifest, "\n".join(sorted(units)) + "\n")
+    return changed, header_changed
+
+
+def is_stale(target, *sources):
+    if not os.path.exists(target):
+        return True
+    mtime = os.path.getmtime(target)
+    return any(os.path.getmtime(source) > mtime for source in sources)
+
+
+def compile_unit(command):
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return result.returncode, result.stdout
+
+
+def run_process(command, cancelled=None, timeout=None):
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    waited = 0.0
+    while True:
+        try:
+            output, _ = process.communicate(timeout=POLL_INTERVAL)
+            return process.returncode, output
+        except subprocess.TimeoutExpired:
+            waited += POLL_INTERVAL
+            if (cancelled is not None and cancelled.is_set()) or (timeout is not None and waited >= timeout):
+                process.kill()
+                process.communicate()
+                if cancelled is not None and cancelled.is_set():
+                    raise BuildCancelled()
+                raise subprocess.TimeoutExpired(command, timeout)
+
+
+class BuildJob:
+    """Сборка и запуск в фоновом потоке; события передаются через очередь"""
+
+    def __init__(self, builder, build, run=True):
+        self.builder = builder
+        # Called on the worker thread as build(report, cancelled) and returns the executable
+        self.build = build
+        self.run_after_build = run
+        # (stage, message) tuples, read by the UI thread
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def _report(self, stage, message):
+        self.events.put((stage, message))
+
+    def _work(self):
+        try:
+            executable = self.build(self._report, self.cancelled)
+            if self.run_after_build:
+                returncode, output = self.builder.run(executable, self._report, self.cancelled)
+                self._report("finished", (returncode, output))
+            else:
+                self._report("finished", (0, ""))
+        except BuildCancelled:
+            self._report("cancelled", "")
+        except subprocess.CalledProcessError as e:
+            self._report("failed", e.output or str(e))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self._report("failed", str(e))
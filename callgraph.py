@@ -0,0 +1,111 @@
+import re
+import weakref
+
+from block_system import *
+
+
+# A name followed by "(": calls, but also functional casts such as int(x), which simply match no function
+CALL = re.compile(r"\b([A-Za-z_]\w*)\s*\(")
+
+
+def calls_in(code):
+    # Called names in order of first appearance
+    return tuple(dict.fromkeys(CALL.findall(code)))
+
+
+class CallGraph:
+    """Индекс вызовов между функциями.
+
+    Вызовы ищутся в коде операторов (значения VariableBlock, выражения AssignmentBlock
+    и ReturnBlock) и запоминаются вместе с кэшированным фрагментом: пока фрагмент тот же
+    объект, блок не менялся и повторно не просматривается.
+    """
+
+    def __init__(self):
+        # func -> (its cached code when scanned, called names); block -> the same per statement
+        self._functions = weakref.WeakKeyDictionary()
+        self._statements = weakref.WeakKeyDictionary()
+
+    def calls(self, func):
+        text = func.generate_code()
+        entry = self._functions.get(func)
+        if entry is not None and entry[0] is text:
+            return entry[1]
+        names = {}
+        for block in func.connections:
+            code = block.generate_code()
+            scanned = self._statements.get(block)
+            if scanned is None or scanned[0] is not code:
+                scanned = (code, calls_in(code))
+                self._statements[block] = scanned
+            names.update(dict.fromkeys(scanned[1]))
+        names = tuple(names)
+        self._functions[func] = (text, names)
+        return names
+
+    def edges(self, functions):
+        # Names are resolved on every query, so renaming a function needs no rescan of its callers
+        by_name = {}
+        for func in functions:
+            by_name.setdefault(func.name, []).append(func)
+        return {func: [callee for name in self.calls(func) for callee in by_name.get(name, ())] for func in functions}
+
+    def program(self, functions, entry="main"):
+        """Прототипы и определения: только функции, достижимые из entry, вызываемые раньше вызывающих.
+
+        Без entry (или если такой функции нет) в программу входят все функции.
+        """
+        functions = list(functions)
+        graph = self.edges(functions)
+        roots = [func for func in functions if func.name == entry] if entry else []
+        declarations = []
+        definitions = []
+        for component in strongly_connected(roots or functions, graph):
+            # Mutually recursive functions cannot all be defined before each other
+            if len(component) > 1:
+                declarations.extend(component)
+            definitions.extend(component)
+        return declarations, definitions
+
+
+def strongly_connected(roots, graph):
+    # Iterative Tarjan: a component is produced only after every component it reaches,
+    # so the concatenated components list callees before their callers
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in roots:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph[child])))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component[::-1])
+    return components
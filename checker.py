@@ -0,0 +1,300 @@
+import operator
+
+from block_system import *
+from optimizer import IDENTIFIER, expression_of, leading_name
+
+
+ERROR = "error"
+WARNING = "warning"
+# Functions that may fall off the end without a return statement
+IMPLICIT_RETURN = ("main",)
+
+
+class Facts:
+    """Что оператор объявляет, присваивает и читает; вычисляется заново только после правки"""
+
+    __slots__ = ("declares", "type", "assigns", "reads", "returns_value", "names")
+
+    def __init__(self, block):
+        self.declares = None
+        self.type = None
+        self.assigns = None
+        self.reads = ()
+        self.returns_value = False
+        if isinstance(block, VariableBlock):
+            self.declares = leading_name(block.name)
+            self.type = block.type
+            if block.value is not None:
+                self.reads = reads_of(block.value)
+        elif isinstance(block, AssignmentBlock):
+            # Only plain variables are checked; element and pointer targets are left to the compiler
+            if IDENTIFIER.fullmatch(block.var_name or ""):
+                self.assigns = block.var_name
+            self.reads = reads_of(block.expression)
+        elif isinstance(block, ReturnBlock):
+            self.returns_value = bool(str(block.expression or "").strip())
+            self.reads = reads_of(block.expression)
+        self.names = {self.declares, self.assigns, *self.reads} - {None}
+
+
+def reads_of(value):
+    if value is None:
+        return ()
+    expression = expression_of(value)
+    # Unparsed text (calls, casts, floats...) mentions names that are not variables, so it is not checked
+    return tuple(sorted(expression.reads)) if expression.pure else ()
+
+
+class FunctionState:
+    __slots__ = ("text", "signature", "body", "codes", "facts", "declarations", "users", "returns", "unreachable",
+                 "statement_issues", "issues")
+
+    def __init__(self):
+        self.text = None
+        self.signature = None
+        # Statements and their cached code as of the last check, in body order
+        self.body = []
+        self.codes = []
+        self.facts = {}
+        # name -> list of (type, declaring block); the function itself stands for its parameters
+        self.declarations = {}
+        # name -> statements that declare, assign or read it
+        self.users = {}
+        self.returns = set()
+        self.unreachable = []
+        # Issues of each statement on its own, and the final per block issues shown as badges
+        self.statement_issues = {}
+        self.issues = {}
+
+    def index(self, block, fact, add):
+        for name in fact.names:
+            users = self.users.setdefault(name, set())
+            if add:
+                users.add(block)
+            else:
+                users.discard(block)
+        if fact.declares is not None:
+            declarations = self.declarations.setdefault(fact.declares, [])
+            if add:
+                declarations.append((fact.type, block))
+            else:
+                declarations.remove((fact.type, block))
+        if isinstance(block, ReturnBlock):
+            if add:
+                self.returns.add(block)
+            else:
+                self.returns.discard(block)
+
+
+class Checker:
+    """Инкрементальная семантическая проверка: таблица символов на функцию.
+
+    Функция проверяется заново, только если изменился её код; внутри неё заново
+    проверяются изменённые операторы и те, что используют имена с изменившимися объявлениями.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def issues_of(self, block):
+        func = block if isinstance(block, Function) else block.owner
+        state = self.states.get(func)
+        return state.issues.get(block, ()) if state is not None else ()
+
+    def update(self, functions):
+        """Проверяет изменившиеся функции; возвращает {блок: проблемы} для блоков, чьи проблемы изменились"""
+        changes = {}
+        live = set(functions)
+        for func in [func for func in self.states if func not in live]:
+            for block in self.states.pop(func).issues:
+                changes.setdefault(block, ())
+        for func in functions:
+            self.check_function(func, changes)
+        return changes
+
+    def check_function(self, func, changes):
+        state = self.states.get(func)
+        if state is None:
+            state = self.states[func] = FunctionState()
+        elif func._code is not None and func._code is state.text:
+            return
+        # Everything below the walk is proportional to the edit, not to the function
+        body = list(func.connections)
+        codes = list(map(CACHED_CODE, body))
+        # Only edited statements have lost their cached code; list.index finds them without a Python loop
+        i = -1
+        while True:
+            try:
+                i = codes.index(None, i + 1)
+            except ValueError:
+                break
+            codes[i] = body[i].generate_code()
+        text = func._code
+        if text is None:
+            # The text Function.render() would build, so the generator finds it cached too
+            text = func._code = function_text(func.get_signature(), "".join(codes))
+        signature = (func.type, tuple(func.params.items()))
+
+        # Statements outside the changed span keep their order relative to everything else
+        prefix, suffix = common_ends(state.body, body)
+        old_end, end = len(state.body) - suffix, len(body) - suffix
+        moved = body[prefix:end]
+        old_codes = dict(zip(state.body[prefix:old_end], state.codes[prefix:old_end]))
+        kept = set(moved)
+        removed = [block for block in state.body[prefix:old_end] if block not in kept]
+        added = [block for block in moved if block not in old_codes]
+        edited = [block for block, code in zip(moved, codes[prefix:end]) if old_codes.get(block, code) is not code]
+        for start, old_start, stop in ((0, 0, prefix), (end, old_end, len(body))):
+            edited += [block for block, code, old in zip(body[start:stop], codes[start:stop], state.codes[old_start:])
+                       if code is not old]
+
+        # Update the symbol table with what the changed statements declare now
+        changed_names = set()
+        old_params = dict(state.signature[1]) if state.signature else {}
+        for name in old_params.keys() | func.params.keys():
+            if old_params.get(name) != func.params.get(name):
+                changed_names.add(name)
+                declarations = state.declarations.setdefault(name, [])
+                if name in old_params:
+                    declarations.remove((old_params[name], func))
+                if name in func.params:
+                    declarations.insert(0, (func.params[name], func))
+        for block in removed:
+            fact = state.facts.pop(block)
+            state.index(block, fact, False)
+            changed_names.add(fact.declares)
+            state.statement_issues.pop(block, None)
+        for block in edited + added:
+            old = state.facts.get(block)
+            if old is not None:
+                state.index(block, old, False)
+            fact = state.facts[block] = Facts(block)
+            state.index(block, fact, True)
+            # Users of a name only need a re-check when what declares it changed
+            if old is None or (old.declares, old.type) != (fact.declares, fact.type):
+                changed_names.add(fact.declares)
+                if old is not None:
+                    changed_names.add(old.declares)
+        for block in moved:
+            # A moved declaration changes which declaration comes first for every user of its name
+            changed_names.add(state.facts[block].declares)
+        changed_names.discard(None)
+
+        positions = dict(zip(body, range(len(body))))
+        if signature[0] != (state.signature or (None,))[0]:
+            # The return type changed: every return statement is re-checked, and simply everything with it
+            affected = body
+        else:
+            affected = set(edited)
+            affected.update(moved)
+            for name in changed_names:
+                affected.update(state.users.get(name, ()))
+        dirty = set(affected)
+        for block in affected:
+            found = check_statement(func, block, state.facts[block], positions, state.declarations)
+            state.statement_issues[block] = found
+
+        # Function level: statements after the first return are unreachable
+        first_return = min((positions[block] for block in state.returns), default=len(body))
+        unreachable = body[first_return + 1:]
+        dirty.update(removed)
+        dirty.update(state.unreachable)
+        dirty.update(unreachable)
+        dirty.add(func)
+        found_by_block = {}
+        for block in dirty:
+            if block is func:
+                if not state.returns and func.type != "void" and func.name not in IMPLICIT_RETURN:
+                    found_by_block[func] = ((WARNING, f"no return statement in a function returning {func.type}"),)
+                continue
+            position = positions.get(block)
+            if position is None:
+                continue
+            found = state.statement_issues[block]
+            if position > first_return:
+                found = found + ((WARNING, "unreachable: comes after the return"),)
+            if found:
+                found_by_block[block] = found
+        for block in dirty:
+            found = found_by_block.get(block, ())
+            if state.issues.get(block, ()) != found:
+                changes[block] = found
+                if found:
+                    state.issues[block] = found
+                else:
+                    del state.issues[block]
+        state.text = text
+        state.signature = signature
+        state.body = body
+        state.codes = codes
+        state.unreachable = unreachable
+
+
+CACHED_CODE = operator.attrgetter("_code")
+
+
+def common_ends(old, new):
+    """Длины общего начала и общего конца двух списков, без пересечения"""
+    # Binary search over slice comparisons: list equality runs in C and short-cuts on identity
+    def common(old, new):
+        low, high = 0, min(len(old), len(new))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if old[:middle] == new[:middle]:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    if old == new:
+        return len(old), 0
+    prefix = common(old, new)
+    return prefix, common(old[prefix:][::-1], new[prefix:][::-1])
+
+
+def check_statement(func, block, fact, positions, declarations):
+    position = positions[block]
+    issues = []
+
+    def declaration_before(name):
+        # Parameters come before every statement, then the earliest declaring statement wins
+        earliest = None
+        for type, declaring in declarations.get(name, ()):
+            if declaring is func:
+                return type, declaring
+            at = positions[declaring]
+            if at < position and (earliest is None or at < earliest[0]):
+                earliest = at, type, declaring
+        return earliest[1:] if earliest is not None else None
+
+    def undeclared(name, verb):
+        if declarations.get(name):
+            return (ERROR, f"'{name}' is {verb} before its declaration")
+        return (ERROR, f"'{name}' is not declared")
+
+    if fact.declares is not None:
+        earlier = declaration_before(fact.declares)
+        if earlier is not None:
+            type, declaring = earlier
+            where = "a parameter" if declaring is func else "already declared"
+            if type != fact.type:
+                issues.append((ERROR, f"'{fact.declares}' redeclared as {fact.type}, {where} of type {type}"))
+            else:
+                issues.append((ERROR, f"'{fact.declares}' is {where}"))
+    if fact.assigns is not None:
+        earlier = declaration_before(fact.assigns)
+        if earlier is None:
+            issues.append(undeclared(fact.assigns, "assigned"))
+        elif earlier[0].split()[:1] == ["const"]:
+            issues.append((ERROR, f"'{fact.assigns}' is const and cannot be assigned"))
+    for name in fact.reads:
+        if name != fact.declares and declaration_before(name) is None:
+            issues.append(undeclared(name, "used"))
+        elif name == fact.declares:
+            issues.append((ERROR, f"'{name}' is used in its own initializer"))
+    if isinstance(block, ReturnBlock):
+        if fact.returns_value and func.type == "void":
+            issues.append((ERROR, "void function returns a value"))
+        elif not fact.returns_value and func.type != "void":
+            issues.append((ERROR, f"return without a value in a function returning {func.type}"))
+    return tuple(issues)
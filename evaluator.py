@@ -0,0 +1,187 @@
+from block_system import *
+from optimizer import Statement, c_div
+
+
+# Declared C++ type -> conversion applied on every store, so stored values keep C++ semantics
+CONVERSIONS = {
+    "int": "_int", "long": "_int", "long long": "_int",
+    # Narrow types wrap to their width, as stores to them do in C++ (char is signed here, as on x86)
+    "short": "_short", "char": "_char",
+    "float": "_float", "double": "_float",
+    "bool": "_bool",
+}
+OPERATORS = {"+": "+", "-": "-", "*": "*", "==": "==", "!=": "!=", ">": ">", "<": "<", ">=": ">=", "<=": "<="}
+COMPARISONS = ("==", "!=", ">", "<", ">=", "<=")
+
+
+class EvaluationError(Exception):
+    pass
+
+
+def _div(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return c_div(a, b)
+    return a / b
+
+
+def _mod(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a - b * c_div(a, b)
+    # C++ fmod keeps the sign of the dividend
+    return a - b * int(a / b)
+
+
+def wrap(bits):
+    half = 1 << (bits - 1)
+    return lambda x: (int(x) + half) % (2 * half) - half
+
+
+SCALAR_HELPERS = {"_div": _div, "_mod": _mod, "_int": int, "_short": wrap(16), "_char": wrap(8), "_float": float, "_bool": bool}
+
+
+def numpy_helpers():
+    try:
+        import numpy as np
+    except ImportError:
+        raise EvaluationError("batch evaluation needs numpy") from None
+
+    def is_integral(x):
+        return x.dtype.kind in "iub"
+
+    def check_divisor(b):
+        # Scalar evaluation raises on any zero divisor; numpy would warn and carry on with 0, inf or nan
+        if np.any(b == 0):
+            raise EvaluationError("division by zero")
+
+    def div(a, b):
+        a, b = np.asarray(a), np.asarray(b)
+        check_divisor(b)
+        if is_integral(a) and is_integral(b):
+            quotient = np.abs(a) // np.abs(b)
+            return np.where((a < 0) != (b < 0), -quotient, quotient)
+        return a / b
+
+    def mod(a, b):
+        a, b = np.asarray(a), np.asarray(b)
+        check_divisor(b)
+        if is_integral(a) and is_integral(b):
+            return a - b * div(a, b)
+        return np.fmod(a, b)
+
+    def to_int(x):
+        x = np.asarray(x)
+        return np.trunc(x).astype(np.int64) if x.dtype.kind == "f" else x.astype(np.int64)
+
+    def narrow(dtype):
+        # Wrapped through the narrow type, then widened again so later arithmetic promotes as in C++
+        return lambda x: to_int(x).astype(dtype).astype(np.int64)
+
+    return {
+        "_div": div,
+        "_mod": mod,
+        "_int": to_int,
+        "_short": narrow(np.int16),
+        "_char": narrow(np.int8),
+        "_float": lambda x: np.asarray(x, dtype=np.float64),
+        "_bool": lambda x: np.asarray(x) != 0,
+        # Comparisons count as ints in arithmetic, as in C++, not as numpy's logical bools
+        "_cmp": lambda x: np.asarray(x).astype(np.int64),
+    }
+
+
+def python_name(name):
+    # C++ identifiers may clash with Python keywords and builtins
+    return f"v_{name}"
+
+
+def translate(node, batch):
+    if isinstance(node, int):
+        return str(node)
+    if isinstance(node, str):
+        return python_name(node)
+    if node[0] == "neg":
+        return f"(-{translate(node[1], batch)})"
+    op, left, right = node
+    left, right = translate(left, batch), translate(right, batch)
+    if op == "/":
+        return f"_div({left}, {right})"
+    if op == "%":
+        return f"_mod({left}, {right})"
+    if batch and op in COMPARISONS:
+        return f"_cmp({left} {op} {right})"
+    return f"({left} {OPERATORS[op]} {right})"
+
+
+def convert(type, code):
+    conversion = CONVERSIONS.get(type)
+    return f"{conversion}({code})" if conversion else code
+
+
+def function_source(func, batch=False):
+    params = [python_name(name) for name in func.params]
+    lines = [f"def {python_name(func.name)}({', '.join(params)}):"]
+    for name, type in func.params.items():
+        lines.append(f"    {python_name(name)} = {convert(type, python_name(name))}")
+    types = dict(func.params)
+    for block in func.connections:
+        if isinstance(block, ReturnBlock) and not str(block.expression or "").strip():
+            if func.type != "void":
+                raise EvaluationError(f"return without a value in a function returning {func.type}")
+            lines.append("    return None")
+            break
+        statement = Statement(block)
+        expression = statement.expression
+        if expression is not None and not expression.pure:
+            raise EvaluationError(f"cannot evaluate {block.generate_code().strip()!r}")
+        code = translate(expression.tree, batch) if expression is not None else "0"
+        if isinstance(block, VariableBlock):
+            types[block.name] = block.type
+            lines.append(f"    {python_name(block.name)} = {convert(block.type, code)}")
+        elif isinstance(block, AssignmentBlock):
+            lines.append(f"    {python_name(block.var_name)} = {convert(types.get(block.var_name), code)}")
+        elif isinstance(block, ReturnBlock):
+            lines.append(f"    return {convert(func.type, code)}")
+            # Anything after the return is unreachable
+            break
+        else:
+            lines.append(f"    {code}")
+    else:
+        lines.append("    return None")
+    return "\n".join(lines) + "\n"
+
+
+class CompiledFunction:
+    """Функция, скомпилированная в байткод Python для быстрого многократного вызова"""
+
+    def __init__(self, func, batch=False):
+        self.name = func.name
+        self.params = list(func.params)
+        self.batch = batch
+        self.source = function_source(func, batch)
+        namespace = dict(numpy_helpers() if batch else SCALAR_HELPERS)
+        try:
+            exec(compile(self.source, f"<block function {func.name}>", "exec"), namespace)
+        except SyntaxError as e:
+            raise EvaluationError(str(e)) from None
+        self.call = namespace[python_name(func.name)]
+
+    def __call__(self, *args, **kwargs):
+        if kwargs:
+            args = args + tuple(kwargs[name] for name in self.params[len(args):])
+        try:
+            return self.call(*args)
+        except (ZeroDivisionError, NameError) as e:
+            raise EvaluationError(str(e)) from None
+
+
+def compile_function(func, batch=False):
+    return CompiledFunction(func, batch)
+
+
+def evaluate(func, *args, **kwargs):
+    return compile_function(func)(*args, **kwargs)
+
+
+def evaluate_batch(func, *arrays, **named_arrays):
+    """Один вызов функции над массивами numpy: по значению на каждый элемент"""
+    return compile_function(func, batch=True)(*arrays, **named_arrays)
@@ -0,0 +1,219 @@
+from contextlib import contextmanager
+
+from block_store import KINDS, FIELDS
+
+
+# Undo steps kept; older ones are dropped together with the blocks only they still reference
+MAX_UNDO = 500
+
+
+def field_values(block):
+    cls = next(c for c in KINDS if isinstance(block, c))
+    return tuple(getattr(block, field) for field in FIELDS[cls])
+
+
+def set_field_values(block, values):
+    cls = next(c for c in KINDS if isinstance(block, c))
+    for field, value in zip(FIELDS[cls], values):
+        setattr(block, field, value)
+    block.mark_dirty()
+
+
+# Commands hold references to the blocks they touch instead of copies: untouched blocks are
+# shared with the live model, so a step costs memory in proportion to the edit, not the project.
+# undo()/redo() go through the editor's batch operations, see ScratchApp.restore_blocks and friends.
+
+
+class Command:
+    __slots__ = ()
+
+    def undo(self, editor):
+        raise NotImplementedError
+
+    def redo(self, editor):
+        raise NotImplementedError
+
+
+class CreateBlocks(Command):
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        # (block, x, y) for every new block
+        self.entries = entries
+
+    def undo(self, editor):
+        editor.delete_blocks([block for block, _, _ in self.entries])
+
+    def redo(self, editor):
+        editor.restore_blocks(self.entries)
+
+
+class DeleteBlocks(Command):
+    __slots__ = ("entries", "edges", "indices")
+
+    def __init__(self, entries, edges, indices):
+        self.entries = entries
+        # (source, target) of every line removed along with the blocks
+        self.edges = edges
+        # Position of each block in the editor's block order, parallel to entries
+        self.indices = indices
+
+    def undo(self, editor):
+        editor.restore_blocks(self.entries, self.indices)
+        editor.restore_edges(self.edges)
+
+    def redo(self, editor):
+        editor.delete_blocks([block for block, _, _ in self.entries])
+
+
+class MoveBlocks(Command):
+    __slots__ = ("moves",)
+
+    def __init__(self, moves):
+        # (block, old x, old y, new x, new y)
+        self.moves = moves
+
+    def undo(self, editor):
+        editor.place_blocks([(block, x, y) for block, x, y, _, _ in self.moves])
+
+    def redo(self, editor):
+        editor.place_blocks([(block, x, y) for block, _, _, x, y in self.moves])
+
+
+class Connect(Command):
+    __slots__ = ("edges",)
+
+    def __init__(self, edges):
+        self.edges = edges
+
+    def undo(self, editor):
+        editor.remove_edges(self.edges)
+
+    def redo(self, editor):
+        editor.restore_edges(self.edges)
+
+
+class Disconnect(Connect):
+    __slots__ = ()
+
+    def undo(self, editor):
+        Connect.redo(self, editor)
+
+    def redo(self, editor):
+        Connect.undo(self, editor)
+
+
+class EditBlock(Command):
+    __slots__ = ("block", "before", "after")
+
+    def __init__(self, block, before, after):
+        self.block = block
+        self.before = before
+        self.after = after
+
+    def undo(self, editor):
+        set_field_values(self.block, self.before)
+        editor.refresh_block_text(self.block)
+
+    def redo(self, editor):
+        set_field_values(self.block, self.after)
+        editor.refresh_block_text(self.block)
+
+
+class Batch(Command):
+    __slots__ = ("commands",)
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    def undo(self, editor):
+        for command in reversed(self.commands):
+            command.undo(editor)
+
+    def redo(self, editor):
+        for command in self.commands:
+            command.redo(editor)
+
+
+class History:
+    """Журнал обратимых команд редактора для отмены и повтора"""
+
+    def __init__(self, limit=MAX_UNDO):
+        self.limit = limit
+        self.undo_stack = []
+        self.redo_stack = []
+        self._group = None
+        self._depth = 0
+        # Set while a step is undone or redone, so the editor operations it calls are not recorded again
+        self.applying = False
+        # Called after every recorded, undone or redone step
+        self.on_change = None
+
+    def record(self, command):
+        if self.applying:
+            return
+        if self._group is not None:
+            self._group.append(command)
+            return
+        self.undo_stack.append(command)
+        if len(self.undo_stack) > self.limit:
+            del self.undo_stack[0]
+        self.redo_stack.clear()
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    @contextmanager
+    def group(self):
+        # Everything recorded inside becomes a single undo step
+        if self._depth == 0:
+            self._group = []
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                commands, self._group = self._group, None
+                if len(commands) == 1:
+                    self.record(commands[0])
+                elif commands:
+                    self.record(Batch(commands))
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, editor):
+        if not self.undo_stack:
+            return False
+        command = self.undo_stack.pop()
+        self._apply(command.undo, editor)
+        self.redo_stack.append(command)
+        self.changed()
+        return True
+
+    def redo(self, editor):
+        if not self.redo_stack:
+            return False
+        command = self.redo_stack.pop()
+        self._apply(command.redo, editor)
+        self.undo_stack.append(command)
+        self.changed()
+        return True
+
+    def _apply(self, step, editor):
+        self.applying = True
+        try:
+            step(editor)
+        finally:
+            self.applying = False
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.changed()
@@ -0,0 +1,182 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+# Latency buckets are powers of two in microseconds: bucket i holds durations in [2**(i-1), 2**i)
+HISTOGRAM_BUCKETS = 24
+# Oldest trace events are dropped beyond this, so a long session cannot grow without bound
+MAX_TRACE_EVENTS = 200_000
+
+
+def bucket_of(duration_us):
+    return min(int(duration_us).bit_length(), HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_upper_us(bucket):
+    return 1 << bucket
+
+
+class HandlerStats:
+    """Счётчик вызовов и гистограмма задержек одного обработчика"""
+
+    __slots__ = ("name", "calls", "total_us", "max_us", "histogram")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, duration_us):
+        self.calls += 1
+        self.total_us += duration_us
+        if duration_us > self.max_us:
+            self.max_us = duration_us
+        self.histogram[bucket_of(duration_us)] += 1
+
+    @property
+    def mean_us(self):
+        return self.total_us / self.calls if self.calls else 0.0
+
+    def percentile_us(self, q):
+        # Upper bound of the bucket holding the q-th percentile, capped by the slowest call
+        if not self.calls:
+            return 0.0
+        rank = self.calls * q / 100
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank:
+                return min(float(bucket_upper_us(bucket)), self.max_us)
+        return self.max_us
+
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(histogram):
+    # One character per bucket between the fastest and the slowest call, labelled with its range
+    used = [i for i, count in enumerate(histogram) if count]
+    if not used:
+        return ""
+    low, high = used[0], used[-1]
+    peak = max(histogram)
+    bars = "".join(SPARK[(len(SPARK) - 1) * count // peak] if count else " " for count in histogram[low:high + 1])
+    return f"<{bucket_upper_us(low)}µs {bars} <{bucket_upper_us(high)}µs"
+
+
+class Profiler:
+    """Включаемая по требованию запись горячих обработчиков редактора.
+
+    Пока профилировщик выключен, методы классов остаются исходными и ничего не стоят;
+    enable() подменяет их обёртками, disable() возвращает на место. Вызовы считаются парами:
+    запись идёт, пока хотя бы один включивший её не вызвал disable().
+    """
+
+    def __init__(self):
+        self.targets = []
+        self.originals = {}
+        self.stats = {}
+        self.counters = {}
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self.origin = time.perf_counter()
+        self.users = 0
+
+    @property
+    def enabled(self):
+        return self.users > 0
+
+    def watch(self, cls, *names):
+        # Register methods to wrap while enabled; the span name is Class.method
+        for name in names:
+            self.targets.append((cls, name))
+        if self.enabled:
+            for name in names:
+                self.wrap(cls, name)
+
+    def wrap(self, cls, name):
+        if (cls, name) in self.originals:
+            return
+        # Remember whether the method was defined on this class or inherited from a base
+        own = cls.__dict__.get(name)
+        method = getattr(cls, name)
+        self.originals[cls, name] = own
+        span = f"{cls.__name__}.{name}"
+        stats = self.stats.setdefault(span, HandlerStats(span))
+        events = self.events
+        origin = self.origin
+        clock = time.perf_counter
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                end = clock()
+                duration = (end - start) * 1e6
+                stats.add(duration)
+                events.append((span, (start - origin) * 1e6, duration, threading.get_ident()))
+
+        setattr(cls, name, wrapper)
+
+    def unwrap(self, cls, name):
+        if (cls, name) not in self.originals:
+            return
+        own = self.originals.pop((cls, name))
+        if own is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, own)
+
+    def enable(self):
+        self.users += 1
+        if self.users > 1:
+            return
+        for cls, name in self.targets:
+            self.wrap(cls, name)
+
+    def disable(self):
+        if not self.users:
+            return
+        self.users -= 1
+        if self.users:
+            return
+        for cls, name in reversed(self.targets):
+            self.unwrap(cls, name)
+
+    def sample(self, name, value):
+        # Gauges such as canvas item counts, shown as counter tracks in the trace
+        self.counters[name] = value
+        if self.enabled:
+            self.events.append((name, (time.perf_counter() - self.origin) * 1e6, value, None))
+
+    def reset(self):
+        for stats in self.stats.values():
+            stats.__init__(stats.name)
+        self.counters.clear()
+        self.events.clear()
+
+    def snapshot(self):
+        return sorted((s for s in self.stats.values() if s.calls), key=lambda s: s.total_us, reverse=True)
+
+    def trace_events(self):
+        pid = os.getpid()
+        for name, ts, value, tid in list(self.events):
+            if tid is None:
+                yield {"name": name, "ph": "C", "ts": ts, "pid": pid, "tid": 0, "args": {"count": value}}
+            else:
+                yield {"name": name, "cat": "editor", "ph": "X", "ts": ts, "dur": value, "pid": pid, "tid": tid}
+
+    def export_chrome_trace(self, path):
+        """Сохраняет записанные вызовы в формате Trace Event (chrome://tracing, Perfetto)"""
+        with open(path, "w", encoding="utf-8") as out:
+            json.dump({"traceEvents": list(self.trace_events()), "displayTimeUnit": "ms"}, out)
+
+
+profiler = Profiler()
@@ -1,7 +1,14 @@
+import sys
+
 from block_system import *
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # With arguments: generate code for saved projects, see batch.py
+        import batch
+        sys.exit(batch.main(sys.argv[1:]))
+
     func = Function("int", "main")
     func.add_param("int", "a")
     func.add_param("int", "b")
@@ -11,8 +18,8 @@ if __name__ == '__main__':
     func.connections.append(var_sum)
 
     # Суммируем a и b
-    expr = ExpressionBlock("a", Operation.ADD, "b")
-    assign_sum = AssignmentBlock("sum", expr.generate_code())
+    expr = make_expression("a", Operation.ADD, "b")
+    assign_sum = AssignmentBlock("sum", expr)
     func.connections.append(assign_sum)
 
     # Возвращаем результат
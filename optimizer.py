@@ -0,0 +1,479 @@
+import copy
+import itertools
+import re
+
+from block_system import *
+
+
+# Operator precedence as in C++, higher binds tighter
+PRECEDENCE = {op.value: level for level, ops in enumerate(
+    ((Operation.EQ, Operation.NE),
+     (Operation.GT, Operation.LT, Operation.GE, Operation.LE),
+     (Operation.ADD, Operation.SUB),
+     (Operation.MUL, Operation.DIV, Operation.MOD)), start=1) for op in ops}
+UNARY_PRECEDENCE = 10
+TOKEN = re.compile(r"\s*(?:(\d+)|([A-Za-z_]\w*)|(==|!=|>=|<=|[-+*/%<>()]))")
+IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+# "&x" in unparsed text may take the address of x
+ADDRESS_OF = re.compile(r"&\s*([A-Za-z_]\w*)")
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+# Constants are only propagated through variables of these types: they hold every folded int unchanged
+INTEGRAL_TYPES = frozenset(("int", "long", "long long"))
+PASSES = ("unreachable", "fold", "copy", "dead", "cse")
+# Hoisted subexpressions become "auto <prefix>N" locals
+TEMP_PREFIX = "_t"
+
+
+def leading_name(name):
+    # "buffer[16]" declares buffer
+    match = IDENTIFIER.match(name or "")
+    return match.group() if match else None
+
+
+def is_indirect(type):
+    # References and pointers: stores through them change other variables
+    return "&" in (type or "") or "*" in (type or "")
+
+
+class Expression:
+    """Разобранное выражение: дерево из чисел, имён и кортежей (op, left, right)"""
+
+    __slots__ = ("text", "tree", "reads")
+
+    def __init__(self, text, tree=None):
+        self.text = text
+        self.tree = tree
+        if tree is not None:
+            self.reads = names_in(tree)
+        else:
+            # Unparsed text (calls, casts, floats...): every identifier in it may be read or written
+            self.reads = set(IDENTIFIER.findall(text or ""))
+
+    @property
+    def pure(self):
+        return self.tree is not None
+
+    def __str__(self):
+        return self.text
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None:
+            return None
+        number, name, op = match.groups()
+        tokens.append(int(number) if number is not None else name if name is not None else op)
+        pos = match.end()
+    return tokens
+
+
+def parse_expression(text):
+    tokens = tokenize(text) if text else None
+    if not tokens:
+        return Expression(text)
+    pos = 0
+
+    def primary():
+        nonlocal pos
+        token = tokens[pos] if pos < len(tokens) else None
+        pos += 1
+        if token == "-":
+            return ("neg", primary())
+        if token == "(":
+            node = binary(0)
+            if pos >= len(tokens) or tokens[pos] != ")":
+                raise ValueError(text)
+            pos += 1
+            return node
+        if isinstance(token, int) or (isinstance(token, str) and IDENTIFIER.fullmatch(token)):
+            if pos < len(tokens) and tokens[pos] == "(":
+                # Function call
+                raise ValueError(text)
+            return token
+        raise ValueError(text)
+
+    def binary(min_level):
+        nonlocal pos
+        left = primary()
+        while pos < len(tokens) and PRECEDENCE.get(tokens[pos], 0) > min_level:
+            op = tokens[pos]
+            pos += 1
+            left = (op, left, binary(PRECEDENCE[op]))
+        return left
+
+    try:
+        tree = binary(0)
+    except (ValueError, IndexError):
+        return Expression(text)
+    if pos != len(tokens):
+        return Expression(text)
+    return Expression(text, tree)
+
+
+def expression_of(value):
+    if not isinstance(value, ExpressionBlock):
+        return parse_expression(value)
+    trees = {}
+
+    def convert(node):
+        # Shared (hash-consed) nodes are converted once
+        if not isinstance(node, ExpressionBlock):
+            tree = parse_expression(node).tree
+            if tree is None:
+                raise ValueError(node)
+            return tree
+        tree = trees.get(id(node))
+        if tree is None:
+            tree = trees[id(node)] = (node.op.value, convert(node.left), convert(node.right))
+        return tree
+
+    try:
+        return Expression(str(value), convert(value))
+    except ValueError:
+        return Expression(str(value))
+
+
+def names_in(tree):
+    names = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            names.add(node)
+        elif isinstance(node, tuple):
+            stack.extend(node[1:])
+    return names
+
+
+def format_tree(node, parent=0):
+    if isinstance(node, int):
+        return str(node) if node >= 0 or parent == 0 else f"({node})"
+    if isinstance(node, str):
+        return node
+    if node[0] == "neg":
+        return f"-{format_tree(node[1], UNARY_PRECEDENCE)}"
+    op, left, right = node
+    level = PRECEDENCE[op]
+    # Operators are left-associative: the right operand needs parentheses at the same level
+    text = f"{format_tree(left, level)} {op} {format_tree(right, level + 1)}"
+    return f"({text})" if level < parent else text
+
+
+def c_div(a, b):
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def fold_binary(op, a, b):
+    if op in ("/", "%") and b == 0:
+        return None
+    if op == "+":
+        value = a + b
+    elif op == "-":
+        value = a - b
+    elif op == "*":
+        value = a * b
+    elif op == "/":
+        value = c_div(a, b)
+    elif op == "%":
+        value = a - b * c_div(a, b)
+    else:
+        value = int({"==": a == b, "!=": a != b, ">": a > b, "<": a < b, ">=": a >= b, "<=": a <= b}[op])
+    # Overflow is undefined in C++, leave it to the compiler
+    return value if INT_MIN <= value <= INT_MAX else None
+
+
+def rewrite(node, values, fold):
+    # Substitutes known variable values and folds literal subtrees, bottom-up
+    if isinstance(node, str):
+        return values.get(node, node)
+    if isinstance(node, int):
+        return node
+    if node[0] == "neg":
+        operand = rewrite(node[1], values, fold)
+        if fold and isinstance(operand, int) and INT_MIN <= -operand <= INT_MAX:
+            return -operand
+        return ("neg", operand)
+    op, left, right = node
+    left = rewrite(left, values, fold)
+    right = rewrite(right, values, fold)
+    if fold and isinstance(left, int) and isinstance(right, int) and INT_MIN <= left <= INT_MAX and INT_MIN <= right <= INT_MAX:
+        value = fold_binary(op, left, right)
+        if value is not None:
+            return value
+    return (op, left, right)
+
+
+class Statement:
+    """Оператор тела функции в форме, удобной для проходов оптимизатора"""
+
+    __slots__ = ("block", "target", "type", "expression", "aliases", "target_reads")
+
+    def __init__(self, block):
+        self.block = block
+        self.target = None
+        self.type = None
+        # Names this statement may make reachable through a reference, pointer or array
+        self.aliases = set()
+        # Names read by an element or pointer target such as buf[i] or *p
+        self.target_reads = ()
+        if isinstance(block, VariableBlock):
+            self.target, self.type = leading_name(block.name), block.type
+            self.expression = expression_of(block.value) if block.value is not None else None
+            if is_indirect(block.type) or (block.name or "").strip() != self.target:
+                # int& r = x, int* p = q, int buf[4]: the declared name and whatever it is bound to
+                self.aliases.add(self.target)
+                if self.expression is not None:
+                    self.aliases.update(self.expression.reads)
+        elif isinstance(block, AssignmentBlock):
+            self.expression = expression_of(block.expression)
+            if IDENTIFIER.fullmatch(block.var_name or ""):
+                self.target = block.var_name
+            else:
+                # A store through an element or a pointer, not to a variable of its own
+                self.target_reads = set(IDENTIFIER.findall(block.var_name or ""))
+                self.aliases.update(self.target_reads)
+        elif isinstance(block, ReturnBlock):
+            self.expression = expression_of(block.expression)
+        else:
+            # Anything else is kept verbatim and treated as touching every name it mentions
+            self.expression = Expression(block.generate_code())
+        if self.expression is not None and not self.expression.pure:
+            self.aliases.update(ADDRESS_OF.findall(self.expression.text or ""))
+
+    @property
+    def reads(self):
+        reads = self.expression.reads if self.expression is not None else ()
+        return reads | self.target_reads if self.target_reads else reads
+
+    @property
+    def indirect_write(self):
+        # May store to any variable whose address or reference was taken
+        return bool(self.target_reads) or (self.expression is not None and not self.expression.pure)
+
+    def to_block(self):
+        block = self.block
+        text = self.expression.text if self.expression is not None else None
+        if isinstance(block, VariableBlock):
+            return VariableBlock(block.type, block.name, text)
+        if isinstance(block, AssignmentBlock):
+            return AssignmentBlock(block.var_name, text)
+        if isinstance(block, ReturnBlock):
+            return ReturnBlock(text)
+        block = copy.copy(block)
+        block._code = None
+        return block
+
+
+def remove_unreachable(statements):
+    for i, statement in enumerate(statements):
+        if isinstance(statement.block, ReturnBlock):
+            return statements[:i + 1]
+    return statements
+
+
+def aliased_names(func, statements):
+    """Переменные, которые могут читаться или меняться в обход своего имени"""
+    names = {name for name, type in func.params.items() if is_indirect(type)}
+    for statement in statements:
+        names.update(statement.aliases)
+    names.discard(None)
+    return names
+
+
+def propagate(func, statements, fold=True, copy=True):
+    types = dict(func.params)
+    # Values of aliased variables may change behind their backs, so they are never tracked
+    aliased = aliased_names(func, statements)
+    # Known values: name -> int literal (constants) or name -> other name (copies)
+    values = {}
+    # name -> names currently holding a copy of it, so reassigning it forgets those copies
+    copies_of = {}
+
+    def forget(name):
+        value = values.pop(name, None)
+        if isinstance(value, str):
+            copies_of.get(value, set()).discard(name)
+        for dependent in copies_of.pop(name, ()):
+            values.pop(dependent, None)
+
+    for statement in statements:
+        expression = statement.expression
+        if expression is not None and expression.pure and not is_indirect(statement.type):
+            # A reference or pointer initializer names what it binds to, not a value
+            tree = rewrite(expression.tree, values, fold)
+            if tree != expression.tree:
+                statement.expression = Expression(format_tree(tree), tree)
+        elif expression is not None:
+            for name in expression.reads:
+                forget(name)
+        target = statement.target
+        if target is None:
+            continue
+        if statement.type is not None:
+            types[target] = statement.type
+        forget(target)
+        tree = statement.expression.tree if statement.expression is not None else None
+        if tree is None or types.get(target) is None or target in aliased:
+            continue
+        if fold and isinstance(tree, int) and types[target] in INTEGRAL_TYPES:
+            values[target] = tree
+        elif copy and isinstance(tree, str) and tree != target and tree not in aliased and types.get(tree) == types[target]:
+            values[target] = tree
+            copies_of.setdefault(tree, set()).add(target)
+    return statements
+
+
+def eliminate_dead_stores(func, statements):
+    # Parameters and declared variables are locals: a value nobody reads afterwards is dead
+    locals_ = set(func.params)
+    locals_.update(s.target for s in statements if isinstance(s.block, VariableBlock))
+    # Stores to aliased variables may be read through another name
+    locals_ -= aliased_names(func, statements)
+    live = set()
+    mentioned = set()
+    kept = []
+    for statement in reversed(statements):
+        target = statement.target
+        expression = statement.expression
+        pure = expression is None or expression.pure
+        if target is not None and target in locals_ and target not in live and pure:
+            if isinstance(statement.block, AssignmentBlock):
+                continue
+            if isinstance(statement.block, VariableBlock):
+                if target not in mentioned:
+                    continue
+                # Still assigned later: keep the declaration, drop the dead initializer
+                statement.expression = None
+        if target is not None:
+            live.discard(target)
+            mentioned.add(target)
+        live.update(statement.reads)
+        mentioned.update(statement.reads)
+        kept.append(statement)
+    kept.reverse()
+    return kept
+
+
+def versioned(node, versions):
+    # Same tree over the same variable versions computes the same value
+    if isinstance(node, str):
+        return ("var", node, versions.get(node, 0))
+    if isinstance(node, int):
+        return node
+    if node[0] == "neg":
+        return ("neg", versioned(node[1], versions))
+    return (node[0], versioned(node[1], versions), versioned(node[2], versions))
+
+
+def eliminate_common_subexpressions(func, statements):
+    aliased = aliased_names(func, statements)
+    locals_ = set(func.params)
+    locals_.update(s.target for s in statements if isinstance(s.block, VariableBlock))
+    # Globals and aliased variables: a call or a store through a pointer may change any of them
+    shared = set(aliased)
+    for statement in statements:
+        shared.update(name for name in statement.reads if name not in locals_)
+        if statement.target is not None and statement.target not in locals_:
+            shared.add(statement.target)
+    versions = {}
+    counts = {}
+    trees = []
+
+    def count(node):
+        if not isinstance(node, tuple) or node[0] == "var":
+            return
+        counts[node] = counts.get(node, 0) + 1
+        # Inside a repeat only the outermost tree is hoisted, its parts were counted the first time
+        if counts[node] == 1:
+            for child in node[1:]:
+                count(child)
+
+    names = set(func.params)
+    for statement in statements:
+        expression = statement.expression
+        tree = None
+        if expression is not None and expression.pure:
+            tree = versioned(expression.tree, versions)
+            count(tree)
+        elif expression is not None:
+            # An opaque expression may write any name it mentions
+            for name in expression.reads:
+                versions[name] = versions.get(name, 0) + 1
+        trees.append(tree)
+        names.update(statement.reads)
+        if statement.target is not None:
+            names.add(statement.target)
+            versions[statement.target] = versions.get(statement.target, 0) + 1
+        if statement.indirect_write:
+            for name in shared:
+                versions[name] = versions.get(name, 0) + 1
+        elif statement.target in aliased:
+            # Any aliased variable may have been written through another name
+            for name in aliased:
+                versions[name] = versions.get(name, 0) + 1
+
+    temps = {}
+    numbers = itertools.count()
+    result = []
+
+    def hoist(node):
+        if isinstance(node, int):
+            return node
+        if node[0] == "var":
+            return node[1]
+        if counts.get(node, 0) < 2:
+            if node[0] == "neg":
+                return ("neg", hoist(node[1]))
+            return (node[0], hoist(node[1]), hoist(node[2]))
+        name = temps.get(node)
+        if name is None:
+            tree = ("neg", hoist(node[1])) if node[0] == "neg" else (node[0], hoist(node[1]), hoist(node[2]))
+            name = next(candidate for candidate in (f"{TEMP_PREFIX}{n}" for n in numbers) if candidate not in names)
+            temps[node] = name
+            # Defined right before its first use, where the operands have the versions in the key
+            result.append(Statement(VariableBlock("auto", name, format_tree(tree))))
+        return name
+
+    for statement, tree in zip(statements, trees):
+        if tree is not None and any(counts.get(node, 0) > 1 for node in subtrees(tree)):
+            tree = hoist(tree)
+            statement.expression = Expression(format_tree(tree), tree)
+        result.append(statement)
+    return result
+
+
+def subtrees(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple) and node[0] != "var":
+            yield node
+            stack.extend(node[1:])
+
+
+def optimize_function(func, passes=PASSES):
+    """Оптимизированная копия функции; исходный граф блоков не меняется"""
+    statements = [Statement(block) for block in func.connections]
+    if "unreachable" in passes:
+        statements = remove_unreachable(statements)
+    if "fold" in passes or "copy" in passes:
+        statements = propagate(func, statements, "fold" in passes, "copy" in passes)
+    if "dead" in passes:
+        statements = eliminate_dead_stores(func, statements)
+    if "cse" in passes:
+        statements = eliminate_common_subexpressions(func, statements)
+    result = Function(func.type, func.name, func.params)
+    for statement in statements:
+        block = statement.to_block()
+        block.owner = result
+        result.connections.append(block)
+    return result
+
+
+def optimize(functions, passes=PASSES):
+    return [optimize_function(func, passes) for func in functions]
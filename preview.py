@@ -0,0 +1,213 @@
+import queue
+import threading
+from difflib import SequenceMatcher
+
+from block_system import *
+from project_io import block_kind, make_block
+from history import field_values
+
+
+class FunctionSnapshot:
+    """Неизменяемый снимок функции для фоновой генерации"""
+
+    __slots__ = ("func", "signature", "blocks", "parts", "rendered")
+
+    def __init__(self, func, signature=None, blocks=None, parts=None, rendered=None):
+        self.func = func
+        self.signature = signature
+        # Live statements, in body order; only compared by identity off the UI thread
+        self.blocks = blocks
+        # Per statement: its cached code, or a detached copy to render on the worker
+        self.parts = parts
+        # Set instead of the above when the function is unchanged since it was last rendered
+        self.rendered = rendered
+
+
+def take_snapshot(func, previous=None):
+    # Runs on the UI thread: no rendering here, only cached strings and copies of edited statements
+    if previous is not None and func._code is not None and func._code == previous.text:
+        return FunctionSnapshot(func, rendered=previous)
+    blocks = list(func.connections)
+    parts = []
+    for block in blocks:
+        code = block._code
+        parts.append(code if code is not None else make_block(block_kind(block), field_values(block)))
+    return FunctionSnapshot(func, func.get_signature(), blocks, parts)
+
+
+# Stands in the document for the prototypes emit_program writes before the definitions
+PROTOTYPES = object()
+
+
+class RenderedFunction:
+    """Готовый код функции; после создания не изменяется и передаётся между потоками"""
+
+    __slots__ = ("func", "text", "lines", "blocks", "codes", "starts", "copies")
+
+    def __init__(self, func, text, lines, blocks, codes, starts, copies):
+        self.func = func
+        self.text = text
+        self.lines = lines
+        self.blocks = blocks
+        self.codes = codes
+        # Line of each statement relative to the signature line
+        self.starts = starts
+        # Live block -> the copy rendered in its place, for warming the live caches on the UI thread
+        self.copies = copies
+
+
+def program_snapshots(declarations, functions, rendered):
+    """Снимки программы в том виде, в каком её записывает emit_program: прототипы, затем определения"""
+    snapshots = []
+    if declarations:
+        text = "".join(f"{func.get_signature()};\n" for func in declarations)
+        previous = rendered.get(PROTOTYPES)
+        if previous is None or previous.text != text:
+            previous = RenderedFunction(PROTOTYPES, text, text.splitlines(), [], [], [], {})
+        snapshots.append(FunctionSnapshot(PROTOTYPES, rendered=previous))
+    snapshots.extend(take_snapshot(func, rendered.get(func)) for func in functions)
+    return snapshots
+
+
+def render_snapshot(snapshot):
+    codes = []
+    copies = {}
+    for block, part in zip(snapshot.blocks, snapshot.parts):
+        if isinstance(part, str):
+            codes.append(part)
+        else:
+            codes.append(part.generate_code())
+            copies[block] = part
+    starts = []
+    line = 1
+    for code in codes:
+        starts.append(line)
+        line += code.count("\n")
+    text = function_text(snapshot.signature, "".join(codes))
+    return RenderedFunction(snapshot.func, text, text.splitlines(), snapshot.blocks, codes, starts, copies)
+
+
+def diff_lines(old, new):
+    # One replaced range per changed function: common prefix and suffix are kept
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+    if prefix == len(old) == len(new):
+        return None
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+class PreviewJob:
+    __slots__ = ("generation", "snapshots")
+
+    def __init__(self, generation, snapshots):
+        self.generation = generation
+        self.snapshots = snapshots
+
+
+class PreviewWorker:
+    """Фоновая генерация кода для панели предпросмотра.
+
+    Принимает снимки функций и возвращает через очередь правки текста по строкам:
+    (начало, конец, новые строки) в координатах предыдущего отправленного документа.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.generation = 0
+        # What the UI shows once it has applied every result sent so far: [(func, rendered)]
+        self.document = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshots):
+        # A newer request supersedes whatever is queued or half done
+        self.generation += 1
+        self.jobs.put(PreviewJob(self.generation, snapshots))
+
+    def cancel(self):
+        self.generation += 1
+
+    def close(self):
+        self.cancel()
+        self.jobs.put(None)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            # Skip straight to the newest request
+            while job is not None and not self.jobs.empty():
+                job = self.jobs.get_nowait()
+            if job is None:
+                return
+            result = self.process(job)
+            if result is not None:
+                self.results.put(result)
+
+    def process(self, job):
+        cached = {func: rendered for func, rendered in self.document}
+        document = []
+        for snapshot in job.snapshots:
+            if job.generation != self.generation:
+                return None
+            rendered = snapshot.rendered or render_snapshot(snapshot)
+            document.append((snapshot.func, rendered))
+        patches = self.patches(self.document, document)
+        changed = [rendered for func, rendered in document if cached.get(func) is not rendered]
+        self.document = document
+        layout = [(func, len(rendered.lines) + 1) for func, rendered in document]
+        return job.generation, patches, layout, changed
+
+    def patches(self, old, new):
+        # Functions are matched by identity; separators are one blank line after each function
+        old_starts = []
+        line = 0
+        for _, rendered in old:
+            old_starts.append(line)
+            line += len(rendered.lines) + 1
+        old_end = line
+        patches = []
+        matcher = SequenceMatcher(None, [func for func, _ in old], [func for func, _ in new], autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                for i, j in zip(range(i1, i2), range(j1, j2)):
+                    if old[i][1] is new[j][1]:
+                        continue
+                    change = diff_lines(old[i][1].lines, new[j][1].lines)
+                    if change is not None:
+                        start, end, lines = change
+                        patches.append((old_starts[i] + start, old_starts[i] + end, lines))
+                continue
+            start = old_starts[i1] if i1 < len(old) else old_end
+            end = old_starts[i2] if i2 < len(old) else old_end
+            lines = [line for _, rendered in new[j1:j2] for line in rendered.lines + [""]]
+            patches.append((start, end, lines))
+        return patches
+
+
+def install(rendered):
+    """На UI-потоке переносит готовый код в кэши блоков, если с момента снимка они не менялись"""
+    func = rendered.func
+    if func is PROTOTYPES or func._code is not None or len(func.connections) != len(rendered.blocks):
+        return
+    if func.get_signature() != rendered.lines[0][:-2]:
+        return
+    for live, block, code in zip(func.connections, rendered.blocks, rendered.codes):
+        if live is not block:
+            return
+        current = block._code
+        if current is None:
+            copy = rendered.copies.get(block)
+            if copy is None or field_values(block) != field_values(copy):
+                return
+        elif current != code:
+            return
+    for block, copy in rendered.copies.items():
+        if block._code is None:
+            block._code = copy._code
+    func._code = rendered.text
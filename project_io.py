@@ -0,0 +1,373 @@
+import json
+import os
+import struct
+from contextlib import contextmanager
+
+from block_system import *
+from block_store import KINDS, FIELDS
+
+
+FORMAT_NAME = "cpp-blocks"
+FORMAT_VERSION = 1
+
+# Binary layout: header | block records | edge records | function index | string table.
+# Each function is stored as one contiguous run of records: the function, its params, its body.
+MAGIC = b"CPPB"
+HEADER = struct.Struct("<4sHHIIIIIQQQQ")
+# kind, owner record, x, y, three string ids (-1 for None)
+BLOCK_RECORD = struct.Struct("<Bxxxiffiii")
+EDGE_RECORD = struct.Struct("<II")
+# function record, param count, body length, bounds of the block positions
+INDEX_RECORD = struct.Struct("<IIIffff")
+PARAM_KIND = len(KINDS)
+NO_STRING = -1
+# What decoding a truncated or corrupted file raises besides ValueError
+FORMAT_ERRORS = (KeyError, IndexError, TypeError, AttributeError, struct.error)
+
+
+@contextmanager
+def format_errors(path):
+    """Ошибки разбора повреждённого файла превращаются в ValueError, как и прочие ошибки формата"""
+    try:
+        yield
+    except FORMAT_ERRORS as e:
+        raise ValueError(f"{path}: malformed project ({type(e).__name__}: {e})") from None
+
+
+class Project:
+    """Сохраняемое состояние редактора: функции, свободные блоки, позиции и связи"""
+
+    def __init__(self, functions=None, loose=None, positions=None, edges=None):
+        self.functions = functions if functions is not None else []
+        # Statements that are not part of any function body
+        self.loose = loose if loose is not None else []
+        self.positions = positions if positions is not None else {}
+        # Lines between loose blocks; function bodies imply the lines along their chain
+        self.edges = edges if edges is not None else []
+
+    def blocks(self):
+        for func in self.functions:
+            yield func
+            yield from func.connections
+        yield from self.loose
+
+
+def block_values(block):
+    cls = block_kind(block)
+    # Nested expressions are stored as their generated text
+    return [block.op.value if field == "op" else field_text(getattr(block, field)) for field in FIELDS[cls]]
+
+
+def field_text(value):
+    return str(value) if isinstance(value, Block) else value
+
+
+def block_kind(block):
+    return next(cls for cls in KINDS if isinstance(block, cls))
+
+
+def make_block(cls, values):
+    if cls is ExpressionBlock:
+        return ExpressionBlock(values[0], Operation(values[1]), values[2])
+    return cls(*values)
+
+
+def body_edges(func):
+    prev = func
+    for block in func.connections:
+        yield prev, block
+        prev = block
+
+
+# JSON
+
+
+def save_json(project, path):
+    ids = {}
+    records = []
+    for block in project.blocks():
+        ids[block] = len(records)
+        cls = block_kind(block)
+        x, y = project.positions.get(block, (0, 0))
+        record = {"id": len(records), "kind": cls.__name__, "x": x, "y": y}
+        record.update(zip(FIELDS[cls], block_values(block)))
+        if cls is Function:
+            record["params"] = [[name, type] for name, type in block.params.items()]
+        records.append(record)
+    for func in project.functions:
+        records[ids[func]]["body"] = [ids[block] for block in func.connections]
+    edges = [[ids[source], ids[target]] for func in project.functions for source, target in body_edges(func)]
+    edges.extend([ids[source], ids[target]] for source, target in project.edges)
+    data = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "blocks": records, "edges": edges}
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump(data, out, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path}: not a {FORMAT_NAME} project")
+    with format_errors(path):
+        return _load_json_data(data)
+
+
+def block_at(blocks, index, start=0):
+    # Negative indices would silently wrap around to the wrong block
+    if not isinstance(index, int) or not start <= index < start + len(blocks):
+        raise ValueError(f"block index {index} out of range")
+    return blocks[index - start]
+
+
+def _load_json_data(data):
+    kinds = {cls.__name__: cls for cls in KINDS}
+    project = Project()
+    blocks = []
+    for record in data["blocks"]:
+        cls = kinds[record["kind"]]
+        block = make_block(cls, [record.get(field) for field in FIELDS[cls]])
+        if cls is Function:
+            for name, type in record.get("params", ()):
+                block.params[intern_name(name)] = intern_name(type)
+        project.positions[block] = (record.get("x", 0), record.get("y", 0))
+        blocks.append(block)
+    owned = set()
+    for record, block in zip(data["blocks"], blocks):
+        if isinstance(block, Function):
+            project.functions.append(block)
+            for index in record.get("body", ()):
+                statement = block_at(blocks, index)
+                statement.owner = block
+                block.connections.append(statement)
+                owned.add(statement)
+    project.loose = [b for b in blocks if not isinstance(b, Function) and b not in owned]
+    implied = {(source, target) for func in project.functions for source, target in body_edges(func)}
+    for source, target in data.get("edges", ()):
+        edge = (block_at(blocks, source), block_at(blocks, target))
+        if edge not in implied:
+            project.edges.append(edge)
+    return project
+
+
+# Binary
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def save_binary(project, path):
+    strings = _StringTable()
+    index = []
+    ids = {}
+    with open(path, "wb") as out:
+        out.write(bytes(HEADER.size))
+        count = 0
+        chunk = []
+
+        def write(kind, owner, x, y, values):
+            nonlocal count
+            fields = [strings.add(v) for v in values] + [NO_STRING] * (3 - len(values))
+            chunk.append(BLOCK_RECORD.pack(kind, owner, x, y, *fields))
+            count += 1
+            if len(chunk) >= 4096:
+                out.write(b"".join(chunk))
+                chunk.clear()
+
+        for func in project.functions:
+            start = count
+            ids[func] = start
+            points = [project.positions.get(b, (0, 0)) for b in [func, *func.connections]]
+            x, y = points[0]
+            write(KINDS.index(Function), -1, x, y, block_values(func))
+            for name, type in func.params.items():
+                write(PARAM_KIND, start, 0, 0, [type, name])
+            for block, (x, y) in zip(func.connections, points[1:]):
+                ids[block] = count
+                write(KINDS.index(block_kind(block)), start, x, y, block_values(block))
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            index.append(INDEX_RECORD.pack(start, len(func.params), len(func.connections), min(xs), min(ys), max(xs), max(ys)))
+        loose_start = count
+        for block in project.loose:
+            ids[block] = count
+            x, y = project.positions.get(block, (0, 0))
+            write(KINDS.index(block_kind(block)), -1, x, y, block_values(block))
+        out.write(b"".join(chunk))
+        records_end = out.tell()
+
+        for source, target in project.edges:
+            out.write(EDGE_RECORD.pack(ids[source], ids[target]))
+        index_offset = out.tell()
+        out.write(b"".join(index))
+
+        strings_offset = out.tell()
+        encoded = [s.encode("utf-8") for s in strings.strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        out.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        out.write(b"".join(encoded))
+
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(encoded), len(project.functions), count,
+                              len(project.edges), loose_start, HEADER.size, records_end, index_offset, strings_offset))
+
+
+def check_header(path, header, size):
+    """Разбирает заголовок бинарного проекта и проверяет, что все разделы лежат внутри файла"""
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        raise ValueError(f"{path}: not a binary {FORMAT_NAME} project")
+    fields = HEADER.unpack_from(header)
+    (_, version, _, string_count, function_count, record_count, edge_count,
+     loose_start, records_offset, edges_offset, index_offset, strings_offset) = fields
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported format version {version}")
+    sections = ((records_offset, record_count * BLOCK_RECORD.size), (edges_offset, edge_count * EDGE_RECORD.size),
+                (index_offset, function_count * INDEX_RECORD.size), (strings_offset, 4 * (string_count + 1)))
+    if loose_start > record_count or any(offset < HEADER.size or offset + length > size for offset, length in sections):
+        raise ValueError(f"{path}: truncated or corrupted project")
+    return fields
+
+
+class ProjectReader:
+    """Ленивое чтение бинарного проекта: индекс сразу, тела функций по запросу"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self._read_index()
+        except BaseException:
+            self.file.close()
+            raise
+
+    def _read_index(self):
+        path = self.path
+        header = self.file.read(HEADER.size)
+        (_, _, _, self.string_count, self.function_count, self.record_count, self.edge_count, self.loose_start,
+         self.records_offset, self.edges_offset, self.index_offset, self.strings_offset) = check_header(
+            path, header, os.fstat(self.file.fileno()).st_size)
+        with format_errors(path):
+            self.file.seek(self.index_offset)
+            self.index = list(INDEX_RECORD.iter_unpack(self.file.read(INDEX_RECORD.size * self.function_count)))
+            # Bodies are read lazily, so their records are checked against the header up front
+            if any(start + 1 + param_count + body_len > self.loose_start for start, param_count, body_len, *_ in self.index):
+                raise ValueError(f"{path}: function index points past the function records")
+            self.file.seek(self.strings_offset)
+            offsets = struct.unpack(f"<{self.string_count + 1}I", self.file.read(4 * (self.string_count + 1)))
+            blob = self.file.read(offsets[-1])
+            if len(blob) < offsets[-1]:
+                raise ValueError(f"{path}: truncated string table")
+            self.strings = [intern_name(blob[offsets[i]:offsets[i + 1]].decode("utf-8")) for i in range(self.string_count)]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def function_bounds(self, i):
+        return self.index[i][3:]
+
+    def _string(self, index):
+        return None if index == NO_STRING else self.strings[index]
+
+    def _read_records(self, start, count):
+        self.file.seek(self.records_offset + start * BLOCK_RECORD.size)
+        return BLOCK_RECORD.iter_unpack(self.file.read(count * BLOCK_RECORD.size))
+
+    def _make(self, record):
+        kind, _, x, y, a, b, c = record
+        cls = KINDS[kind]
+        values = [self._string(a), self._string(b), self._string(c)][:len(FIELDS[cls])]
+        return make_block(cls, values), (x, y)
+
+    def load_function(self, i):
+        with format_errors(self.path):
+            return self._load_function(i)
+
+    def _load_function(self, i):
+        start, param_count, body_len = self.index[i][:3]
+        records = self._read_records(start, 1 + param_count + body_len)
+        func, position = self._make(next(records))
+        positions = {func: position}
+        for _ in range(param_count):
+            _, _, _, _, type, name, _ = next(records)
+            func.add_param(self._string(type), self._string(name))
+        for record in records:
+            block, positions[block] = self._make(record)
+            block.owner = func
+            func.connections.append(block)
+        return func, positions
+
+    def load_loose(self):
+        with format_errors(self.path):
+            return self._load_loose()
+
+    def _load_loose(self):
+        blocks = []
+        positions = {}
+        for record in self._read_records(self.loose_start, self.record_count - self.loose_start):
+            block, positions[block] = self._make(record)
+            blocks.append(block)
+        self.file.seek(self.edges_offset)
+        edges = []
+        for source, target in EDGE_RECORD.iter_unpack(self.file.read(EDGE_RECORD.size * self.edge_count)):
+            edges.append((block_at(blocks, source, self.loose_start), block_at(blocks, target, self.loose_start)))
+        return blocks, positions, edges
+
+    def functions(self):
+        for i in range(self.function_count):
+            yield self.load_function(i)[0]
+
+    def load(self):
+        project = Project()
+        for i in range(self.function_count):
+            func, positions = self.load_function(i)
+            project.functions.append(func)
+            project.positions.update(positions)
+        project.loose, positions, project.edges = self.load_loose()
+        project.positions.update(positions)
+        return project
+
+
+def load_binary(path):
+    with ProjectReader(path) as reader:
+        return reader.load()
+
+
+def is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_project(project, path):
+    if str(path).endswith(".json"):
+        save_json(project, path)
+    else:
+        save_binary(project, path)
+
+
+def load_project(path):
+    return load_binary(path) if is_binary(path) else load_json(path)
+
+
+def open_project(path):
+    # Binary projects open lazily, JSON is always parsed whole
+    return ProjectReader(path) if is_binary(path) else load_json(path)
@@ -0,0 +1,258 @@
+import mmap
+import os
+import struct
+import sys
+
+from block_system import *
+from block_store import KINDS, FIELDS
+from project_io import HEADER, BLOCK_RECORD, INDEX_RECORD, NO_STRING, check_header, format_errors
+
+
+# Byte offsets inside a block record: kind, owner, x, y, then the three string ids
+OWNER_OFFSET = 4
+POSITION = struct.Struct("<ff")
+POSITION_OFFSET = 8
+STRING_ID = struct.Struct("<i")
+STRING_OFFSET = 16
+STRING_SPAN = struct.Struct("<II")
+# Decoded strings kept around at most; beyond that the cache starts over
+STRING_CACHE = 4096
+# Emitting drops the mapped pages after about this many records, so the resident set stays flat
+RELEASE_RECORDS = 4096
+
+
+def _string_property(column):
+    def get(self):
+        return self._project.field(self._record, column)
+
+    def set(self, value):
+        self._project.set_field(self._record, column, value)
+
+    return property(get, set)
+
+
+def _op_property(column):
+    def get(self):
+        return Operation(self._project.field(self._record, column))
+
+    def set(self, value):
+        self._project.set_field(self._record, column, value.value)
+
+    return property(get, set)
+
+
+def _get_owner(self):
+    owner = self._project.owner_record(self._record)
+    return None if owner < 0 else self._project.block(owner)
+
+
+def _set_owner(self, block):
+    raise AttributeError("mapped blocks keep the owner stored in the file")
+
+
+def _get_params(self):
+    return self._project.params(self._record)
+
+
+def _get_connections(self):
+    return self._project.body(self._record)
+
+
+def _make_view(cls):
+    namespace = {"__slots__": ("_project", "_record"), "owner": property(_get_owner, _set_owner)}
+    for column, field in enumerate(FIELDS[cls]):
+        namespace[field] = _op_property(column) if field == "op" else _string_property(column)
+    if cls is Function:
+        namespace["params"] = property(_get_params)
+        namespace["connections"] = property(_get_connections)
+    return type(f"Mapped{cls.__name__}", (cls,), namespace)
+
+
+VIEWS = tuple(_make_view(cls) for cls in KINDS)
+
+
+class MappedBody:
+    """Тело функции в отображённом файле: блоки создаются при обходе"""
+
+    __slots__ = ("_project", "_start", "_length")
+
+    def __init__(self, project, start, length):
+        self._project = project
+        self._start = start
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for record in range(self._start, self._start + self._length):
+            yield self._project.block(record)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._project.block(self._start + index)
+
+    def count_of(self, cls):
+        return sum(1 for record in range(self._start, self._start + self._length)
+                   if issubclass(KINDS[self._project.kind(record)], cls))
+
+
+class MappedProject:
+    """Бинарный проект через mmap: блоки читаются прямо из файла без загрузки"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path}: empty file")
+        self.buffer = memoryview(self.map)
+        try:
+            (_, _, _, self.string_count, self.function_count, self.record_count, self.edge_count, self.loose_start,
+             self.records_offset, self.edges_offset, self.index_offset, self.strings_offset) = check_header(
+                path, self.map[:HEADER.size], len(self.map))
+            self.blob_offset = self.strings_offset + 4 * (self.string_count + 1)
+            blob_end = STRING_SPAN.unpack_from(self.map, self.blob_offset - STRING_SPAN.size)[1] if self.string_count else 0
+            if self.blob_offset + blob_end > len(self.map):
+                raise ValueError(f"{path}: truncated string table")
+        except ValueError:
+            self.close()
+            raise
+        self._strings = {}
+        # Edited fields live here; the mapping itself is never written
+        self.changes = {}
+
+    def close(self):
+        self.buffer.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _offset(self, record):
+        return self.records_offset + record * BLOCK_RECORD.size
+
+    def kind(self, record):
+        return self.buffer[self._offset(record)]
+
+    def owner_record(self, record):
+        return STRING_ID.unpack_from(self.buffer, self._offset(record) + OWNER_OFFSET)[0]
+
+    def position(self, record):
+        return POSITION.unpack_from(self.buffer, self._offset(record) + POSITION_OFFSET)
+
+    def string(self, index):
+        if index == NO_STRING:
+            return None
+        value = self._strings.get(index)
+        if value is None:
+            # Strings are shared across the whole project, so lookups jump all over the table; reading them
+            # with pread keeps those scattered pages out of the mapping and the resident set
+            span = self.strings_offset + 4 * index
+            if hasattr(os, "pread"):
+                fd = self.file.fileno()
+                start, end = STRING_SPAN.unpack(os.pread(fd, STRING_SPAN.size, span))
+                data = os.pread(fd, end - start, self.blob_offset + start)
+            else:
+                start, end = STRING_SPAN.unpack_from(self.buffer, span)
+                data = self.buffer[self.blob_offset + start:self.blob_offset + end]
+            value = intern_name(str(data, "utf-8"))
+            if len(self._strings) >= STRING_CACHE:
+                self._strings.clear()
+            self._strings[index] = value
+        return value
+
+    def field(self, record, column):
+        if self.changes and (record, column) in self.changes:
+            return self.changes[(record, column)]
+        return self.string(STRING_ID.unpack_from(self.buffer, self._offset(record) + STRING_OFFSET + 4 * column)[0])
+
+    def set_field(self, record, column, value):
+        self.changes[(record, column)] = intern_name(value)
+
+    def block(self, record):
+        cls = VIEWS[self.kind(record)]
+        view = cls.__new__(cls)
+        view._project = self
+        view._record = record
+        view._code = None
+        return view
+
+    def _index(self, i):
+        return INDEX_RECORD.unpack_from(self.buffer, self.index_offset + i * INDEX_RECORD.size)
+
+    def function(self, i):
+        return self.block(self._index(i)[0])
+
+    def functions(self):
+        for i in range(self.function_count):
+            yield self.function(i)
+
+    def _function_entry(self, record):
+        # Function records are laid out in index order, so a binary search finds the entry
+        lo, hi = 0, self.function_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._index(mid)[0] < record:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._index(lo)
+
+    def params(self, record):
+        param_count = self._function_entry(record)[1]
+        params = {}
+        for param in range(record + 1, record + 1 + param_count):
+            params[self.field(param, 1)] = self.field(param, 0)
+        return params
+
+    def body(self, record):
+        _, param_count, body_len = self._function_entry(record)[:3]
+        return MappedBody(self, record + 1 + param_count, body_len)
+
+    def release(self):
+        # Pages of a read-only file mapping are dropped and simply faulted in again on the next access
+        if hasattr(self.map, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+            self.map.madvise(mmap.MADV_DONTNEED)
+
+    def emit(self, out, separator="\n\n"):
+        with format_errors(self.path):
+            self._emit(out, separator)
+
+    def _emit(self, out, separator):
+        pending = 0
+        for i in range(self.function_count):
+            if i:
+                out.write(separator)
+            record, param_count, body_len = self._index(i)[:3]
+            self.block(record).emit(out)
+            pending += 1 + param_count + body_len
+            if pending >= RELEASE_RECORDS:
+                self.release()
+                pending = 0
+
+
+def main(argv):
+    if not argv:
+        print("usage: python project_mmap.py PROJECT.cppb [OUTPUT.cpp]", file=sys.stderr)
+        return 2
+    with MappedProject(argv[0]) as project:
+        if len(argv) > 1:
+            with open(argv[1], "w", encoding="utf-8", buffering=1 << 16) as out:
+                project.emit(out)
+        else:
+            project.emit(sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
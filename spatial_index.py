@@ -0,0 +1,105 @@
+import math
+
+
+class GridIndex:
+    """Равномерная сетка для поиска объектов по прямоугольной области"""
+
+    def __init__(self, cell_size=160):
+        # Cell size is a multiple of the 20px snap grid, so snapped blocks start on cell borders
+        self.cell_size = cell_size
+        self.cells = {}
+        self.bounds = {}
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, key):
+        return key in self.bounds
+
+    def _cell_range(self, x1, y1, x2, y2):
+        size = self.cell_size
+        return (math.floor(min(x1, x2) / size), math.floor(min(y1, y2) / size),
+                math.floor(max(x1, x2) / size), math.floor(max(y1, y2) / size))
+
+    def insert(self, key, x1, y1, x2, y2):
+        bounds = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.bounds[key] = bounds
+        cx1, cy1, cx2, cy2 = self._cell_range(*bounds)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                self.cells.setdefault((cx, cy), set()).add(key)
+
+    def remove(self, key):
+        bounds = self.bounds.pop(key, None)
+        if bounds is None:
+            return
+        cx1, cy1, cx2, cy2 = self._cell_range(*bounds)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self.cells[(cx, cy)]
+
+    def update(self, key, x1, y1, x2, y2):
+        old = self.bounds.get(key)
+        if old is not None and self._cell_range(*old) == self._cell_range(x1, y1, x2, y2):
+            # Same cells, only the stored bounds change
+            self.bounds[key] = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            return
+        self.remove(key)
+        self.insert(key, x1, y1, x2, y2)
+
+    def query(self, x1, y1, x2, y2):
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        found = set()
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            # Box covers more cells than are occupied: walk the occupied ones instead
+            candidates = (key for (cx, cy), cell in self.cells.items()
+                          if cx1 <= cx <= cx2 and cy1 <= cy <= cy2 for key in cell)
+        else:
+            candidates = (key for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)
+                          for key in self.cells.get((cx, cy), ()))
+        for key in candidates:
+            if key in found:
+                continue
+            bx1, by1, bx2, by2 = self.bounds[key]
+            if not (x2 < bx1 or x1 > bx2 or y2 < by1 or y1 > by2):
+                found.add(key)
+        return found
+
+    def query_point(self, x, y, radius=0):
+        return self.query(x - radius, y - radius, x + radius, y + radius)
+
+
+def segment_intersects_rect(x1, y1, x2, y2, rx1, ry1, rx2, ry2):
+    # Liang-Barsky clipping of the segment against the rectangle
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - rx1), (dx, rx2 - x1), (-dy, y1 - ry1), (dy, ry2 - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return False
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return False
+            t1 = min(t1, t)
+    return True
+
+
+def point_segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
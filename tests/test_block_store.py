@@ -0,0 +1,61 @@
+import gc
+
+import pytest
+
+from block_store import BlockStore
+from block_system import *
+
+
+def sample_function():
+    func = Function("int", "add", {"a": "int", "b": "int"})
+    func.connections.append(VariableBlock("int", "sum", "a + b"))
+    func.connections.append(ReturnBlock("sum"))
+    return func
+
+
+def test_views_generate_the_same_code():
+    func = sample_function()
+    store = BlockStore()
+    index = store.add(func)
+    assert store.get(index).generate_code() == func.generate_code()
+    assert len(store) == 3
+
+
+def test_views_are_cached_and_statements_know_their_owner():
+    store = BlockStore()
+    index = store.add(sample_function())
+    view = store.get(index)
+    assert store.get(index) is view
+    assert all(statement.owner is view for statement in view.connections)
+
+
+def test_scalar_edits_are_written_to_the_columns():
+    store = BlockStore()
+    index = store.add(sample_function())
+    view = store.get(index)
+    view.set_name("plus")
+    view.connections[1].expression = "sum + 1"
+    del view
+    gc.collect()
+    code = store.get(index).generate_code()
+    assert code.startswith("int plus(int a, int b)")
+    assert "return sum + 1;" in code
+
+
+def test_params_and_body_are_read_only():
+    store = BlockStore()
+    view = store.get(store.add(sample_function()))
+    with pytest.raises(TypeError):
+        view.add_param("int", "c")
+    with pytest.raises(TypeError):
+        view.connections.append(ReturnBlock("b"))
+    with pytest.raises(TypeError):
+        view.connections.remove(view.connections[0])
+    assert view.generate_code() == sample_function().generate_code()
+
+
+def test_strings_are_shared():
+    store = BlockStore()
+    store.add(sample_function())
+    store.add(sample_function())
+    assert len(store.strings) == len(set(store.strings))
@@ -0,0 +1,37 @@
+from block_system import *
+
+
+def test_body_changes_invalidate_the_function_code():
+    func = Function("int", "f", {"x": "int"})
+    func.connections.append(VariableBlock("int", "y", "x"))
+    assert func.generate_code() == "int f(int x) {\nint y = x;\n}\n"
+    ret = ReturnBlock("y")
+    func.connections.append(ret)
+    assert func.generate_code().endswith("return y;\n}\n")
+    func.connections.remove(ret)
+    assert "return" not in func.generate_code()
+    func.connections.clear()
+    assert func.generate_code() == "int f(int x) {\n}\n"
+
+
+def test_linked_statements_are_owned_by_the_function():
+    func = Function("int", "f")
+    first, second = VariableBlock("int", "a", "1"), ReturnBlock("a")
+    func.connections.append(first)
+    func.connections.insert_after(first, [second])
+    assert first.owner is func and second.owner is func
+    func.generate_code()
+    second.expression = "a + 1"
+    second.mark_dirty()
+    assert func.generate_code().endswith("return a + 1;\n}\n")
+    func.connections.remove(second)
+    assert second.owner is None
+
+
+def test_statement_moved_to_another_function_keeps_its_new_owner():
+    source, target = Function("int", "f"), Function("int", "g")
+    block = ReturnBlock("0")
+    source.connections.append(block)
+    target.connections.append(block)
+    source.connections.clear()
+    assert block.owner is target
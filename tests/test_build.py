@@ -0,0 +1,41 @@
+import shutil
+
+import pytest
+
+from block_system import *
+from build import Builder, BuildCache, render_units
+
+
+pytestmark = pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+
+
+def program():
+    square = Function("int", "square", {"x": "int"})
+    main = Function("int", "main")
+    for func, blocks in ((square, [ReturnBlock("x * x")]), (main, [VariableBlock("int", "y", "square(3)"), ReturnBlock("y - 9")])):
+        for block in blocks:
+            block.owner = func
+            func.connections.append(block)
+    return render_units([square, main])
+
+
+def build(directory, flags, tmp_path):
+    reports = []
+    builder = Builder("g++", flags, BuildCache(str(tmp_path / "cache")))
+    executable = builder.build_units(*program(), str(directory), lambda stage, message: reports.append((stage, message)))
+    return executable, reports
+
+
+def test_unchanged_units_are_not_rebuilt(tmp_path):
+    build(tmp_path / "units", ("-O0",), tmp_path)
+    _, reports = build(tmp_path / "units", ("-O0",), tmp_path)
+    assert ("compile", "0 of 2 units changed") in reports
+    assert not any(stage == "link" for stage, _ in reports)
+
+
+def test_changed_flags_rebuild_every_unit_and_relink(tmp_path):
+    build(tmp_path / "units", ("-O0",), tmp_path)
+    executable, reports = build(tmp_path / "units", ("-O3", "-DFOO"), tmp_path)
+    assert ("compile", "2 of 2 units changed") in reports
+    assert any(stage == "link" for stage, _ in reports)
+    assert Builder("g++").run(executable)[0] == 0
@@ -0,0 +1,110 @@
+import random
+
+from block_system import *
+from checker import Checker, ERROR, WARNING
+
+
+def function(blocks, type="int", params=None, name="f"):
+    func = Function(type, name, {"n": "int"} if params is None else params)
+    for block in blocks:
+        func.connections.append(block)
+    return func
+
+
+def messages(checker, block):
+    return [message for _, message in checker.issues_of(block)]
+
+
+def test_reports_declaration_and_return_problems():
+    total = AssignmentBlock("total", "n + 1")
+    twice = VariableBlock("int", "n")
+    constant = VariableBlock("const int", "c", "1")
+    write = AssignmentBlock("c", "2")
+    empty = ReturnBlock("")
+    after = AssignmentBlock("c", "3")
+    func = function([total, twice, constant, write, empty, after])
+    checker = Checker()
+    checker.update([func])
+    assert messages(checker, total) == ["'total' is not declared"]
+    assert messages(checker, twice) == ["'n' is a parameter"]
+    assert messages(checker, write) == ["'c' is const and cannot be assigned"]
+    assert messages(checker, empty) == ["return without a value in a function returning int"]
+    assert checker.issues_of(after)[-1] == (WARNING, "unreachable: comes after the return")
+
+
+def test_missing_return_and_void_return():
+    checker = Checker()
+    missing = function([VariableBlock("int", "x", "1")])
+    void = function([ReturnBlock("1")], type="void", name="g")
+    checker.update([missing, void])
+    assert messages(checker, missing) == ["no return statement in a function returning int"]
+    assert checker.issues_of(void.connections[0]) == ((ERROR, "void function returns a value"),)
+
+
+def test_unchanged_function_reports_no_changes():
+    func = function([VariableBlock("int", "x", "y"), ReturnBlock("x")])
+    checker = Checker()
+    assert checker.update([func])
+    assert checker.update([func]) == {}
+
+
+def test_moving_a_declaration_rechecks_later_users():
+    first, second, third = VariableBlock("int", "b", "1"), VariableBlock("long", "b", "2"), VariableBlock("int", "b", "3")
+    func = function([first, second, third, ReturnBlock("b")])
+    checker = Checker()
+    checker.update([func])
+    func.connections.remove(second)
+    func.connections.insert(0, second)
+    checker.update([func])
+    assert messages(checker, third) == ["'b' redeclared as int, already declared of type long"]
+
+
+def random_body(rng, length):
+    names = ["a", "b", "c", "n"]
+    blocks = []
+    for _ in range(length):
+        kind = rng.random()
+        if kind < 0.4:
+            blocks.append(VariableBlock(rng.choice(["int", "long", "const int"]), rng.choice(names), rng.choice([None, "a + n", "b"])))
+        elif kind < 0.9:
+            blocks.append(AssignmentBlock(rng.choice(names), rng.choice(["1", "a * b", "c - n"])))
+        else:
+            blocks.append(ReturnBlock(rng.choice(["", "a"])))
+    return blocks
+
+
+def test_incremental_results_match_a_fresh_check():
+    rng = random.Random(7)
+    functions = [function(random_body(rng, 12), type=rng.choice(["int", "void"]), name=f"f{i}") for i in range(3)]
+    checker = Checker()
+    checker.update(functions)
+    for _ in range(400):
+        func = rng.choice(functions)
+        body = list(func.connections)
+        action = rng.random()
+        if action < 0.35 and body:
+            block = rng.choice(body)
+            func.connections.remove(block)
+            func.connections.insert(rng.randrange(len(func.connections) + 1), block)
+        elif action < 0.65 and body:
+            block = rng.choice(body)
+            if isinstance(block, VariableBlock):
+                block.name = rng.choice(["a", "b", "c", "n"])
+            elif isinstance(block, AssignmentBlock):
+                block.var_name = rng.choice(["a", "b", "c", "n"])
+            block.mark_dirty()
+        elif action < 0.75:
+            func.set_type(rng.choice(["int", "void"]))
+        elif action < 0.85:
+            func.params = {rng.choice("abn"): "int"}
+            func.mark_dirty()
+        elif action < 0.93 and body:
+            func.connections.remove(rng.choice(body))
+        else:
+            func.connections.append(random_body(rng, 1)[0])
+        checker.update(functions)
+        fresh = Checker()
+        fresh.update(functions)
+        for func in functions:
+            for block in [func, *func.connections]:
+                assert checker.issues_of(block) == fresh.issues_of(block)
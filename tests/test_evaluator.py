@@ -0,0 +1,50 @@
+import pytest
+
+from block_system import *
+from evaluator import EvaluationError, compile_function, evaluate, evaluate_batch
+
+
+def function(blocks, type="int", params=None):
+    func = Function(type, "f", {"a": "int"} if params is None else params)
+    for block in blocks:
+        func.connections.append(block)
+    return func
+
+
+def test_integer_arithmetic_follows_cpp():
+    func = function([VariableBlock("int", "q", "a / 2"), VariableBlock("int", "r", "a % 2"), ReturnBlock("q * 10 + r")])
+    assert evaluate(func, -7) == -31
+
+
+def test_void_function_with_empty_return():
+    func = function([VariableBlock("int", "x", "a + 1"), ReturnBlock("")], type="void")
+    assert evaluate(func, 1) is None
+
+
+def test_empty_return_in_a_non_void_function_is_rejected():
+    with pytest.raises(EvaluationError):
+        compile_function(function([ReturnBlock("")]))
+
+
+def test_narrow_types_wrap_to_their_width():
+    func = function([VariableBlock("char", "c", "a * 100"), VariableBlock("short", "s", "a * 20000"), ReturnBlock("c + s")])
+    # 300 wraps to 44 in a signed char, 60000 to -5536 in a short
+    assert evaluate(func, 3) == 44 - 5536
+
+
+def test_division_by_zero_raises():
+    with pytest.raises(EvaluationError):
+        evaluate(function([ReturnBlock("10 / a")]), 0)
+
+
+def test_batch_matches_scalar():
+    np = pytest.importorskip("numpy")
+    func = function([VariableBlock("char", "c", "a * 100"), VariableBlock("int", "q", "a / 2"), ReturnBlock("c + q")])
+    values = np.array([-7, 0, 3, 5])
+    assert list(evaluate_batch(func, values)) == [evaluate(func, int(v)) for v in values]
+
+
+def test_batch_division_by_zero_raises():
+    np = pytest.importorskip("numpy")
+    with pytest.raises(EvaluationError):
+        evaluate_batch(function([ReturnBlock("10 / a")]), np.array([1, 0, 2]))
@@ -0,0 +1,91 @@
+from app import BlockWidget, block_text
+from benchmarks.fake_canvas import FakeCanvas
+from benchmarks.suite import headless_app
+from block_system import *
+from history import History, EditBlock, field_values, set_field_values
+
+
+def editor_with(functions):
+    _, editor = headless_app(FakeCanvas())
+    for i, (func, body) in enumerate(functions):
+        editor.register_widget(BlockWidget(editor.canvas, func, 0, 100 * i, block_text(func), editor))
+        for j, block in enumerate(body):
+            editor.register_widget(BlockWidget(editor.canvas, block, 200 * (j + 1), 100 * i, block_text(block), editor))
+        for source, target in zip([func, *body], body):
+            editor.connect_blocks(source, target)
+    # Building the project is not part of the history under test
+    editor.history.clear()
+    return editor
+
+
+def program(editor):
+    return [func.generate_code() for func in editor.get_functions()]
+
+
+def sample_editor():
+    return editor_with([
+        (Function("int", "first"), [VariableBlock("int", "x", "1"), ReturnBlock("x")]),
+        (Function("int", "second"), [ReturnBlock("2")]),
+        (Function("int", "third"), [ReturnBlock("3")]),
+    ])
+
+
+def test_undo_delete_restores_function_order_and_bodies():
+    editor = sample_editor()
+    before = program(editor)
+    second = editor.get_functions()[1]
+    editor.delete_blocks([second, *second.connections])
+    assert [func.name for func in editor.get_functions()] == ["first", "third"]
+    assert editor.history.undo(editor)
+    assert program(editor) == before
+    assert editor.history.redo(editor)
+    assert [func.name for func in editor.get_functions()] == ["first", "third"]
+    assert editor.history.undo(editor)
+    assert program(editor) == before
+
+
+def test_undo_delete_of_a_statement_relinks_the_body():
+    editor = sample_editor()
+    before = program(editor)
+    first = editor.get_functions()[0]
+    editor.delete_blocks([first.connections[0]])
+    assert first.generate_code() != before[0]
+    editor.history.undo(editor)
+    assert program(editor) == before
+
+
+def test_connect_and_edit_round_trip():
+    editor = sample_editor()
+    before = program(editor)
+    third = editor.get_functions()[2]
+    extra = AssignmentBlock("y", "4")
+    editor.register_widget(BlockWidget(editor.canvas, extra, 400, 200, block_text(extra), editor))
+    editor.connect_blocks(third.connections[0], extra)
+    ret = editor.get_functions()[1].connections[0]
+    old = field_values(ret)
+    set_field_values(ret, ("5",))
+    editor.history.record(EditBlock(ret, old, field_values(ret)))
+    after = program(editor)
+    assert after != before
+    while editor.history.can_undo():
+        editor.history.undo(editor)
+    assert program(editor) == before
+    while editor.history.can_redo():
+        editor.history.redo(editor)
+    assert program(editor) == after
+
+
+def test_can_undo_and_redo_follow_the_stacks():
+    history = History()
+    changes = []
+    history.on_change = lambda: changes.append((history.can_undo(), history.can_redo()))
+    history.record(EditBlock(ReturnBlock("1"), ("1",), ("2",)))
+
+    class Editor:
+        def refresh_block_text(self, block):
+            pass
+
+    history.undo(Editor())
+    history.redo(Editor())
+    history.clear()
+    assert changes == [(True, False), (False, True), (True, False), (False, False)]
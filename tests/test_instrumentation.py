@@ -0,0 +1,52 @@
+from instrumentation import Profiler
+
+
+class Widget:
+    def move(self, dx):
+        return dx * 2
+
+
+class Child(Widget):
+    pass
+
+
+def test_watched_methods_are_timed_only_while_enabled():
+    profiler = Profiler()
+    profiler.watch(Widget, "move")
+    original = Widget.__dict__["move"]
+    profiler.enable()
+    assert Widget.__dict__["move"] is not original
+    assert Widget().move(3) == 6
+    profiler.disable()
+    assert Widget.__dict__["move"] is original
+    Widget().move(3)
+    assert [(s.name, s.calls) for s in profiler.snapshot()] == [("Widget.move", 1)]
+
+
+def test_inherited_method_is_restored_to_the_base():
+    profiler = Profiler()
+    profiler.watch(Child, "move")
+    profiler.enable()
+    assert "move" in Child.__dict__
+    profiler.disable()
+    assert "move" not in Child.__dict__
+
+
+def test_recording_lasts_until_every_user_disables():
+    profiler = Profiler()
+    profiler.watch(Widget, "move")
+    original = Widget.__dict__["move"]
+    profiler.enable()
+    profiler.enable()
+    profiler.disable()
+    assert profiler.enabled
+    Widget().move(1)
+    profiler.disable()
+    assert not profiler.enabled
+    assert Widget.__dict__["move"] is original
+    # Extra disables do not drive the count below zero
+    profiler.disable()
+    profiler.enable()
+    assert profiler.enabled
+    profiler.disable()
+    assert profiler.snapshot()[0].calls == 1
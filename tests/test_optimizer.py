@@ -0,0 +1,94 @@
+from block_system import *
+from optimizer import optimize_function
+
+
+def function(blocks, type="int", params=None):
+    func = Function(type, "f", {"a": "int", "b": "int"} if params is None else params)
+    for block in blocks:
+        block.owner = func
+        func.connections.append(block)
+    return func
+
+
+def body(func, passes=None):
+    optimized = optimize_function(func) if passes is None else optimize_function(func, passes)
+    return [block.generate_code().strip() for block in optimized.connections]
+
+
+def test_unreachable_statements_are_dropped():
+    func = function([ReturnBlock("a"), AssignmentBlock("a", "1")])
+    assert body(func, ("unreachable",)) == ["return a;"]
+
+
+def test_constants_are_folded_and_propagated():
+    func = function([VariableBlock("int", "x", "2 * 3"), VariableBlock("int", "y", "x + 1"), ReturnBlock("y * a")])
+    assert body(func, ("fold",)) == ["int x = 6;", "int y = 7;", "return 7 * a;"]
+
+
+def test_division_by_zero_and_overflow_are_not_folded():
+    func = function([VariableBlock("int", "x", "1 / 0"), VariableBlock("int", "y", "2147483647 + 1"), ReturnBlock("x + y")])
+    assert body(func, ("fold",)) == ["int x = 1 / 0;", "int y = 2147483647 + 1;", "return x + y;"]
+
+
+def test_copies_are_propagated_until_the_source_changes():
+    func = function([VariableBlock("int", "x", "a"), VariableBlock("int", "y", "x + 1"), AssignmentBlock("a", "b"),
+                     ReturnBlock("x")])
+    assert body(func, ("copy",)) == ["int x = a;", "int y = a + 1;", "a = b;", "return x;"]
+
+
+def test_dead_stores_are_removed():
+    func = function([VariableBlock("int", "x", "a"), AssignmentBlock("x", "b"), VariableBlock("int", "unused", "1"),
+                     ReturnBlock("x")])
+    assert body(func, ("dead",)) == ["int x;", "x = b;", "return x;"]
+
+
+def test_common_subexpressions_are_hoisted():
+    func = function([VariableBlock("int", "x", "a * b + 1"), VariableBlock("int", "y", "a * b + 2"), ReturnBlock("x + y")])
+    assert body(func, ("cse",)) == ["auto _t0 = a * b;", "int x = _t0 + 1;", "int y = _t0 + 2;", "return x + y;"]
+
+
+def test_common_subexpressions_are_not_shared_across_a_store():
+    func = function([VariableBlock("int", "x", "a * b"), AssignmentBlock("a", "1"), VariableBlock("int", "y", "a * b"),
+                     ReturnBlock("x + y")])
+    assert body(func, ("cse",)) == ["int x = a * b;", "a = 1;", "int y = a * b;", "return x + y;"]
+
+
+def test_common_subexpressions_over_globals_are_not_shared_across_a_call():
+    func = function([VariableBlock("int", "x", "g + a"), VariableBlock("int", "t", "bump()"), VariableBlock("int", "y", "g + a"),
+                     ReturnBlock("x + y + t")])
+    assert body(func, ("cse",)) == ["int x = g + a;", "int t = bump();", "int y = g + a;", "return x + y + t;"]
+
+
+def test_common_subexpressions_over_locals_are_shared_across_a_call():
+    func = function([VariableBlock("int", "x", "a * b"), VariableBlock("int", "t", "bump()"), VariableBlock("int", "y", "a * b"),
+                     ReturnBlock("x + y + t")])
+    assert body(func, ("cse",)) == ["auto _t0 = a * b;", "int x = _t0;", "int t = bump();", "int y = _t0;", "return x + y + t;"]
+
+
+def test_writes_through_a_reference_are_kept():
+    func = function([VariableBlock("int", "x", "a"), VariableBlock("int&", "r", "x"), AssignmentBlock("r", "7"),
+                     ReturnBlock("x")])
+    assert body(func) == ["int x = a;", "int& r = x;", "r = 7;", "return x;"]
+
+
+def test_reference_parameters_are_not_dead():
+    func = function([AssignmentBlock("out", "a"), ReturnBlock("0")], params={"out": "int&", "a": "int"})
+    assert body(func) == ["out = a;", "return 0;"]
+
+
+def test_array_declarations_are_kept():
+    func = function([VariableBlock("int", "buf[4]"), AssignmentBlock("buf[0]", "a"), ReturnBlock("buf[0]")])
+    assert body(func) == ["int buf[4];", "buf[0] = a;", "return buf[0];"]
+
+
+def test_stores_through_a_pointer_invalidate_aliased_values():
+    func = function([VariableBlock("int", "x", "a"), VariableBlock("int*", "p", "&x"), VariableBlock("int", "y", "x + 1"),
+                     AssignmentBlock("*p", "3"), VariableBlock("int", "z", "x + 1"), ReturnBlock("y * z")])
+    assert body(func) == ["int x = a;", "int* p = &x;", "int y = x + 1;", "*p = 3;", "int z = x + 1;", "return y * z;"]
+
+
+def test_source_function_is_not_modified():
+    func = function([VariableBlock("int", "x", "2 + 3"), ReturnBlock("x")])
+    before = func.generate_code()
+    optimize_function(func)
+    assert func.generate_code() == before
@@ -0,0 +1,78 @@
+import io
+
+from benchmarks.fake_canvas import FakeCanvas
+from benchmarks.suite import headless_app
+from block_system import *
+from preview import program_snapshots, render_snapshot
+
+
+class Value:
+    # Stands in for the Tk variables of the toolbar
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def editor_with(functions, entry="main"):
+    app_module, editor = headless_app(FakeCanvas())
+    editor.entry_point = Value(entry)
+    editor.optimize_output = Value(False)
+    for i, (func, body) in enumerate(functions):
+        editor.register_widget(app_module.BlockWidget(editor.canvas, func, 0, 100 * i, app_module.block_text(func), editor))
+        for j, block in enumerate(body):
+            editor.register_widget(app_module.BlockWidget(editor.canvas, block, 200 * (j + 1), 100 * i, app_module.block_text(block), editor))
+        for source, target in zip([func, *body], body):
+            editor.connect_blocks(source, target)
+    return editor
+
+
+def preview_lines(editor):
+    # Code lines of the preview document; blank separators are the pane's own layout
+    snapshots = program_snapshots(*editor.output_program(), {})
+    return [line for snapshot in snapshots for line in (snapshot.rendered or render_snapshot(snapshot)).lines if line]
+
+
+def saved_lines(editor):
+    out = io.StringIO()
+    declarations, functions = editor.output_program()
+    emit_program(functions, out, declarations=declarations)
+    return [line for line in out.getvalue().splitlines() if line]
+
+
+def sample_functions():
+    return [
+        (Function("int", "unused"), [ReturnBlock("0")]),
+        (Function("int", "is_even", {"n": "int"}), [ReturnBlock("n == 0 ? 1 : is_odd(n - 1)")]),
+        (Function("int", "is_odd", {"n": "int"}), [ReturnBlock("n == 0 ? 0 : is_even(n - 1)")]),
+        (Function("int", "main"), [ReturnBlock("is_even(4)")]),
+    ]
+
+
+def test_preview_leaves_out_functions_the_entry_point_does_not_reach():
+    editor = editor_with(sample_functions())
+    lines = preview_lines(editor)
+    assert "int unused() {" not in lines
+    assert "int main() {" in lines
+
+
+def test_preview_matches_the_saved_program():
+    editor = editor_with(sample_functions())
+    # Mutually recursive functions are declared first, as in the saved file
+    assert preview_lines(editor)[:2] == ["int is_even(int n);", "int is_odd(int n);"]
+    assert preview_lines(editor) == saved_lines(editor)
+    editor.entry_point = Value("")
+    assert "int unused() {" in preview_lines(editor)
+    assert preview_lines(editor) == saved_lines(editor)
+
+
+def test_preview_shows_the_optimized_program():
+    editor = editor_with(sample_functions() + [(Function("int", "constant"), [VariableBlock("int", "x", "2 * 3"), ReturnBlock("x")])],
+                         entry="")
+    editor.optimize_output = Value(True)
+    lines = preview_lines(editor)
+    assert "return 6;" in lines
+    assert lines == saved_lines(editor)
+    # Unchanged functions keep their optimized copy, so the preview passes them by reference
+    assert editor.output_program()[1] == editor.output_program()[1]
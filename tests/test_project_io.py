@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+import project_io
+from block_system import *
+from project_mmap import MappedProject
+
+
+def sample_project():
+    func = Function("int", "main", {"argc": "int"})
+    for block in (VariableBlock("int", "x", "argc + 1"), ReturnBlock("x")):
+        func.connections.append(block)
+    loose = AssignmentBlock("y", "2")
+    return project_io.Project([func], [loose], {func: (10, 20), loose: (300, 40)})
+
+
+@pytest.mark.parametrize("name", ["project.cppb", "project.json"])
+def test_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    project_io.save_project(sample_project(), path)
+    loaded = project_io.load_project(path)
+    assert [func.generate_code() for func in loaded.functions] == [func.generate_code() for func in sample_project().functions]
+    assert [block.generate_code() for block in loaded.loose] == ["y = 2;\n"]
+
+
+@pytest.mark.parametrize("keep", [10, project_io.HEADER.size + 8, -12])
+def test_truncated_binary_is_a_value_error(tmp_path, keep):
+    path = tmp_path / "project.cppb"
+    project_io.save_project(sample_project(), str(path))
+    path.write_bytes(path.read_bytes()[:keep])
+    with pytest.raises(ValueError):
+        project_io.open_project(str(path)).load()
+    with pytest.raises(ValueError):
+        with MappedProject(str(path)) as mapped, open(tmp_path / "out.cpp", "w") as out:
+            mapped.emit(out)
+
+
+def test_unknown_json_kind_is_a_value_error(tmp_path):
+    path = tmp_path / "project.json"
+    project_io.save_project(sample_project(), str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["blocks"][1]["kind"] = "LoopBlock"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    with pytest.raises(ValueError):
+        project_io.load_project(str(path))
+
+
+def test_dangling_json_body_index_is_a_value_error(tmp_path):
+    path = tmp_path / "project.json"
+    project_io.save_project(sample_project(), str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["blocks"][0]["body"].append(99)
+    path.write_text(json.dumps(data), encoding="utf-8")
+    with pytest.raises(ValueError):
+        project_io.load_project(str(path))
+
+
+@pytest.mark.parametrize("index", [-1, 99])
+def test_json_body_index_out_of_range_is_a_value_error(tmp_path, index):
+    path = tmp_path / "project.json"
+    project_io.save_project(sample_project(), str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["blocks"][0]["body"] = [index]
+    path.write_text(json.dumps(data), encoding="utf-8")
+    with pytest.raises(ValueError):
+        project_io.load_project(str(path))
+
+
+def test_json_edge_index_out_of_range_is_a_value_error(tmp_path):
+    path = tmp_path / "project.json"
+    project = sample_project()
+    project.edges.append((project.loose[0], project.loose[0]))
+    project_io.save_project(project, str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["edges"][-1][0] = -1
+    path.write_text(json.dumps(data), encoding="utf-8")
+    with pytest.raises(ValueError):
+        project_io.load_project(str(path))
+
+
+def test_binary_edge_below_loose_records_is_a_value_error(tmp_path):
+    path = tmp_path / "project.cppb"
+    project = sample_project()
+    second = AssignmentBlock("z", "3")
+    project.loose.append(second)
+    project.positions[second] = (0, 0)
+    project.edges.append((project.loose[0], second))
+    project_io.save_project(project, str(path))
+    loaded = project_io.load_project(str(path))
+    assert [(s.generate_code(), t.generate_code()) for s, t in loaded.edges] == [("y = 2;\n", "z = 3;\n")]
+    # Point the edge at the function's return statement, which is not a loose record
+    with project_io.open_project(str(path)) as reader:
+        edges_offset, loose_start = reader.edges_offset, reader.loose_start
+    data = bytearray(path.read_bytes())
+    project_io.EDGE_RECORD.pack_into(data, edges_offset, loose_start - 1, loose_start + 1)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        project_io.load_project(str(path))